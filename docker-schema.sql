@@ -16,12 +16,17 @@ CREATE TABLE IF NOT EXISTS tbl_kunden (
     source_subject TEXT,
     source_from_email VARCHAR(255),
     raw_json JSON,
+    name_key VARCHAR(255) NULL,             -- normalisierter Name (name_match.py)
+    name_phonetic VARCHAR(255) NULL,        -- Kölner Phonetik des Namens
     geplante_stunden_pro_woche DECIMAL(5,2),
     betreuungsbeginn DATE,
     ist_aktiv TINYINT(1) DEFAULT 1,
     erstellt_am DATETIME DEFAULT CURRENT_TIMESTAMP,
     aktualisiert_am DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-    INDEX idx_plz (adresse_plz)
+    INDEX idx_plz (adresse_plz),
+    INDEX idx_name_key (name_key),
+    INDEX idx_name_phonetic (name_phonetic),
+    INDEX idx_kontakt_email (kontakt_email)
 );
 
 -- Tabelle für Alltagsbegleiter
@@ -146,6 +151,14 @@ CREATE TABLE IF NOT EXISTS tbl_onboarding_pending (
     raw_data JSON,
     status VARCHAR(50) DEFAULT 'PENDING',
     
+    -- Matching-Schlüssel (name_match.py)
+    name_key VARCHAR(255) NULL,
+    name_phonetic VARCHAR(255) NULL,
+    
+    -- Erinnerungen (pending_watcher.py)
+    reminder_count INT NOT NULL DEFAULT 0,
+    last_reminder_at DATETIME NULL,
+    
     -- Timestamps
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
     updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
@@ -153,7 +166,44 @@ CREATE TABLE IF NOT EXISTS tbl_onboarding_pending (
     
     INDEX idx_case_tag (case_tag),
     INDEX idx_status (status),
-    INDEX idx_sender (source_sender)
+    INDEX idx_sender (source_sender),
+    INDEX idx_status_created (status, created_at),
+    INDEX idx_status_updated (status, reminder_count, updated_at),
+    INDEX idx_status_last_reminder (status, last_reminder_at),
+    INDEX idx_status_name_key (status, name_key),
+    INDEX idx_status_name_phonetic (status, name_phonetic)
+);
+
+-- Ausgangs-Warteschlange für Antworten/Erinnerungen (smtp_outbox.py)
+CREATE TABLE IF NOT EXISTS tbl_email_outbox (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    dedupe_key VARCHAR(255) NULL,           -- z.B. reply:<RAW-Objekt>, verhindert Doppel-Einträge
+    to_addr VARCHAR(255) NOT NULL,
+    subject TEXT,
+    body MEDIUMTEXT,
+    kind VARCHAR(50) NOT NULL DEFAULT 'reply',  -- reply / reminder / expired
+    ref VARCHAR(512) NULL,                  -- Bezug für on_sent (RAW-Objektname)
+    status VARCHAR(20) NOT NULL DEFAULT 'QUEUED',  -- QUEUED / SENDING / SENT / FAILED
+    attempts INT NOT NULL DEFAULT 0,
+    next_attempt_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    locked_at DATETIME NULL,
+    last_error TEXT,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    sent_at DATETIME NULL,
+    
+    UNIQUE KEY uq_dedupe_key (dedupe_key),
+    INDEX idx_status_next (status, next_attempt_at)
+);
+
+-- Guardian-Zähler pro Ereignis/Absender/Minute (email_guardian.py)
+CREATE TABLE IF NOT EXISTS tbl_guardian_usage (
+    event VARCHAR(50) NOT NULL,             -- emails / quarantined / gemini_calls / smtp_sends
+    sender VARCHAR(255) NOT NULL DEFAULT '',  -- '' = Summe über alle Absender
+    minute INT NOT NULL,                    -- Unix-Zeit // 60
+    count INT NOT NULL DEFAULT 0,
+
+    PRIMARY KEY (event, sender, minute),
+    INDEX idx_event_minute (event, minute)
 );
 
 -- 🔐 Authentication System Tables
@@ -250,5 +300,5 @@ CREATE TABLE IF NOT EXISTS tbl_trusted_devices (
 INSERT IGNORE INTO tbl_begleiter (name_vollstaendig, kontakt_email, passwort_hash, rolle) VALUES 
 ('Test Begleiter', 'test@pear-app.de', '$2b$12$LQv3c1yqBWVHxkd0LHAkCOYz6TtxMQJqhN8/LewB.TGKNgTQBQQ3.', 'Begleiter');
 
-INSERT IGNORE INTO tbl_kunden (name_vollstaendig, adresse_strasse, adresse_hausnummer, adresse_plz, adresse_ort, kontakt_telefon, kontakt_email) VALUES 
-('Max Mustermann', 'Musterstraße', '123', '12345', 'Musterstadt', '+49 123 456789', 'max.mustermann@example.com');
\ No newline at end of file
+INSERT IGNORE INTO tbl_kunden (name_vollstaendig, adresse_strasse, adresse_hausnummer, adresse_plz, adresse_ort, kontakt_telefon, kontakt_email, name_key, name_phonetic) VALUES 
+('Max Mustermann', 'Musterstraße', '123', '12345', 'Musterstadt', '+49 123 456789', 'max.mustermann@example.com', 'max mustermann', '648 682766');
\ No newline at end of file
@@ -27,7 +27,7 @@ import base64
 from dotenv import load_dotenv
 import mysql.connector
 from mysql.connector import Error
-from email_guardian import EmailGuardian
+from email_guardian import get_guardian
 
 load_dotenv()
 
@@ -67,7 +67,7 @@ class User:
 
 class PEARAuthSystem:
     def __init__(self):
-        self.guardian = EmailGuardian()
+        self.guardian = get_guardian()
         
     def get_db_connection(self):
         """Get database connection"""
@@ -0,0 +1,106 @@
+"""
+bench_text_extract.py — PEARv2.2
+Micro-Benchmark für text_extract.clean_body (HTML → Text + Zitate/Signatur + Token-Budget).
+
+Aufruf:
+  python bench_text_extract.py [KORPUS_ORDNER] [--repeat 5] [--max-tokens 4000]
+
+KORPUS_ORDNER: *.html/*.htm (HTML-Body) und *.eml (HTML-Teil bzw. Text-Teil wird verwendet),
+z.B. exportierte Newsletter und Agentur-Mails. Ohne Ordner wird ein synthetischer
+Newsletter-Korpus (Tabellen-Layout, Inline-CSS, Tracking-Skripte, Zitat-Verlauf) erzeugt.
+"""
+
+import argparse
+import email
+import glob
+import os
+import random
+import statistics
+import time
+from email import policy
+from typing import List
+
+from text_extract import clean_body, estimate_tokens
+
+
+def load_corpus(folder: str) -> List[str]:
+    docs = []
+    for path in sorted(glob.glob(os.path.join(folder, "**", "*"), recursive=True)):
+        ext = os.path.splitext(path)[1].lower()
+        if ext in (".html", ".htm"):
+            with open(path, encoding="utf-8", errors="ignore") as f:
+                docs.append(f.read())
+        elif ext == ".eml":
+            with open(path, "rb") as f:
+                msg = email.message_from_binary_file(f, policy=policy.default)
+            part = msg.get_body(preferencelist=("html", "plain"))
+            if part is not None:
+                docs.append(part.get_content())
+    return docs
+
+
+def synthetic_corpus(count: int = 200, seed: int = 42) -> List[str]:
+    rnd = random.Random(seed)
+    words = ("Pflege Angebot Betreuung Termin Kundin Vermittlung Beratung Stadt Leistung Woche "
+             "Unterstützung Familie Alltag Qualität Service Aktion Rabatt Frühling").split()
+
+    def sentence() -> str:
+        return " ".join(rnd.choice(words) for _ in range(rnd.randint(8, 20))) + "."
+
+    docs = []
+    for n in range(count):
+        rows = "".join(
+            f'<tr><td style="padding:8px;font-family:Arial">{sentence()}</td>'
+            f'<td><a href="https://example.com/t/{n}/{i}">Mehr&nbsp;erfahren &raquo;</a></td></tr>'
+            for i in range(rnd.randint(20, 60))
+        )
+        docs.append(
+            "<!DOCTYPE html><html><head><style>td{color:#333} .x{margin:0}</style>"
+            "<script>window.track=function(){return '<p>';};</script></head><body>"
+            f"<div class=\"header\"><h1>Newsletter {n}</h1></div>"
+            f"<p>Hallo,</p><p>anbei die Daten:<br>Name: Hans Schmidt<br>Telefon: 089-123456</p>"
+            f"<table>{rows}</table>"
+            f"<div class=\"gmail_quote\">Am Montag schrieb PEAR:<blockquote>{sentence() * 30}</blockquote></div>"
+            "<p>-- <br>Agentur Beispiel GmbH</p></body></html>"
+        )
+    return docs
+
+
+def run(docs: List[str], repeat: int, max_tokens: int):
+    size_mb = sum(len(d.encode("utf-8")) for d in docs) / 1e6
+    tokens_in = sum(estimate_tokens(d) for d in docs)
+    per_doc: List[float] = []
+    out = []
+    started = time.perf_counter()
+    for _ in range(repeat):
+        out = []
+        for d in docs:
+            t0 = time.perf_counter()
+            out.append(clean_body(d, max_tokens))
+            per_doc.append(time.perf_counter() - t0)
+    total = time.perf_counter() - started
+    tokens_out = sum(estimate_tokens(t) for t in out)
+    per_doc.sort()
+
+    print(f"Korpus:      {len(docs)} Mails, {size_mb:.2f} MB, {repeat}x wiederholt")
+    print(f"Durchsatz:   {len(docs) * repeat / total:.0f} Mails/s, {size_mb * repeat / total:.1f} MB/s")
+    print(f"Pro Mail:    p50 {statistics.median(per_doc) * 1000:.2f} ms, "
+          f"p95 {per_doc[int(len(per_doc) * 0.95)] * 1000:.2f} ms, max {per_doc[-1] * 1000:.2f} ms")
+    print(f"Tokens:      {tokens_in} → {tokens_out} (≈ {100 - 100 * tokens_out / max(1, tokens_in):.0f}% weniger)")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark für text_extract.clean_body")
+    ap.add_argument("corpus", nargs="?", help="Ordner mit *.html/*.htm/*.eml")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--max-tokens", type=int, default=int(os.getenv("GEMINI_MAX_BODY_TOKENS", "4000")))
+    args = ap.parse_args()
+
+    docs = load_corpus(args.corpus) if args.corpus else synthetic_corpus()
+    if not docs:
+        raise SystemExit(f"Keine *.html/*.htm/*.eml in {args.corpus} gefunden.")
+    run(docs, max(1, args.repeat), args.max_tokens)
+
+
+if __name__ == "__main__":
+    main()
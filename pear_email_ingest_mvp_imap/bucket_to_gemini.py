@@ -8,30 +8,56 @@ RAW (E-Mails) → PENDING (Zwischenstände) → bei Vollständigkeit: DB + Best
 - Sucht zugehörigen Pending-Case (Betreff-Tag [PEAR-XXXXXXXX] → Fallback: Absender).
 - Merged Felder; wenn vollständig: DB speichern, Bestätigung senden, Pending löschen.
   Sonst: Pending aktualisieren und Rückfrage schicken.
-- Antwort-Marker unter responded/ verhindert Doppelversand.
+- Antworten laufen über die Outbox (smtp_outbox.py); der Marker unter responded/ wird erst nach
+  bestätigtem Versand geschrieben und verhindert Doppelversand; der Verarbeitungs-Index
+  (processed_index.py) merkt sich erledigte RAW-Dateien ohne exists()-Check pro Blob.
+- Push-Modus: process_raw_object() verarbeitet ein einzelnes RAW-Objekt direkt nach /ingest
+  bzw. GCS-Notification (main.py); main() bleibt als Catch-up-Sweep.
+- Metriken (metrics.py): GCS-Listing/Download, Gemini-Requests und Extraktion, Antworten, Ergebnisse
+  und Sweep-Stufen; am Ende jedes Batches als JSON ("INFO: Metriken: ..."), laufend über GET /metrics.
 
 ENV (Beispiele):
   PROJECT_ID, GCS_BUCKET
-  RAW_PREFIX=raw/, PENDING_PREFIX=pending/, RESPONDED_PREFIX=responded/, BATCH_SIZE=50
-  GEMINI_API_KEY, GEMINI_MODEL=gemini-1.5-pro
+  RAW_PREFIX=raw/, PENDING_PREFIX=pending/, RESPONDED_PREFIX=responded/, BATCH_SIZE=2000, SWEEP_CHUNK=50
+  PREFETCH_WORKERS=8, PREFETCH_DEPTH=64 (paralleles Vorausladen der RAW-JSONs, siehe prefetch.py)
+  PROCESSED_INDEX_OBJECT=state/processed_index.json, PROCESSED_MAX_ATTEMPTS=3, RAW_LIST_LOOKBACK_SECONDS=3600
+  GEMINI_API_KEY, GEMINI_MODEL=gemini-1.5-pro, GEMINI_CONCURRENCY=4, GEMINI_REQUEST_TIMEOUT=60
+  EXTRACTION_CACHE_SIZE=1000, EXTRACTION_CACHE_TTL_HOURS=720 (siehe extraction_cache.py)
   REQUIRED_FIELDS=name,first_name,last_name,email,phone,address,plz,city
   SMTP_HOST, SMTP_PORT=587, SMTP_USER, SMTP_PASSWORD, SMTP_FROM="PEAR Ingest" <postboy@pear-app.de>, SMTP_USE_SSL=false
+  OUTBOX_* (Versand über tbl_email_outbox, siehe smtp_outbox.py)
   DB_HOST, DB_PORT=3306, DB_USER, DB_PASSWORD, DB_NAME
+  DB_POOL_SIZE=5, DB_POOL_TIMEOUT=10, DB_POOL_PING_AFTER=30 (siehe db_pool.py)
+  METRICS_ENABLED=true (siehe metrics.py)
 """
 
-import os, json, re, uuid, smtplib, base64
-from datetime import datetime, timedelta
-from typing import List, Dict, Any, Optional
-from email.mime.text import MIMEText
-from email.utils import formataddr
+import os, json, re, uuid, threading, statistics, time, weakref
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field, asdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import List, Dict, Any, Optional, Tuple
 from email.header import decode_header, make_header
 from email import policy
 from email.parser import BytesParser
 from dotenv import load_dotenv
 from google.cloud import storage
 import google.generativeai as genai
-import mysql.connector
 from mysql.connector import Error
+import db_pool
+import metrics
+import smtp_outbox
+from extraction_cache import ExtractionCache, prompt_version
+from local_extractor import LocalExtraction, extract_local
+from text_extract import body_to_text, clean_body, html_to_text, maybe_b64_decode
+from reply_parser import split_reply
+from processed_index import ProcessedIndex, blob_created_ts
+from email_guardian import MAX_DAILY_GEMINI_CALLS, get_usage, record_gemini_call
+from gemini_limiter import GeminiLimiter, GeminiUnavailable
+from name_match import best_match, match_keys, review_candidates
+from unit_of_work import UnitOfWork
+from prefetch import PrefetchReader
 
 # ---------------- ENV-Setup ----------------
 # Immer die .env im Hauptprojekt-Ordner laden, egal von wo das Script gestartet wird
@@ -46,17 +72,32 @@ GCS_BUCKET      = os.getenv("GCS_BUCKET", "pear-email-inbox-raw-pearv2")
 RAW_PREFIX      = os.getenv("RAW_PREFIX", "raw/")
 PENDING_PREFIX  = os.getenv("PENDING_PREFIX", "pending/")
 RESP_PREFIX     = os.getenv("RESPONDED_PREFIX", "responded/")
-BATCH_SIZE      = int(os.getenv("BATCH_SIZE", "50"))
+BATCH_SIZE      = int(os.getenv("BATCH_SIZE", "2000"))  # max. RAW-Dateien pro Sweep
+# Der Sweep arbeitet in Abschnitten: Extraktion/Matching/DB je SWEEP_CHUNK Dateien, während die nächsten geladen werden
+SWEEP_CHUNK     = int(os.getenv("SWEEP_CHUNK", "50"))  # = E-Mails pro DB-Transaktion (unit_of_work.py)
+PROCESSED_INDEX_OBJECT = os.getenv("PROCESSED_INDEX_OBJECT", "state/processed_index.json")
+PROCESSED_MAX_ATTEMPTS = int(os.getenv("PROCESSED_MAX_ATTEMPTS", "3"))
+PROCESSED_INDEX_SAFETY_SECONDS = int(os.getenv("PROCESSED_INDEX_SAFETY_SECONDS", "60"))
+# Das RAW-Listing beginnt bei der Partition (UTC-Stunde) der High-Water-Mark minus diesem Vorlauf
+RAW_LIST_LOOKBACK_SECONDS = int(os.getenv("RAW_LIST_LOOKBACK_SECONDS", "3600"))
 
 GEMINI_API_KEY  = os.getenv("GEMINI_API_KEY")
 GEMINI_MODEL    = os.getenv("GEMINI_MODEL", "gemini-1.5-pro")
+GEMINI_CONCURRENCY = int(os.getenv("GEMINI_CONCURRENCY", "4"))
+GEMINI_REQUEST_TIMEOUT = float(os.getenv("GEMINI_REQUEST_TIMEOUT", "60"))  # Sekunden pro Request (ohne Retries)
+# Batch-Extraktion: bis zu GEMINI_BATCH_SIZE kurze Bodies pro Request (1 = aus),
+# zusammen max. GEMINI_BATCH_MAX_CHARS; längere Bodies als GEMINI_BATCH_ITEM_MAX_CHARS gehen einzeln
+GEMINI_BATCH_SIZE           = int(os.getenv("GEMINI_BATCH_SIZE", "8"))
+GEMINI_BATCH_MAX_CHARS      = int(os.getenv("GEMINI_BATCH_MAX_CHARS", "24000"))
+GEMINI_BATCH_ITEM_MAX_CHARS = int(os.getenv("GEMINI_BATCH_ITEM_MAX_CHARS", "4000"))
+# Body-Aufbereitung vor der Extraktion: HTML → Text, Zitate/Signatur weg, max. Tokens (≈ 4 Zeichen/Token)
+GEMINI_MAX_BODY_TOKENS     = int(os.getenv("GEMINI_MAX_BODY_TOKENS", "4000"))
+# Lokale Regex-Vor-Extraktion: Gemini nur, wenn danach Pflichtfelder fehlen/unsicher sind
+LOCAL_EXTRACTION           = os.getenv("LOCAL_EXTRACTION", "true").lower() == "true"
+LOCAL_MIN_CONFIDENCE       = float(os.getenv("LOCAL_MIN_CONFIDENCE", "0.9"))
+EXTRACTION_CACHE_SIZE      = int(os.getenv("EXTRACTION_CACHE_SIZE", "1000"))
+EXTRACTION_CACHE_TTL_HOURS = int(os.getenv("EXTRACTION_CACHE_TTL_HOURS", "720"))
 
-SMTP_HOST       = os.getenv("SMTP_HOST")
-SMTP_PORT       = int(os.getenv("SMTP_PORT", "587"))
-SMTP_USER       = os.getenv("SMTP_USER")
-SMTP_PASSWORD   = os.getenv("SMTP_PASSWORD")
-SMTP_FROM       = os.getenv("SMTP_FROM", "PEAR Ingest <noreply@pear-app.de>")
-SMTP_USE_SSL    = os.getenv("SMTP_USE_SSL", "false").lower() == "true"
 
 # DB-Variablen zentral laden
 DB_HOST         = os.getenv("DB_HOST")
@@ -70,38 +111,48 @@ REQ_FIELDS = [f.strip() for f in (os.getenv("REQUIRED_FIELDS") or
 
 CASE_TAG_RE = re.compile(r"PEAR-([0-9a-fA-F]{8})")
 
+# ---------------- Metriken ----------------
+GCS_LIST_SECONDS = metrics.histogram("pear_gcs_list_seconds", "Dauer des RAW-Listings (list_candidates)")
+GCS_DOWNLOAD_SECONDS = metrics.histogram("pear_gcs_download_seconds", "Dauer eines RAW-Downloads inkl. JSON-Parse")
+GCS_DOWNLOADS = metrics.counter("pear_gcs_downloads_total", "RAW-Downloads je Ergebnis", ("result",))
+GEMINI_REQUEST_SECONDS = metrics.histogram("pear_gemini_request_seconds", "Dauer eines Gemini-Requests inkl. Retries", ("mode",))
+GEMINI_REQUESTS = metrics.counter("pear_gemini_requests_total", "Gemini-Requests je Ergebnis", ("mode", "result"))
+EXTRACT_SECONDS = metrics.histogram("pear_extract_seconds", "Dauer von call_gemini/call_gemini_batch inkl. Cache", ("mode",))
+EXTRACTIONS = metrics.counter("pear_extractions_total", "Extrahierte E-Mails je Quelle", ("source",))
+REPLIES = metrics.counter("pear_replies_total", "Antworten aus send_email je Ergebnis", ("result",))
+EMAILS_PROCESSED = metrics.counter("pear_emails_processed_total", "Verarbeitete E-Mails je Aktion", ("action",))
+NAME_REVIEWS = metrics.counter("pear_name_review_total", "Ähnliche Namen ohne exakten Schlüssel (nicht zugeordnet)", ("target",))
+SWEEP_STAGE_SECONDS = metrics.histogram("pear_sweep_stage_seconds", "Summierte Zeit je Sweep-Stufe und Batch", ("stage",),
+                                        buckets=(0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0))
+
 if not GEMINI_API_KEY:
     raise RuntimeError("GEMINI_API_KEY fehlt – ohne API-Key keine Extraktion möglich.")
 
 # ---------------- DB-Check -----------------
-def test_db_connection():
+def test_db_connection() -> bool:
     """Testet, ob eine Verbindung zur MySQL-Datenbank möglich ist."""
     if not all([DB_HOST, DB_USER, DB_PASSWORD, DB_NAME]):
         print("INFO: DB-Variablen nicht vollständig in .env gesetzt. Überspringe DB-Operationen.")
-        return
+        return True
     try:
-        conn = mysql.connector.connect(
-            host=DB_HOST,
-            port=DB_PORT,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            database=DB_NAME
-        )
-        cursor = conn.cursor()
-        cursor.execute("SELECT 1;")
-        result = cursor.fetchone()
-        print(f"INFO: [DB-Check] Verbindung erfolgreich: {result}")
-        cursor.close()
-        conn.close()
+        with db_pool.connection("db_check") as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1;")
+            result = cursor.fetchone()
+            print(f"INFO: [DB-Check] Verbindung erfolgreich: {result}")
+            cursor.close()
+        return True
     except Error as e:
         print(f"ERROR: [DB-Check] Fehler: {e}")
-        exit(1)
+        return False
 
 # ---------------- Gemini Setup ----------------
 genai.configure(api_key=GEMINI_API_KEY)
 model = genai.GenerativeModel(GEMINI_MODEL)
+# Rate-Limit/Retry/Circuit Breaker für alle Requests; jeder echte Request zählt beim Guardian
+GEMINI_LIMITER = GeminiLimiter.from_env(on_call=record_gemini_call)
 
-BASE_INSTR = (
+EXTRACTION_RULES = (
     "Du bist ein Experte für die Extraktion deutscher Kundendaten aus E-Mails von Pflegevermittlungen.\n"
     "Extrahiere ALLE verfügbaren Informationen aus dem E-Mail-Text und strukturiere sie.\n\n"
     
@@ -134,11 +185,29 @@ BASE_INSTR = (
     "- Fehlende Felder: null setzen und in 'missing' Array auflisten\n"
     "- confidence: 1.0 nur wenn missing-Array leer, sonst 0.8-0.95\n"
     "- Bei Tabellenformat: Spalten korrekt zuordnen\n\n"
-    
+)
+
+BASE_INSTR = (
+    EXTRACTION_RULES +
     "ANALYSE FOLGENDEN E-MAIL-TEXT:\n{email_body}\n\n"
     "JSON-AUSGABE:"
 )
 
+# Gleiche Regeln/Beispiele, aber nur einmal pro Request für mehrere E-Mails
+BATCH_INSTR = (
+    EXTRACTION_RULES +
+    "MEHRERE E-MAILS: Es folgen {count} voneinander unabhängige E-Mails, jeweils eingeleitet mit '### EMAIL <id>'.\n"
+    "Extrahiere jede E-Mail für sich (keine Daten zwischen E-Mails übertragen).\n"
+    "AUSGABE: Nur ein JSON-Array mit genau einem Objekt pro E-Mail; jedes Objekt enthält zusätzlich \"id\" (wie angegeben).\n\n"
+    "{emails}\n\n"
+    "JSON-ARRAY-AUSGABE:"
+)
+
+# Einzel- und Batch-Extraktion schreiben in denselben Cache: beide Templates und das Modell gehören zur Version
+PROMPT_VERSION = prompt_version(GEMINI_MODEL, BASE_INSTR, BATCH_INSTR)
+EXTRACTION_CACHE = ExtractionCache(GEMINI_MODEL, PROMPT_VERSION,
+                                   size=EXTRACTION_CACHE_SIZE, ttl_hours=EXTRACTION_CACHE_TTL_HOURS)
+
 # ---------------- Helper-Funktionen ----------------
 def _now() -> str:
     return datetime.utcnow().isoformat(timespec="seconds") + "Z"
@@ -151,28 +220,21 @@ def decode_mime_subject(subject: Optional[str]) -> str:
     except Exception:
         return subject
 
-def _html_to_text(html: str) -> str:
-    if not html:
-        return ""
-    text = re.sub(r"(?is)<(script|style).*?>.*?</\\1>", "", html)
-    text = re.sub(r"(?is)<br\\s*/?>", "\n", text)
-    text = re.sub(r"(?is)</p\\s*?>", "\n\n", text)
-    text = re.sub(r"(?is)<.*?>", "", text)
-    return re.sub(r"[ \t]+", " ", text).strip()
-
-def _maybe_b64_decode(s: str) -> bytes:
-    if not s:
-        return b""
-    s_stripped = s.strip()
-    if re.fullmatch(r"[A-Za-z0-9+/=\\r\\n]+", s_stripped) and len(s_stripped) % 4 == 0:
-        try:
-            return base64.b64decode(s_stripped, validate=True)
-        except Exception:
-            pass
-    return s.encode("utf-8", errors="ignore")
+def extraction_text(subject: str, body: str) -> Tuple[str, int]:
+    """
+    Der Teil des Bodys, der tatsächlich extrahiert wird (lokal + Gemini), und die gesparten Tokens.
+    Bei Antworten auf eine Rückfrage (Case-Tag) nur der neue Teil ohne zitierten Verlauf; alle anderen
+    Mails behalten Zitate – weitergeleitete Kundendaten stehen dort.
+    """
+    if find_case_id_in_subject_or_body(subject, body):
+        split = split_reply(body_to_text(body))
+        if split.marker:
+            return clean_body(split.new_text, GEMINI_MAX_BODY_TOKENS, strip_quoted=True), split.tokens_saved
+        return clean_body(body, GEMINI_MAX_BODY_TOKENS, strip_quoted=True), 0
+    return clean_body(body, GEMINI_MAX_BODY_TOKENS), 0
 
 def _extract_from_mime(raw_mime: str) -> tuple[str, str, str]:
-    msg_bytes = _maybe_b64_decode(raw_mime)
+    msg_bytes = maybe_b64_decode(raw_mime)
     try:
         msg = BytesParser(policy=policy.default).parsebytes(msg_bytes)
     except Exception:
@@ -194,7 +256,7 @@ def _extract_from_mime(raw_mime: str) -> tuple[str, str, str]:
                 ctype = part.get_content_type() or ""
                 if ctype.lower() == "text/html":
                     try:
-                        body_text = _html_to_text(part.get_content())
+                        body_text = html_to_text(part.get_content())
                         break
                     except Exception:
                         continue
@@ -207,13 +269,15 @@ def _extract_from_mime(raw_mime: str) -> tuple[str, str, str]:
         if ctype.lower() == "text/plain":
             body_text = (content or "").strip()
         elif ctype.lower() == "text/html":
-            body_text = _html_to_text(content or "")
+            body_text = html_to_text(content or "")
     return subj or "", frm or "", body_text or ""
 
 def parse_raw_fields(raw: dict) -> tuple[str, str, str]:
     subject = decode_mime_subject(raw.get("subject") or "")
     from_email = (raw.get("from_email") or raw.get("from") or "").strip()
     body = (raw.get("body") or "").strip()
+    if not body and raw.get("body_html"):
+        body = html_to_text(raw["body_html"]).strip()
     headers = raw.get("headers") or {}
     if not subject:
         h_subj = headers.get("Subject") or headers.get("subject")
@@ -237,22 +301,65 @@ def parse_raw_fields(raw: dict) -> tuple[str, str, str]:
 def _strip_code_fences(text: str) -> str:
     t = (text or "").strip()
     if t.startswith("```"):
-        first = t.find("{")
-        last = t.rfind("}")
+        first = min((p for p in (t.find("{"), t.find("[")) if p != -1), default=-1)
+        last = max(t.rfind("}"), t.rfind("]"))
         if first != -1 and last != -1:
             t = t[first:last+1]
     return t.strip()
 
-def call_gemini(email_body: str) -> Dict[str, Any]:
+class ExtractionDeferred(Exception):
+    """Extraktion in diesem Lauf nicht möglich (Tagesbudget erschöpft, Gemini-API gestört) – Datei bleibt offen."""
+
+def _empty_extraction() -> Dict[str, Any]:
+    base = {k: None for k in REQ_FIELDS}
+    base["missing"] = REQ_FIELDS[:]
+    base["confidence"] = 0.0
+    return base
+
+def _finalize_extraction(data: Dict[str, Any]) -> Dict[str, Any]:
+    missing = data.get("missing") or [f for f in REQ_FIELDS if not str(data.get(f) or "").strip()]
+    data["missing"] = missing
+    data["confidence"] = 1.0 if not missing else min(float(data.get("confidence") or 0.9), 0.95)
+    return data
+
+@metrics.timed(EXTRACT_SECONDS, mode="single")
+def call_gemini(email_body: str, budget: Optional["GeminiBudget"] = None) -> Dict[str, Any]:
     if not (email_body or "").strip():
-        base = {k: None for k in REQ_FIELDS}
-        base["missing"] = REQ_FIELDS[:]
-        base["confidence"] = 0.0
-        return base
+        return _empty_extraction()
+
+    cached = EXTRACTION_CACHE.get(email_body)
+    if cached is not None:
+        return cached
+    return _extract_single(email_body, budget)
+
+def _gemini_request(mode: str, prompt: str):
+    """Ein Request über den Limiter; Dauer und Ergebnis landen in den Metriken."""
+    try:
+        with GEMINI_REQUEST_SECONDS.time(mode=mode):
+            resp = GEMINI_LIMITER.call(model.generate_content, prompt,
+                                       generation_config={"response_mime_type": "application/json"},
+                                       request_options={"timeout": GEMINI_REQUEST_TIMEOUT})
+    except GeminiUnavailable:
+        GEMINI_REQUESTS.inc(mode=mode, result="unavailable")
+        raise
+    except Exception:
+        GEMINI_REQUESTS.inc(mode=mode, result="error")
+        raise
+    GEMINI_REQUESTS.inc(mode=mode, result="ok")
+    return resp
+
+def _check_breaker():
+    if GEMINI_LIMITER.is_open():
+        raise ExtractionDeferred("Gemini-API gestört (Circuit Breaker offen)")
+
+def _extract_single(email_body: str, budget: Optional["GeminiBudget"] = None) -> Dict[str, Any]:
+    _check_breaker()
+    if budget is not None and not budget.try_acquire():
+        raise ExtractionDeferred("Gemini-Tagesbudget erschöpft")
     
     try:
         prompt = BASE_INSTR.format(email_body=email_body.strip())
-        resp = model.generate_content(prompt, generation_config={"response_mime_type": "application/json"})
+        resp = _gemini_request("single", prompt)
         raw = _strip_code_fences(getattr(resp, "text", "") or "")
         
         if not raw.strip():
@@ -262,48 +369,177 @@ def call_gemini(email_body: str) -> Dict[str, Any]:
         if not isinstance(data, dict):
             raise ValueError("Gemini response is not a dictionary")
             
+    except GeminiUnavailable as e:
+        # Kein "alles fehlt"-Ergebnis (das würde eine Rückfrage an den Kunden auslösen) – später erneut
+        raise ExtractionDeferred(str(e)) from e
     except Exception as e:
         print(f"ERROR: Gemini API Fehler: {e}")
-        data = {k: None for k in REQ_FIELDS}
-        data["missing"] = REQ_FIELDS[:]
-        data["confidence"] = 0.0
-        return data
+        return _empty_extraction()
     
-    missing = data.get("missing") or [f for f in REQ_FIELDS if not (data.get(f) or "").strip()]
-    data["missing"] = missing
-    data["confidence"] = 1.0 if not missing else min(float(data.get("confidence") or 0.9), 0.95)
+    data = _finalize_extraction(data)
+    # Nur erfolgreiche Extraktionen cachen – Fehler sollen beim nächsten Mal neu versucht werden
+    EXTRACTION_CACHE.put(email_body, data)
     return data
 
-def send_email(to_addr: Optional[str], subject: str, body: str) -> bool:
-    if not (SMTP_HOST and SMTP_USER and SMTP_PASSWORD and SMTP_FROM and to_addr):
-        print("INFO: SMTP nicht konfiguriert oder Empfänger fehlt – Versand übersprungen.")
-        return False
-    msg = MIMEText(body, _charset="utf-8")
-    msg["From"] = SMTP_FROM if "<" in SMTP_FROM else formataddr(("PEAR Ingest", SMTP_FROM))
-    msg["To"] = to_addr
-    msg["Subject"] = subject
+def plan_extraction_batches(bodies: List[str]) -> List[List[int]]:
+    """Packt kurze Bodies der Reihe nach zu Batches (Indizes); lange Bodies bleiben einzeln."""
+    batches: List[List[int]] = []
+    current: List[int] = []
+    chars = 0
+    for i, body in enumerate(bodies):
+        size = len((body or "").strip())
+        if GEMINI_BATCH_SIZE <= 1 or size > GEMINI_BATCH_ITEM_MAX_CHARS:
+            batches.append([i])
+            continue
+        if current and (len(current) >= GEMINI_BATCH_SIZE or chars + size > GEMINI_BATCH_MAX_CHARS):
+            batches.append(current)
+            current, chars = [], 0
+        current.append(i)
+        chars += size
+    if current:
+        batches.append(current)
+    return batches
+
+def _request_batch(bodies: List[str]) -> Dict[int, Dict[str, Any]]:
+    """Ein Gemini-Request für mehrere Bodies; liefert nur gültige Items (Position → Daten)."""
+    emails = "\n\n".join(f"### EMAIL {n}\n{body.strip()}" for n, body in enumerate(bodies, start=1))
     try:
-        if SMTP_USE_SSL:
-            with smtplib.SMTP_SSL(SMTP_HOST, SMTP_PORT) as s:
-                s.login(SMTP_USER, SMTP_PASSWORD)
-                s.send_message(msg)
+        prompt = BATCH_INSTR.format(count=len(bodies), emails=emails)
+        resp = _gemini_request("batch", prompt)
+        items = json.loads(_strip_code_fences(getattr(resp, "text", "") or "") or "[]")
+    except GeminiUnavailable:
+        raise
+    except Exception as e:
+        print(f"ERROR: Gemini Batch-Fehler ({len(bodies)} E-Mails): {e}")
+        return {}
+    if isinstance(items, dict):
+        items = items.get("items") or items.get("results") or [items]
+
+    out: Dict[int, Dict[str, Any]] = {}
+    for item in items if isinstance(items, list) else []:
+        if not isinstance(item, dict) or not any(k in item for k in REQ_FIELDS + ["missing"]):
+            continue
+        try:
+            pos = int(str(item.pop("id", "")).strip()) - 1
+        except ValueError:
+            continue
+        if 0 <= pos < len(bodies) and pos not in out:
+            out[pos] = item
+    return out
+
+@metrics.timed(EXTRACT_SECONDS, mode="batch")
+def call_gemini_batch(bodies: List[str], budget: Optional["GeminiBudget"] = None) -> List[Any]:
+    """
+    Extrahiert mehrere Bodies mit einem Request (ein Budget-Call pro Batch).
+    Fehlende/ungültige Items werden einzeln nachgeholt.
+    Liefert pro Body ein Dict oder eine ExtractionDeferred-Instanz.
+    """
+    results: List[Any] = [None] * len(bodies)
+    open_ids = []
+    for i, body in enumerate(bodies):
+        if not (body or "").strip():
+            results[i] = _empty_extraction()
+            continue
+        cached = EXTRACTION_CACHE.get(body)
+        if cached is not None:
+            results[i] = cached
         else:
-            with smtplib.SMTP(SMTP_HOST, SMTP_PORT) as s:
-                s.ehlo()
-                s.starttls()
-                s.login(SMTP_USER, SMTP_PASSWORD)
-                s.send_message(msg)
+            open_ids.append(i)
+
+    if len(open_ids) > 1:
+        if GEMINI_LIMITER.is_open():
+            deferred = ExtractionDeferred("Gemini-API gestört (Circuit Breaker offen)")
+            return [r if r is not None else deferred for r in results]
+        if budget is not None and not budget.try_acquire():
+            deferred = ExtractionDeferred("Gemini-Tagesbudget erschöpft")
+            return [r if r is not None else deferred for r in results]
+        started = time.monotonic()
+        try:
+            parsed = _request_batch([bodies[i] for i in open_ids])
+        except GeminiUnavailable as e:
+            deferred = ExtractionDeferred(str(e))
+            return [r if r is not None else deferred for r in results]
+        for pos, i in enumerate(open_ids):
+            if pos in parsed:
+                results[i] = _finalize_extraction(parsed[pos])
+                EXTRACTION_CACHE.put(bodies[i], results[i])
+        missing = sum(1 for i in open_ids if results[i] is None)
+        print(f"INFO: Gemini-Batch: {len(open_ids) - missing}/{len(open_ids)} E-Mails in einem Request "
+              f"({time.monotonic() - started:.1f}s)" + (f", {missing} einzeln nachgeholt" if missing else ""))
+
+    for i in open_ids:
+        if results[i] is None:
+            try:
+                results[i] = _extract_single(bodies[i], budget)
+            except ExtractionDeferred as e:
+                results[i] = e
+    return results
+
+def pre_extract(email_body: str) -> Optional[LocalExtraction]:
+    return extract_local(email_body, REQ_FIELDS) if LOCAL_EXTRACTION else None
+
+def is_locally_complete(local: Optional[LocalExtraction]) -> bool:
+    return local is not None and local.is_sufficient(REQ_FIELDS, LOCAL_MIN_CONFIDENCE)
+
+def combine_extraction(local: Optional[LocalExtraction], llm: Optional[Dict[str, Any]]) -> Tuple[Dict[str, Any], str]:
+    """Liefert (Daten, Quelle): local, llm oder mixed (Gemini-Lücken mit sicheren lokalen Werten gefüllt)."""
+    if llm is None:
+        return local.as_extraction(REQ_FIELDS), "local"
+    if local is None:
+        return llm, "llm"
+    filled = 0
+    for f, value in local.confident(REQ_FIELDS, LOCAL_MIN_CONFIDENCE).items():
+        if not str(llm.get(f) or "").strip():
+            llm[f] = value
+            filled += 1
+    if not filled:
+        return llm, "llm"
+    llm["missing"] = [f for f in REQ_FIELDS if not str(llm.get(f) or "").strip()]
+    return _finalize_extraction(llm), "mixed"
+
+class GeminiBudget:
+    """Thread-sicherer Zähler für das restliche Tagesbudget an Gemini-Calls."""
+    def __init__(self, remaining: int):
+        self._remaining = max(0, remaining)
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            if self._remaining <= 0:
+                return False
+            self._remaining -= 1
+            return True
+
+def gemini_budget_remaining() -> int:
+    """Verbleibende Gemini-Calls für heute laut Guardian-Zählern (MAX_DAILY_GEMINI_CALLS)."""
+    return max(0, MAX_DAILY_GEMINI_CALLS - get_usage().totals("gemini_calls")["day"])
+
+def send_email(to_addr: Optional[str], subject: str, body: str, raw_name: Optional[str] = None,
+               uow: Optional[UnitOfWork] = None) -> bool:
+    """Antwort in die Outbox einreihen (eine pro RAW-Datei); responded/-Marker erst nach bestätigtem Versand.
+
+    Mit uow landet die Outbox-Zeile in derselben Transaktion wie die DB-Änderungen der E-Mail.
+    """
+    dedupe_key = f"reply:{raw_name}" if raw_name else None
+    if uow is not None and smtp_outbox.outbox_enabled():
+        if not (smtp_outbox.smtp_configured() and to_addr):
+            print("INFO: SMTP nicht konfiguriert oder Empfänger fehlt – Versand übersprungen.")
+            REPLIES.inc(result="skipped")
+            return False
+        uow.add("outbox_insert", smtp_outbox.insert_params(to_addr, subject, body, kind="reply", ref=raw_name,
+                                                           dedupe_key=dedupe_key))
+        REPLIES.inc(result="batched")
         return True
-    except Exception as e:
-        print(f"ERROR: SMTP-Fehler: {e}")
-        return False
+    sent = smtp_outbox.enqueue(to_addr, subject, body, kind="reply", ref=raw_name, dedupe_key=dedupe_key)
+    REPLIES.inc(result="queued" if sent else "skipped")
+    return sent
 
-def compose_duplicate_reply(subject: str, customer_id: int, customer_name: str) -> tuple[str, str]:
+def compose_duplicate_reply(subject: str, customer_id: Optional[int], customer_name: str) -> tuple[str, str]:
     """Erstellt Antwort-E-Mail bei bereits existierendem Kunden"""
     sub = f"Bestätigung: Kunde bereits erfasst – {subject or ''}".strip()
     body = (f"Guten Tag,\\n\\nvielen Dank für Ihre Nachricht. "
-            f"Wir haben in unserer Datenbank überprüft: {customer_name} ist bereits als Kunde erfasst "
-            f"(Kunden-Nr. {customer_id}).\\n\\n"
+            f"Wir haben in unserer Datenbank überprüft: {customer_name} ist bereits als Kunde erfasst"
+            + (f" (Kunden-Nr. {customer_id})" if customer_id else "") + ".\\n\\n"
             f"Falls Sie Änderungen an den Kundendaten vornehmen möchten, wenden Sie sich bitte direkt an uns.\\n\\n"
             f"Freundliche Grüße\\nIhr PEAR-Team")
     return sub, body
@@ -324,61 +560,141 @@ def compose_reply(subject: str, missing: List[str]) -> tuple[str, str]:
 def is_complete(data: dict, required_fields: List[str]) -> bool:
     return all((data.get(f) is not None and str(data.get(f)).strip() != "") for f in required_fields)
 
-def list_candidates(client: storage.Client) -> List[str]:
-    out = []
-    bucket = client.bucket(GCS_BUCKET)
-    for b in client.list_blobs(GCS_BUCKET, prefix=RAW_PREFIX):
-        if not b.name.endswith(".json"):
-            continue
-        marker = RESP_PREFIX + b.name.split("/")[-1].replace(".json", ".sent")
-        if bucket.blob(marker).exists():
-            continue
-        out.append(b.name)
-        if len(out) >= BATCH_SIZE:
-            break
-    return out
+def list_candidates(client: storage.Client, index: ProcessedIndex) -> List[Tuple[str, float]]:
+    """Offene RAW-Dateien als (name, time_created), älteste zuerst – ohne GCS-Call pro Datei.
+
+    Gelistet werden nur die Zeit-Partitionen ab der High-Water-Mark (start_offset) plus die alten,
+    unpartitionierten Objekte direkt unter RAW_PREFIX (delimiter – ihre Zahl wächst nicht mehr).
+    """
+    offset = index.list_offset(RAW_LIST_LOOKBACK_SECONDS)
+    listings = [client.list_blobs(GCS_BUCKET, prefix=RAW_PREFIX)] if offset is None else [
+        client.list_blobs(GCS_BUCKET, prefix=RAW_PREFIX, start_offset=offset),
+        client.list_blobs(GCS_BUCKET, prefix=RAW_PREFIX, delimiter="/"),
+    ]
+    found: Dict[str, float] = {}
+    with GCS_LIST_SECONDS.time():
+        for blobs in listings:
+            for b in blobs:
+                if not b.name.endswith(".json"):
+                    continue
+                ts = blob_created_ts(b)
+                if index.high_water is not None and ts <= index.high_water:
+                    continue
+                found[b.name] = ts
+    listing = list(found.items())
+    index.advance(listing)
+    # Chronologisch, damit mehrere Antworten zum selben Case in Eingangsreihenfolge gemerged werden
+    return index.pending(listing)[:BATCH_SIZE]
+
+def load_raw_email(bucket: storage.Bucket, raw_name: str) -> Optional[dict]:
+    """Lädt ein RAW-JSON – None bei Lade-/Parse-Fehler."""
+    try:
+        with GCS_DOWNLOAD_SECONDS.time():
+            raw_text = bucket.blob(raw_name).download_as_text()
+            raw = json.loads(raw_text)
+    except Exception as e:
+        print(f"ERROR: Fehler beim Laden/JSON-Parse von {raw_name}: {e}")
+        GCS_DOWNLOADS.inc(result="error")
+        return None
+    GCS_DOWNLOADS.inc(result="ok" if isinstance(raw, dict) else "invalid")
+    return raw if isinstance(raw, dict) else None
+
+def _received_ts(raw: dict) -> Optional[float]:
+    """received_at (von /ingest gesetzt) als Epoch-Sekunden."""
+    ts = (raw.get("received_at") or "").rstrip("Z")
+    try:
+        return datetime.fromisoformat(ts).replace(tzinfo=timezone.utc).timestamp() if ts else None
+    except ValueError:
+        return None
 
 def mark_responded(bucket: storage.Bucket, raw_name: str):
     marker = RESP_PREFIX + raw_name.split("/")[-1].replace(".json", ".sent")
     bucket.blob(marker).upload_from_string("", content_type="text/plain")
 
-def save_pending_to_db(case_id: str, raw_name: str, subject: str, from_email: str, extracted: dict) -> bool:
+# Marker erst setzen, wenn der Outbox-Worker den Versand bestätigt hat
+smtp_outbox.on_sent("reply", lambda raw_name: mark_responded(_get_bucket(), raw_name))
+
+# Schreib-Statements des Unit-of-Work-Writers in Flush-Reihenfolge
+# (Lebenszyklus eines Falls: anlegen → ergänzen → Kunde anlegen + Pending löschen → Antwort)
+_PENDING_FIELDS = {
+    "name": "name_vollstaendig",
+    "first_name": "first_name",
+    "last_name": "last_name",
+    "phone": "kontakt_telefon",
+    "email": "kontakt_email",
+    "address": "adresse_strasse",
+    "housenumber": "adresse_hausnummer",
+    "plz": "adresse_plz",
+    "city": "adresse_ort",
+}
+CASE_STATEMENTS = {
+    "pending_insert": """
+        INSERT INTO tbl_onboarding_pending (
+            case_id, case_tag, name_vollstaendig, first_name, last_name,
+            kontakt_telefon, kontakt_email, adresse_strasse, adresse_hausnummer,
+            adresse_plz, adresse_ort, source_sender, source_subject, raw_data,
+            name_key, name_phonetic, status
+        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, 'PENDING')
+    """,
+    # Leere Felder (NULL) lassen den bisherigen Wert stehen; Kunde hat geantwortet → Erinnerungszyklus neu
+    "pending_update": f"""
+        UPDATE tbl_onboarding_pending SET
+            {", ".join(f"{col} = COALESCE(%s, {col})" for col in _PENDING_FIELDS.values())},
+            name_key = COALESCE(%s, name_key), name_phonetic = COALESCE(%s, name_phonetic),
+            reminder_count = 0, last_reminder_at = NULL, raw_data = %s
+        WHERE case_id = %s
+    """,
+    "customer_insert": """
+        INSERT INTO tbl_kunden (name_vollstaendig, kontakt_email, kontakt_telefon, adresse_strasse, source_subject, source_from_email, raw_json, name_key, name_phonetic)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+    """,
+    "pending_delete": "DELETE FROM tbl_onboarding_pending WHERE case_id = %s",
+    "outbox_insert": smtp_outbox.INSERT_SQL,
+}
+
+def new_case_writer() -> UnitOfWork:
+    """Sammelt die Schreibvorgänge eines Batches (eine Einheit pro E-Mail) für eine Transaktion."""
+    # Fall-Abschluss nur, wenn der Fall noch existiert – sonst hat ihn ein anderer Worker schon abgeschlossen
+    return UnitOfWork(CASE_STATEMENTS, require_rows=("pending_delete",))
+
+def _write(uow: Optional[UnitOfWork], statement: str, params: tuple, what: str,
+           provides: Optional[str] = None, requires: Optional[str] = None) -> bool:
+    """Zeile in uow einreihen; ohne uow sofort in einer eigenen Transaktion schreiben.
+
+    provides/requires (case_id): Ergänzungen eines im selben Batch angelegten Falls scheitern mit ihm.
+    """
+    if uow is not None:
+        uow.add(statement, params, provides=provides, requires=requires)
+        return True
+    single = new_case_writer()
+    single.begin(what)
+    single.add(statement, params)
+    return single.flush() == 1
+
+def save_pending_to_db(case_id: str, raw_name: str, subject: str, from_email: str, extracted: dict,
+                       uow: Optional[UnitOfWork] = None) -> bool:
     """Speichert Pending-Case in DB-Tabelle statt Bucket"""
     if not all([DB_HOST, DB_USER, DB_PASSWORD, DB_NAME]):
         print("INFO: DB nicht konfiguriert – überspringe Pending-Speicherung.")
         return False
     
-    try:
-        conn = mysql.connector.connect(
-            host=DB_HOST, port=DB_PORT,
-            user=DB_USER, password=DB_PASSWORD, database=DB_NAME
-        )
-        cur = conn.cursor()
-        
-        case_tag = case_id[:8]
-        raw_data = json.dumps(extracted, ensure_ascii=False)
-        
-        cur.execute("""
-            INSERT INTO tbl_onboarding_pending (
-                case_id, case_tag, name_vollstaendig, first_name, last_name,
-                kontakt_telefon, kontakt_email, adresse_strasse, adresse_hausnummer,
-                adresse_plz, adresse_ort, source_sender, source_subject, raw_data, status
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, 'PENDING')
-        """, (
-            case_id, case_tag, extracted.get("name"), extracted.get("first_name"), 
-            extracted.get("last_name"), extracted.get("phone"), extracted.get("email"),
-            extracted.get("address"), extracted.get("housenumber"), extracted.get("plz"),
-            extracted.get("city"), from_email, subject, raw_data
-        ))
-        
-        conn.commit()
-        cur.close()
-        conn.close()
-        return True
-        
-    except Exception as e:
-        print(f"ERROR: DB-Fehler beim Speichern von Pending-Case: {e}")
-        return False
+    case_tag = case_id[:8]
+    raw_data = json.dumps(extracted, ensure_ascii=False)
+    key, phonetic = match_keys(pending_name(extracted))
+    return _write(uow, "pending_insert", (
+        case_id, case_tag, extracted.get("name"), extracted.get("first_name"), 
+        extracted.get("last_name"), extracted.get("phone"), extracted.get("email"),
+        extracted.get("address"), extracted.get("housenumber"), extracted.get("plz"),
+        extracted.get("city"), from_email, subject, raw_data, key, phonetic
+    ), f"Pending-Case {case_id}", provides=case_id)
+
+
+def pending_name(data: dict) -> Optional[str]:
+    """Name eines Falls für die Matching-Schlüssel: name, sonst Vor- + Nachname."""
+    name = (data.get("name") or "").strip()
+    if name:
+        return name
+    return " ".join(p for p in ((data.get("first_name") or "").strip(), (data.get("last_name") or "").strip()) if p) or None
 
 def merge_missing(old: dict, new: dict) -> dict:
     merged = dict(old or {})
@@ -415,350 +731,729 @@ def extract_name_from_email(email: str) -> Optional[str]:
     # Mindestens 2 Wörter für Vor- und Nachname
     return name if len(name.split()) >= 2 else None
 
-def find_pending_by_case_tag(case_tag: str) -> Optional[dict]:
-    """Sucht Pending-Case anhand Case-Tag in DB"""
-    if not case_tag or not all([DB_HOST, DB_USER, DB_PASSWORD, DB_NAME]):
-        return None
-    
-    try:
-        conn = mysql.connector.connect(
-            host=DB_HOST, port=DB_PORT,
-            user=DB_USER, password=DB_PASSWORD, database=DB_NAME
-        )
-        cur = conn.cursor(dictionary=True)
-        
-        cur.execute("SELECT * FROM tbl_onboarding_pending WHERE case_tag = %s AND status = 'PENDING'", (case_tag,))
-        result = cur.fetchone()
-        
-        cur.close()
-        conn.close()
-        return result
-        
-    except Exception as e:
-        print(f"ERROR: DB-Fehler beim Case-Tag-Matching: {e}")
-        return None
+def _sql_in(column: str, values: List[str]) -> str:
+    return f"{column} IN ({', '.join(['%s'] * len(values))})"
 
-def find_pending_by_sender(sender: str) -> Optional[dict]:
-    """Sucht neuesten Pending-Case anhand Sender in DB"""
-    if not sender or not all([DB_HOST, DB_USER, DB_PASSWORD, DB_NAME]):
-        return None
-    
-    try:
-        conn = mysql.connector.connect(
-            host=DB_HOST, port=DB_PORT,
-            user=DB_USER, password=DB_PASSWORD, database=DB_NAME
-        )
-        cur = conn.cursor(dictionary=True)
-        
-        cur.execute("""
-            SELECT * FROM tbl_onboarding_pending 
-            WHERE source_sender = %s AND status = 'PENDING'
-            ORDER BY updated_at DESC LIMIT 1
-        """, (sender,))
-        result = cur.fetchone()
-        
-        cur.close()
-        conn.close()
-        return result
-        
-    except Exception as e:
-        print(f"ERROR: DB-Fehler beim Sender-Matching: {e}")
-        return None
+def pending_row(data: dict, **columns) -> dict:
+    """Zeile im Format von tbl_onboarding_pending (für Nachträge in den CaseResolver)."""
+    key, phonetic = match_keys(pending_name(data))
+    row = dict(columns)
+    row.update({
+        "name_vollstaendig": data.get("name") or row.get("name_vollstaendig"),
+        "first_name": data.get("first_name") or row.get("first_name"),
+        "last_name": data.get("last_name") or row.get("last_name"),
+        "raw_data": json.dumps(data, ensure_ascii=False),
+        "name_key": key or row.get("name_key"),
+        "name_phonetic": phonetic or row.get("name_phonetic"),
+    })
+    return row
 
-def find_existing_customer(name: str, email: str) -> Optional[dict]:
-    """Prüft ob Kunde bereits in tbl_kunden existiert"""
-    if not all([DB_HOST, DB_USER, DB_PASSWORD, DB_NAME]):
-        return None
-    
-    try:
-        conn = mysql.connector.connect(
-            host=DB_HOST, port=DB_PORT,
-            user=DB_USER, password=DB_PASSWORD, database=DB_NAME
-        )
-        cur = conn.cursor(dictionary=True)
-        
-        # Prüfe nach Name oder E-Mail
-        cur.execute("""
-            SELECT kunden_id, name_vollstaendig, kontakt_email 
-            FROM tbl_kunden 
-            WHERE name_vollstaendig LIKE %s OR kontakt_email = %s
-            LIMIT 1
-        """, (f"%{name}%", email))
-        result = cur.fetchone()
-        
-        cur.close()
-        conn.close()
-        return result
-        
-    except Exception as e:
-        print(f"ERROR: DB-Fehler beim Kunden-Duplikats-Check: {e}")
-        return None
+# Resolver der laufenden Batches; Schreibvorgänge (auch aus dem Push-Modus) werden allen nachgetragen
+_RESOLVERS: "weakref.WeakSet[CaseResolver]" = weakref.WeakSet()
 
-def find_pending_by_name(name: str) -> Optional[dict]:
-    """Sucht Pending-Case anhand Name in DB"""
-    if not name or not all([DB_HOST, DB_USER, DB_PASSWORD, DB_NAME]):
-        return None
-    
-    try:
-        conn = mysql.connector.connect(
-            host=DB_HOST, port=DB_PORT,
-            user=DB_USER, password=DB_PASSWORD, database=DB_NAME
-        )
-        cur = conn.cursor(dictionary=True)
-        
-        cur.execute("""
-            SELECT * FROM tbl_onboarding_pending 
-            WHERE (name_vollstaendig LIKE %s OR CONCAT(first_name, ' ', last_name) LIKE %s)
-            AND status = 'PENDING'
-            ORDER BY updated_at DESC LIMIT 1
-        """, (f"%{name}%", f"%{name}%"))
-        result = cur.fetchone()
-        
-        cur.close()
-        conn.close()
-        return result
-        
-    except Exception as e:
-        print(f"ERROR: DB-Fehler beim Name-Matching: {e}")
-        return None
+class CaseResolver:
+    """Matching-Kaskade für einen ganzen Batch mit zwei Abfragen statt bis zu fünf pro E-Mail.
+
+    prefetch() lädt alle offenen Fälle, deren Case-Tag, Absender oder Namensschlüssel im Batch vorkommt,
+    und alle Kunden mit passendem Namensschlüssel bzw. passender E-Mail. Die Rangfolge bleibt wie bisher:
+    Case-Tag → Absender (neuester Fall) → Name (nur exakter name_key), danach Duplikats-Check (E-Mail vor
+    exaktem Namen). Phonetisch/difflib-ähnliche Namen werden nicht zugeordnet, sondern nur gemeldet
+    (_flag_review). Nutzung und note_* laufen unter _COMMIT_LOCK.
+    """
+    def __init__(self):
+        self._pending: Dict[str, dict] = {}  # case_id → Zeile
+        self._rank: Dict[str, int] = {}      # case_id → Aktualität (höher = zuletzt geändert)
+        self._seq = 0
+        self._index: Dict[str, Dict[str, set]] = {k: {} for k in ("case_tag", "source_sender", "name_key", "name_phonetic")}
+        self._customers: List[dict] = []
+
+    @classmethod
+    def for_emails(cls, emails: List[Tuple[str, str, str, Optional[dict]]]) -> "CaseResolver":
+        """Resolver für (subject, from_addr, body, extracted)-Tupel anlegen und Kandidaten vorladen."""
+        resolver = cls()
+        _RESOLVERS.add(resolver)
+        resolver.prefetch(emails)
+        return resolver
+
+    @staticmethod
+    def _names(from_addr: str, extracted: Optional[dict]) -> Tuple[str, Optional[str]]:
+        extracted_name = (extracted.get("name") or "").strip() if extracted else ""
+        return extracted_name, extracted_name or extract_name_from_email(from_addr)
+
+    def prefetch(self, emails: List[Tuple[str, str, str, Optional[dict]]]):
+        tags, senders, keys, phonetics, customer_emails = set(), set(), set(), set(), set()
+        for subject, from_addr, body, extracted in emails:
+            tag = find_case_id_in_subject_or_body(subject, body)
+            if tag:
+                tags.add(tag)
+            if from_addr:
+                senders.add(from_addr)
+            extracted_name, lookup_name = self._names(from_addr, extracted)
+            for name in (extracted_name, lookup_name):
+                key, phonetic = match_keys(name)
+                if key:
+                    keys.add(key)
+                    phonetics.add(phonetic)
+            email = (extracted.get("email") or "").strip() if extracted else ""
+            if email:
+                customer_emails.add(email)
+
+        if not db_pool.db_configured() or not (tags or senders or keys or customer_emails):
+            return
+        pending_filter = [(c, sorted(v)) for c, v in (("case_tag", tags), ("source_sender", senders),
+                                                      ("name_key", keys), ("name_phonetic", phonetics)) if v]
+        customer_filter = [(c, sorted(v)) for c, v in (("name_key", keys), ("name_phonetic", phonetics),
+                                                       ("kontakt_email", customer_emails)) if v]
+        try:
+            with db_pool.connection("resolver_prefetch") as conn:
+                cur = conn.cursor(dictionary=True)
+                cur.execute(f"""
+                    SELECT * FROM tbl_onboarding_pending
+                    WHERE status = 'PENDING' AND ({' OR '.join(_sql_in(c, v) for c, v in pending_filter)})
+                    ORDER BY updated_at, id
+                """, [x for _, v in pending_filter for x in v])
+                for row in cur.fetchall():
+                    self.note_pending(row)
+                if customer_filter:
+                    cur.execute(f"""
+                        SELECT kunden_id, name_vollstaendig, kontakt_email, name_key, name_phonetic
+                        FROM tbl_kunden
+                        WHERE {' OR '.join(_sql_in(c, v) for c, v in customer_filter)}
+                    """, [x for _, v in customer_filter for x in v])
+                    self._customers.extend(cur.fetchall())
+                cur.close()
+        except Exception as e:
+            print(f"ERROR: DB-Fehler beim Vorladen der Matching-Kandidaten: {e}")
+
+    @staticmethod
+    def _norm(value: Any) -> Optional[str]:
+        # MySQL vergleicht case-insensitiv – im Speicher genauso
+        if value is None:
+            return None
+        return str(value).strip().lower() or None
+
+    def note_pending(self, row: dict):
+        """Offenen Fall aufnehmen bzw. ersetzen (gilt danach als zuletzt geändert)."""
+        case_id = row["case_id"]
+        self.note_completed(case_id)
+        self._seq += 1
+        self._pending[case_id] = row
+        self._rank[case_id] = self._seq
+        for column, index in self._index.items():
+            value = self._norm(row.get(column))
+            if value:
+                index.setdefault(value, set()).add(case_id)
+
+    def note_completed(self, case_id: str):
+        row = self._pending.pop(case_id, None)
+        self._rank.pop(case_id, None)
+        if row is None:
+            return
+        for column, index in self._index.items():
+            value = self._norm(row.get(column))
+            if value in index:
+                index[value].discard(case_id)
+
+    def note_customer(self, name: Optional[str], email: Optional[str], kunden_id: Optional[int] = None):
+        key, phonetic = match_keys(name)
+        self._customers.append({"kunden_id": kunden_id, "name_vollstaendig": name, "kontakt_email": email,
+                                "name_key": key, "name_phonetic": phonetic})
 
-def update_pending_case(case_id: str, new_data: dict) -> bool:
+    def _newest(self, column: str, value: Any) -> List[dict]:
+        ids = self._index[column].get(self._norm(value) or "", ())
+        return [self._pending[i] for i in sorted(ids, key=self._rank.get, reverse=True)]
+
+    @staticmethod
+    def _flag_review(target: str, name: str, rows: List[dict], row_name, describe):
+        """Ähnliche Namen nur melden – die Zuordnung bleibt manuell."""
+        candidates = review_candidates(name, rows, row_name)
+        if not candidates:
+            return
+        NAME_REVIEWS.inc(target=target)
+        listed = ", ".join(f"{describe(row)} '{row_name(row)}' ({score:.2f})" for score, row in candidates[:3])
+        print(f"WARN: '{name}' nicht automatisch zugeordnet, ähnliche Namen zur Prüfung: {listed}")
+
+    def _by_name(self, name: str) -> Optional[dict]:
+        key, phonetic = match_keys(name)
+        if not key:
+            return None
+        ids = self._index["name_key"].get(key, set()) | self._index["name_phonetic"].get(phonetic, set())
+        rows = [self._pending[i] for i in sorted(ids, key=self._rank.get, reverse=True)]
+        row_name = lambda r: pending_name({
+            "name": r.get("name_vollstaendig"), "first_name": r.get("first_name"), "last_name": r.get("last_name")})
+        row = best_match(name, rows, row_name)
+        if row is None:
+            self._flag_review("pending", name, rows, row_name, lambda r: f"Case {r['case_id']}")
+        return row
+
+    def resolve_pending(self, subject: str, from_addr: str, body: str,
+                        extracted: Optional[dict]) -> Tuple[Optional[dict], Optional[str]]:
+        """Offener Fall zur E-Mail → (Zeile, Ebene: case_tag / sender / name / email_name)."""
+        case_short = find_case_id_in_subject_or_body(subject, body)
+        if case_short:
+            rows = self._newest("case_tag", case_short)
+            if rows:
+                return rows[0], "case_tag"
+        rows = self._newest("source_sender", from_addr)
+        if rows:
+            return rows[0], "sender"
+        extracted_name, lookup_name = self._names(from_addr, extracted)
+        if lookup_name:
+            row = self._by_name(lookup_name)
+            if row:
+                return row, "name" if extracted_name else "email_name"
+        return None, None
+
+    def find_customer(self, name: str, email: str) -> Optional[dict]:
+        """Bestehender Kunde: exakte E-Mail vor Namens-Treffer."""
+        email = self._norm(email)
+        if email:
+            for row in self._customers:
+                if self._norm(row.get("kontakt_email")) == email:
+                    return row
+        key, phonetic = match_keys(name)
+        if not key:
+            return None
+        rows = [r for r in self._customers if r.get("name_key") == key or r.get("name_phonetic") == phonetic]
+        row_name = lambda r: r.get("name_vollstaendig")
+        row = best_match(name, rows, row_name)
+        if row is None:
+            self._flag_review("customer", name, rows, row_name, lambda r: f"Kunde {r.get('kunden_id') or '(neu)'}")
+        return row
+
+def _note_resolvers(resolver: "CaseResolver", uow: Optional[UnitOfWork], method: str, *args):
+    """Schreibvorgang den Resolvern nachtragen.
+
+    Der eigene Resolver sofort (spätere Mails im Batch sehen den Fall; scheitert die anlegende Einheit,
+    scheitern deren Ergänzungen mit), alle anderen laufenden (Push/andere Abschnitte) erst nach dem COMMIT.
+    """
+    getattr(resolver, method)(*args)
+
+    def others():
+        for other in list(_RESOLVERS):
+            if other is not resolver:
+                getattr(other, method)(*args)
+
+    if uow is None:
+        others()
+    else:
+        uow.after_commit(others)
+
+def update_pending_case(case_id: str, new_data: dict, uow: Optional[UnitOfWork] = None) -> bool:
     """Aktualisiert einen Pending-Case mit neuen Daten (inkrementell)"""
     if not case_id or not all([DB_HOST, DB_USER, DB_PASSWORD, DB_NAME]):
         return False
     
-    try:
-        conn = mysql.connector.connect(
-            host=DB_HOST, port=DB_PORT,
-            user=DB_USER, password=DB_PASSWORD, database=DB_NAME
-        )
-        cur = conn.cursor()
-        
-        # Baue UPDATE-Statement dynamisch basierend auf verfügbaren Daten
-        updates = []
-        values = []
-        
-        field_mapping = {
-            "name": "name_vollstaendig",
-            "first_name": "first_name", 
-            "last_name": "last_name",
-            "phone": "kontakt_telefon",
-            "email": "kontakt_email",
-            "address": "adresse_strasse",
-            "housenumber": "adresse_hausnummer", 
-            "plz": "adresse_plz",
-            "city": "adresse_ort"
-        }
-        
-        for key, db_field in field_mapping.items():
-            if new_data.get(key) and str(new_data[key]).strip():
-                updates.append(f"{db_field} = %s")
-                values.append(new_data[key])
-        
-        if not updates:
-            return False
-        
-        # Aktualisiere raw_data mit merged data
-        updates.append("raw_data = %s")
-        values.append(json.dumps(new_data, ensure_ascii=False))
-        values.append(case_id)
-        
-        sql = f"UPDATE tbl_onboarding_pending SET {', '.join(updates)} WHERE case_id = %s"
-        cur.execute(sql, values)
-        
-        conn.commit()
-        cur.close()
-        conn.close()
-        return True
-        
-    except Exception as e:
-        print(f"ERROR: DB-Fehler beim Update von Pending-Case: {e}")
+    # Nur nicht-leere Felder überschreiben (None → COALESCE behält den alten Wert)
+    values = [new_data[key] if new_data.get(key) and str(new_data[key]).strip() else None
+              for key in _PENDING_FIELDS]
+    if not any(v is not None for v in values):
         return False
+    
+    key, phonetic = match_keys(pending_name(new_data))
+    values.extend([key, phonetic, json.dumps(new_data, ensure_ascii=False), case_id])
+    return _write(uow, "pending_update", tuple(values), f"Pending-Update {case_id}", requires=case_id)
 
-def complete_pending_case(case_id: str) -> bool:
+def complete_pending_case(case_id: str, uow: Optional[UnitOfWork] = None) -> bool:
     """Löscht einen abgeschlossenen Pending-Case"""
     if not case_id or not all([DB_HOST, DB_USER, DB_PASSWORD, DB_NAME]):
         return False
     
-    try:
-        conn = mysql.connector.connect(
-            host=DB_HOST, port=DB_PORT,
-            user=DB_USER, password=DB_PASSWORD, database=DB_NAME
-        )
-        cur = conn.cursor()
-        
-        cur.execute("DELETE FROM tbl_onboarding_pending WHERE case_id = %s", (case_id,))
-        
-        conn.commit()
-        cur.close()
-        conn.close()
-        return True
-        
-    except Exception as e:
-        print(f"ERROR: DB-Fehler beim Löschen von Pending-Case: {e}")
-        return False
+    return _write(uow, "pending_delete", (case_id,), f"Pending-Abschluss {case_id}", requires=case_id)
 
-def create_database_entry(data: Dict[str, Any], source_email: str, subject: str) -> bool:
+def create_database_entry(data: Dict[str, Any], source_email: str, subject: str,
+                          uow: Optional[UnitOfWork] = None) -> bool:
     if not all([DB_HOST, DB_USER, DB_PASSWORD, DB_NAME]):
         print("INFO: DB nicht konfiguriert – überspringe persistente Ablage (simuliere Erfolg).")
         return True
-    try:
-        conn = mysql.connector.connect(
-            host=DB_HOST, port=DB_PORT,
-            user=DB_USER, password=DB_PASSWORD, database=DB_NAME
-        )
-        cur = conn.cursor()
+    
+    # Die Adresse aus den Einzelteilen zusammensetzen
+    full_address = f"{(data.get('address') or '').strip()}, {(data.get('plz') or '').strip()} {(data.get('city') or '').strip()}".strip(", ")
+    key, phonetic = match_keys(data.get("name"))
+    return _write(uow, "customer_insert", (
+        data.get("name"),
+        data.get("email"),
+        data.get("phone"),
+        full_address,
+        subject,
+        source_email,
+        json.dumps(data, ensure_ascii=False),
+        key,
+        phonetic
+    ), f"Kunde {data.get('name')}")
+
+
+def handle_extracted(bucket: storage.Bucket, raw_name: str, subject: str, from_addr: str, body: str, extracted: dict,
+                     resolver: Optional[CaseResolver] = None, uow: Optional[UnitOfWork] = None) -> Tuple[str, bool]:
+    """Matching-Kaskade, DB-Update und Antwort für eine extrahierte E-Mail → (Aktion, Antwort versendet).
+
+    resolver: vorgeladene Kandidaten des Batches; ohne wird einer nur für diese E-Mail angelegt.
+    uow: Schreibvorgänge und Antwort werden dort eingereiht und erst beim Flush (gemeinsam) geschrieben.
+    """
+    if resolver is None:
+        resolver = CaseResolver.for_emails([(subject, from_addr, body, extracted)])
+
+    # Ebenen 1–3: Case-Tag → Sender → Name (Rangfolge im CaseResolver)
+    pending_case, level = resolver.resolve_pending(subject, from_addr, body, extracted)
+    print(f"DEBUG: Subject='{subject}', from='{from_addr}', match={level or '-'}"
+          + (f" → {pending_case['case_id']}" if pending_case else ""))
+
+    if pending_case:
+        # Bestehenden Case aktualisieren
+        old_data = json.loads(pending_case.get("raw_data", "{}")) if pending_case.get("raw_data") else {}
+        merged = merge_missing(old_data, extracted)
         
-        # Die Adresse aus den Einzelteilen zusammensetzen
-        full_address = f"{(data.get('address') or '').strip()}, {(data.get('plz') or '').strip()} {(data.get('city') or '').strip()}".strip(", ")
-
-        # SQL-Statement mit korrekten Spaltennamen aus der Doku
-        cur.execute("""
-            INSERT INTO tbl_kunden (name_vollstaendig, kontakt_email, kontakt_telefon, adresse_strasse, source_subject, source_from_email, raw_json)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-        """, (
-            data.get("name"),
-            data.get("email"),
-            data.get("phone"),
-            full_address,
-            subject,
-            source_email,
-            json.dumps(data, ensure_ascii=False)
-        ))
-        conn.commit()
-        cid = cur.lastrowid
-        cur.close()
-        conn.close()
-        print(f"INFO: DB: tbl_kunden.id={cid}")
+        if is_complete(merged, REQ_FIELDS):
+            # Case vervollständigen
+            ok = create_database_entry(merged, from_addr, subject, uow)
+            complete_pending_case(pending_case["case_id"], uow)
+            _note_resolvers(resolver, uow, "note_completed", pending_case["case_id"])
+            if ok:
+                _note_resolvers(resolver, uow, "note_customer", merged.get("name"), merged.get("email"))
+            sub, body_mail = compose_reply(subject, [])
+            replied = send_email(from_addr, sub, body_mail, raw_name, uow)
+            print(f"INFO: Case {pending_case['case_id']} abgeschlossen (DB gespeichert).")
+            action = "case_completed" if ok else "db_error"
+        else:
+            # Partielles Update
+            if update_pending_case(pending_case["case_id"], merged, uow):
+                _note_resolvers(resolver, uow, "note_pending", pending_row(merged, **pending_case))
+            sub, body_mail = compose_reply(f"[PEAR-{pending_case['case_tag']}] – {subject or ''}".strip(), merged["missing"])
+            replied = send_email(from_addr, sub, body_mail, raw_name, uow)
+            print(f"INFO: Case {pending_case['case_id']} aktualisiert (fehlend: {merged['missing']}).")
+            action = "case_updated"
+        return action, replied
+
+    # Prüfe ob Kunde bereits existiert (Duplikats-Check)
+    extracted_name = (extracted.get("name") or "").strip() if extracted else ""
+    extracted_email = (extracted.get("email") or "").strip() if extracted else ""
+    
+    if extracted_name or extracted_email:
+        existing_customer = resolver.find_customer(extracted_name, extracted_email)
+        if existing_customer:
+            # Kunde bereits vorhanden - sende Bestätigungs-E-Mail
+            sub, body_mail = compose_duplicate_reply(
+                subject, 
+                existing_customer["kunden_id"], 
+                existing_customer["name_vollstaendig"]
+            )
+            replied = send_email(from_addr, sub, body_mail, raw_name, uow)
+            print(f"INFO: Duplikat erkannt - Kunde {existing_customer['name_vollstaendig']} (ID: {existing_customer['kunden_id']}) bereits vorhanden")
+            return "duplicate", replied
+    
+    # Neuen Case erstellen
+    case_id = str(uuid.uuid4())
+    
+    if is_complete(extracted, REQ_FIELDS):
+        # Vollständiger Case - direkt in Kundentabelle
+        ok = create_database_entry(extracted, from_addr, subject, uow)
+        if ok:
+            _note_resolvers(resolver, uow, "note_customer", extracted.get("name"), extracted.get("email"))
+        sub, body_mail = compose_reply(subject, [])
+        replied = send_email(from_addr, sub, body_mail, raw_name, uow)
+        print(f"INFO: Complete (sofort) angelegt und abgeschlossen: {case_id}")
+        action = "customer_created" if ok else "db_error"
+    else:
+        # Unvollständiger Case - in Pending-Tabelle
+        case_tag = case_id[:8]
+        if save_pending_to_db(case_id, raw_name, subject, from_addr, extracted, uow):
+            _note_resolvers(resolver, uow, "note_pending", pending_row(extracted, case_id=case_id, case_tag=case_tag,
+                                                        source_sender=from_addr, source_subject=subject))
+        sub, body_mail = compose_reply(f"[PEAR-{case_tag}] – {subject or ''}".strip(), extracted["missing"])
+        replied = send_email(from_addr, sub, body_mail, raw_name, uow)
+        print(f"INFO: Pending angelegt: {case_id} (fehlend: {extracted['missing']})")
+        action = "pending_created"
+    return action, replied
+
+@dataclass
+class BatchResult:
+    """Strukturiertes Ergebnis eines Verarbeitungslaufs (statt stdout-Auswertung in main.py)."""
+    candidates: int = 0
+    processed: int = 0
+    replied: int = 0
+    deferred: int = 0
+    failed: int = 0
+    actions: Dict[str, int] = field(default_factory=dict)
+    sources: Dict[str, int] = field(default_factory=dict)  # Extraktionsquelle: local / llm / mixed
+    reply_tokens_saved: int = 0  # durch Entfernen zitierter Verläufe gesparte Tokens
+    # Summierte Sekunden pro Stufe: list, download (Ladezeit der Prefetch-Threads), download_wait (Verbraucher
+    # wartet auf GCS), parse, extract, match (Matching + Antwort), persist (DB + Outbox), reply (Versand)
+    stage_seconds: Dict[str, float] = field(default_factory=dict)
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage(name, time.perf_counter() - started)
+
+    def add_stage(self, name: str, seconds: float):
+        self.stage_seconds[name] = self.stage_seconds.get(name, 0.0) + seconds
+
+    @property
+    def customers_created(self) -> int:
+        return self.actions.get("customer_created", 0) + self.actions.get("case_completed", 0)
+
+    @property
+    def gemini_calls_avoided(self) -> int:
+        return self.sources.get("local", 0)
+
+    def count(self, action: str):
+        self.actions[action] = self.actions.get(action, 0) + 1
+        EMAILS_PROCESSED.inc(action=action)
+
+    def count_source(self, source: str):
+        self.sources[source] = self.sources.get(source, 0) + 1
+        EXTRACTIONS.inc(source=source)
+
+    def as_dict(self) -> Dict[str, Any]:
+        out = asdict(self)
+        out["stage_seconds"] = {k: round(v, 3) for k, v in self.stage_seconds.items()}
+        out["customers_created"] = self.customers_created
+        out["gemini_calls_avoided"] = self.gemini_calls_avoided
+        return out
+
+class LatencyTracker:
+    """Rollierendes Fenster der Zeit von /ingest (received_at) bis zur versendeten Antwort."""
+    def __init__(self, maxlen: int = 1000):
+        self._values = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        with self._lock:
+            self._values.append(seconds)
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            values = sorted(self._values)
+        if not values:
+            return {"count": 0, "median_s": None, "p90_s": None, "max_s": None}
+        return {
+            "count": len(values),
+            "median_s": round(statistics.median(values), 2),
+            "p90_s": round(values[min(len(values) - 1, int(len(values) * 0.9))], 2),
+            "max_s": round(values[-1], 2),
+        }
+
+INGEST_TO_REPLY = LatencyTracker()
+
+# ---------------- Gemeinsamer Zustand (Batch + Push) ----------------
+_STORAGE_CLIENT: Optional[storage.Client] = None
+_INDEX: Optional[ProcessedIndex] = None
+_STATE_LOCK = threading.RLock()
+_COMMIT_LOCK = threading.RLock()  # Matching/DB/Antwort immer nur für eine Datei gleichzeitig (reentrant für _flush_writes)
+_IN_FLIGHT: set = set()
+
+def _get_bucket() -> storage.Bucket:
+    """Langlebiger Storage-Client statt neuem Client pro Lauf."""
+    global _STORAGE_CLIENT
+    with _STATE_LOCK:
+        if _STORAGE_CLIENT is None:
+            _STORAGE_CLIENT = storage.Client(project=PROJECT_ID)
+        return _STORAGE_CLIENT.bucket(GCS_BUCKET)
+
+def _get_index(refresh: bool = False) -> ProcessedIndex:
+    """Prozessweiter Verarbeitungs-Index; refresh=True lädt den Stand aus GCS neu."""
+    global _INDEX
+    with _STATE_LOCK:
+        if _INDEX is None:
+            _INDEX = ProcessedIndex(_get_bucket(), PROCESSED_INDEX_OBJECT, RAW_PREFIX, RESP_PREFIX,
+                                    max_attempts=PROCESSED_MAX_ATTEMPTS,
+                                    safety_seconds=PROCESSED_INDEX_SAFETY_SECONDS)
+            _INDEX.load()
+        elif refresh:
+            _INDEX.refresh()
+        return _INDEX
+
+def _claim(raw_name: str) -> bool:
+    """Reserviert eine Datei, damit Push und Sweep sie nicht gleichzeitig bearbeiten."""
+    with _STATE_LOCK:
+        if raw_name in _IN_FLIGHT:
+            return False
+        _IN_FLIGHT.add(raw_name)
         return True
-    except Error as e:
-        print(f"ERROR: DB-Fehler: {e}")
+
+def _unclaim(raw_name: str):
+    with _STATE_LOCK:
+        _IN_FLIGHT.discard(raw_name)
+
+def _commit_email(bucket: storage.Bucket, index: ProcessedIndex, raw_name: str, created_ts: float,
+                  raw: dict, subject: str, from_addr: str, body: str, extracted: Optional[dict],
+                  result: BatchResult, source: str = "llm", resolver: Optional[CaseResolver] = None,
+                  uow: Optional[UnitOfWork] = None):
+    """Matching + Schreibvorgänge für eine Datei (serialisiert über _COMMIT_LOCK).
+
+    Mit uow (Sweep) werden DB-Zeilen und Antwort erst beim Flush des Batches geschrieben, Index und
+    Zähler danach aktualisiert; ohne (Push) sofort in einer eigenen Transaktion.
+    """
+    with _COMMIT_LOCK:
+        if index.is_done(raw_name, created_ts):
+            return
+        if not extracted or not isinstance(extracted, dict):
+            print(f"ERROR: Gemini-Extraktion fehlgeschlagen für {raw_name}")
+            index.mark_failed(raw_name, created_ts)
+            result.failed += 1
+            return
+        print(f"INFO: {raw_name}: Extraktion via {source}")
+        result.count_source(source)
+        writer = uow if uow is not None else new_case_writer()
+        writer.begin(raw_name)
+        action, replied = handle_extracted(bucket, raw_name, subject, from_addr, body, extracted, resolver, writer)
+
+        def written(ok: bool):
+            result.processed += 1
+            result.count(action if ok else "db_error")
+            if replied and ok:
+                result.replied += 1
+                index.mark_done(raw_name, created_ts)
+                received = _received_ts(raw)
+                if received:
+                    INGEST_TO_REPLY.observe(max(0.0, time.time() - received))
+            else:
+                # Nicht geschrieben oder keine Antwort eingereiht (z.B. SMTP nicht konfiguriert) – begrenzt oft erneut versuchen
+                index.mark_failed(raw_name, created_ts)
+
+        writer.on_done(written)
+        if uow is None:
+            _flush_writes(writer)
+
+def _flush_writes(uow: UnitOfWork):
+    """Gesammelte Schreibvorgänge in einer Transaktion schreiben und einen laufenden Outbox-Worker wecken.
+
+    Als Skript läuft kein Worker – main() versendet am Ende über smtp_outbox.drain().
+    """
+    with _COMMIT_LOCK:
+        if uow.flush() and smtp_outbox.outbox_enabled():
+            smtp_outbox.wake_worker()
+
+def process_raw_object(raw_name: str) -> bool:
+    """Push-Modus: verarbeitet genau ein RAW-Objekt direkt nach Eingang (True = verarbeitet)."""
+    result = BatchResult(candidates=1)
+    if not (raw_name.startswith(RAW_PREFIX) and raw_name.endswith(".json")):
+        return False
+    bucket = _get_bucket()
+    index = _get_index()
+    blob = bucket.get_blob(raw_name)
+    if blob is None:
+        print(f"ERROR: {raw_name} nicht im Bucket gefunden.")
         return False
+    created_ts = blob_created_ts(blob)
+    if index.is_done(raw_name, created_ts) or not _claim(raw_name):
+        return False
+    try:
+        raw = load_raw_email(bucket, raw_name)
+        if raw is None:
+            index.mark_failed(raw_name, created_ts)
+            return False
+        subject, from_addr, body = parse_raw_fields(raw)
+        if not body.strip():
+            print(f"INFO: {raw_name}: Kein Body extrahierbar – überspringe.")
+            index.mark_done(raw_name, created_ts)
+            return False
+        try:
+            text, saved = extraction_text(subject, body)
+            if saved:
+                print(f"INFO: {raw_name}: Zitierter Verlauf entfernt (≈ {saved} Tokens gespart)")
+            local = pre_extract(text)
+            budget = None if is_locally_complete(local) else GeminiBudget(gemini_budget_remaining())
+            extracted, source = combine_extraction(local, call_gemini(text, budget) if budget else None)
+        except ExtractionDeferred as e:
+            print(f"INFO: {raw_name}: {e} – bleibt für den nächsten Sweep liegen.")
+            return False
+        _commit_email(bucket, index, raw_name, created_ts, raw, subject, from_addr, body, extracted, result, source)
+        return result.processed > 0
+    finally:
+        _unclaim(raw_name)
+        index.save()
+
+def log_pool_stats():
+    """Gibt die Pool-Kennzahlen des Laufs aus (Hits vs. neue Verbindungen)."""
+    st = db_pool.pool_stats()
+    if st:
+        print(f"INFO: DB-Pool: {st['hits']} Hits, {st['new']} neue Verbindungen, "
+              f"{st['reconnects']} Reconnects, {st['waits']} Wartevorgänge")
+
+def log_cache_stats():
+    """Gibt die Treffer des Extraktions-Caches für diesen Lauf aus."""
+    st = EXTRACTION_CACHE.stats()
+    print(f"INFO: Extraktions-Cache: {st['memory_hits']} Treffer (RAM), {st['db_hits']} Treffer (DB), "
+          f"{st['misses']} Misses (API-Calls)")
+    ls = GEMINI_LIMITER.stats()
+    print(f"INFO: Gemini-Limiter: {ls['calls']} Requests, {ls['retries']} Retries, {ls['rate_limited']} Rate-Limit, "
+          f"{ls['breaker_rejects']} vom Breaker abgewiesen, Breaker {ls['breaker']}")
+
+def log_stage_stats(result: BatchResult):
+    """Zeit pro Pipeline-Stufe – zeigt, ob GCS, Gemini oder die DB den Lauf bremst."""
+    st = result.stage_seconds
+    if st:
+        print("INFO: Stufen: " + ", ".join(f"{k} {v:.2f}s" for k, v in st.items()))
+
+def log_metrics(since: Dict[str, Any], result: BatchResult):
+    """Sweep-Stufen in die Histogramme übernehmen und die Metriken des Batches als JSON ausgeben."""
+    for name, seconds in result.stage_seconds.items():
+        SWEEP_STAGE_SECONDS.observe(seconds, stage=name)
+    print(f"INFO: Metriken: {json.dumps(metrics.summary(since), ensure_ascii=False)}")
+
+def log_latency_stats():
+    st = INGEST_TO_REPLY.summary()
+    if st["count"]:
+        print(f"INFO: Ingest→Antwort: Median {st['median_s']}s, p90 {st['p90_s']}s (n={st['count']})")
+
+_DB_CHECKED = False
+
+def run_batch(max_seconds: Optional[float] = None) -> BatchResult:
+    """Ein Catch-up-Lauf als Bibliotheksfunktion (Clients, Pool und Cache bleiben zwischen Läufen bestehen).
+
+    max_seconds: danach werden keine neuen Dateien mehr übernommen; der laufende Abschnitt wird noch
+    fertig geschrieben, der Rest bleibt für den nächsten Sweep liegen.
+    """
+    global _DB_CHECKED
+    db_pool.reset_pool_stats()
+    EXTRACTION_CACHE.reset_stats()
+    if not _DB_CHECKED:
+        # DB-Verbindung einmal pro Prozess prüfen
+        if not test_db_connection():
+            raise RuntimeError("DB-Check fehlgeschlagen")
+        _DB_CHECKED = True
+    result = BatchResult()
+    since = metrics.snapshot()
+    try:
+        _process_batch(result, None if max_seconds is None else time.monotonic() + max_seconds)
+    finally:
+        log_pool_stats()
+        log_cache_stats()
+        log_latency_stats()
+        log_stage_stats(result)
+        log_metrics(since, result)
+    return result
 
 def main():
-    # DB-Verbindung gleich am Anfang prüfen
-    test_db_connection()
+    try:
+        result = run_batch()
+    except RuntimeError as e:
+        print(f"ERROR: {e}")
+        exit(1)
+    # Als Skript endet der Prozess gleich – eingereihte Antworten noch selbst versenden
+    with result.stage("reply"):
+        sent = smtp_outbox.drain()
+    if sent:
+        print(f"INFO: Outbox: {sent} Mails versendet.")
+    print(f"INFO: Ergebnis: {json.dumps(result.as_dict(), ensure_ascii=False)}")
 
-    client = storage.Client(project=PROJECT_ID)
-    bucket = client.bucket(GCS_BUCKET)
+def _process_batch(result: BatchResult, deadline: Optional[float] = None):
+    """Catch-up-Sweep über alle offenen RAW-Dateien."""
+    bucket = _get_bucket()
+    index = _get_index(refresh=True)
+    try:
+        _process_candidates(_STORAGE_CLIENT, bucket, index, result, deadline)
+    finally:
+        index.save()
 
-    files = list_candidates(client)
+def _process_candidates(client: storage.Client, bucket: storage.Bucket, index: ProcessedIndex, result: BatchResult,
+                        deadline: Optional[float] = None):
+    with result.stage("list"):
+        files = list_candidates(client, index)
+    result.candidates = len(files)
     if not files:
         print("INFO: Keine neuen Dateien zum Verarbeiten gefunden.")
         return
 
-    print(f"INFO: Verarbeite {len(files)} Dateien...")
-    for raw_name in files:
-        try:
-            raw_text = bucket.blob(raw_name).download_as_text()
-            raw = json.loads(raw_text)
-        except Exception as e:
-            print(f"ERROR: Fehler beim Laden/JSON-Parse von {raw_name}: {e}")
-            continue
+    print(f"INFO: Verarbeite {len(files)} Dateien (Abschnitte à {SWEEP_CHUNK})...")
+    claimed = []
 
-        subject, from_addr, body = parse_raw_fields(raw)
+    def claim_files():
+        for n, (raw_name, created_ts) in enumerate(files):
+            if deadline is not None and time.monotonic() > deadline:
+                print(f"INFO: Zeitbudget erreicht – {len(files) - n} Dateien bleiben für den nächsten Sweep.")
+                return
+            if _claim(raw_name):  # sonst läuft sie gerade im Push-Modus
+                claimed.append(raw_name)
+                yield raw_name, created_ts
 
-        if not body.strip():
-            print(f"INFO: {raw_name}: Kein Body extrahierbar – überspringe.")
-            continue
-
-        extracted = call_gemini(body)
-        
-        if not extracted or not isinstance(extracted, dict):
-            print(f"ERROR: Gemini-Extraktion fehlgeschlagen für {raw_name}")
-            continue
+    # RAW-JSONs werden parallel vorausgeladen, während der vorige Abschnitt extrahiert/geschrieben wird;
+    # im Speicher liegen höchstens ein Abschnitt + PREFETCH_DEPTH Dateien
+    reader = PrefetchReader(lambda f: load_raw_email(bucket, f[0]))
+    chunk = []
+    try:
+        for (raw_name, created_ts), raw, load_s, wait_s in reader.iter(claim_files()):
+            result.add_stage("download", load_s)
+            result.add_stage("download_wait", wait_s)
+            if raw is None:
+                index.mark_failed(raw_name, created_ts)
+                result.failed += 1
+                continue
+            with result.stage("parse"):
+                subject, from_addr, body = parse_raw_fields(raw)
+            if not body.strip():
+                print(f"INFO: {raw_name}: Kein Body extrahierbar – überspringe.")
+                index.mark_done(raw_name, created_ts)
+                continue
+            chunk.append((raw_name, created_ts, raw, subject, from_addr, body))
+            if len(chunk) >= SWEEP_CHUNK:
+                _process_chunk(bucket, index, result, chunk)
+                chunk = []
+        if chunk:
+            _process_chunk(bucket, index, result, chunk)
+    finally:
+        for raw_name in claimed:
+            _unclaim(raw_name)
 
-        case_short = find_case_id_in_subject_or_body(subject, body)
-        pending_case = None
+    if result.deferred:
+        print(f"INFO: Gemini nicht verfügbar (Budget/Rate-Limit/Breaker) – {result.deferred} Dateien "
+              f"auf den nächsten Lauf verschoben.")
 
-        print(f"DEBUG: Subject='{subject}', case_short='{case_short}'")
+def _process_chunk(bucket: storage.Bucket, index: ProcessedIndex, result: BatchResult, emails: List[tuple]):
+    """Extraktion, Matching und DB/Antwort für einen Abschnitt des Sweeps (in Listen-Reihenfolge).
 
-        # Ebene 1: Case-Tag-Matching
-        if case_short:
-            pending_case = find_pending_by_case_tag(case_short)
-            if pending_case:
-                print(f"DEBUG: Found pending by case-tag: {pending_case['case_id']}")
-
-        # Ebene 2: Sender-Matching  
-        if not pending_case:
-            print(f"DEBUG: No case-tag match, trying sender matching for {from_addr}")
-            pending_case = find_pending_by_sender(from_addr)
-            if pending_case:
-                print(f"DEBUG: Found pending by sender: {pending_case['case_id']}")
-
-        # Ebene 3: Name-Matching
-        if not pending_case:
-            extracted_name = (extracted.get("name") or "").strip() if extracted else ""
-            email_name = extract_name_from_email(from_addr)
-            print(f"DEBUG: Trying name matching - extracted: '{extracted_name}', from email: '{email_name}'")
-            
-            if extracted_name:
-                pending_case = find_pending_by_name(extracted_name)
-                if pending_case:
-                    print(f"DEBUG: Found pending by name matching: {pending_case['case_id']}")
-            elif email_name:
-                pending_case = find_pending_by_name(email_name) 
-                if pending_case:
-                    print(f"DEBUG: Found pending by email-name matching: {pending_case['case_id']}")
-
-        if pending_case:
-            # Bestehenden Case aktualisieren
-            old_data = json.loads(pending_case.get("raw_data", "{}")) if pending_case.get("raw_data") else {}
-            merged = merge_missing(old_data, extracted)
-            
-            if is_complete(merged, REQ_FIELDS):
-                # Case vervollständigen
-                ok = create_database_entry(merged, from_addr, subject)
-                complete_pending_case(pending_case["case_id"])
-                sub, body_mail = compose_reply(subject, [])
-                if send_email(from_addr, sub, body_mail):
-                    mark_responded(bucket, raw_name)
-                print(f"INFO: Case {pending_case['case_id']} abgeschlossen (DB gespeichert).")
-            else:
-                # Partielles Update
-                update_pending_case(pending_case["case_id"], merged)
-                sub, body_mail = compose_reply(f"[PEAR-{pending_case['case_tag']}] – {subject or ''}".strip(), merged["missing"])
-                if send_email(from_addr, sub, body_mail):
-                    mark_responded(bucket, raw_name)
-                print(f"INFO: Case {pending_case['case_id']} aktualisiert (fehlend: {merged['missing']}).")
-            continue
+    Alle DB-Zeilen und Antworten des Abschnitts gehen in eine Transaktion; sie wird vor dem nächsten
+    Abschnitt geschrieben, damit dessen CaseResolver die neuen Fälle schon in der DB findet.
+    """
+    # Extraktion in Batches parallel (max. GEMINI_CONCURRENCY Requests, Cache-Treffer ohne API-Call),
+    # Matching/DB/Antwort strikt in Listen-Reihenfolge
+    # Lokal vollständig erkannte E-Mails brauchen keinen Gemini-Call
+    with result.stage("extract"):
+        texts = []
+        for raw_name, _, _, subject, _, body in emails:
+            text, saved = extraction_text(subject, body)
+            if saved:
+                print(f"INFO: {raw_name}: Zitierter Verlauf entfernt (≈ {saved} Tokens gespart)")
+                result.reply_tokens_saved += saved
+            texts.append(text)
+        locals_ = [pre_extract(t) for t in texts]
+        need_llm = [i for i, local in enumerate(locals_) if not is_locally_complete(local)]
+        budget = GeminiBudget(gemini_budget_remaining()) if need_llm else None
+        with ThreadPoolExecutor(max_workers=max(1, GEMINI_CONCURRENCY), thread_name_prefix="gemini") as pool:
+            slots = [None] * len(emails)  # pro E-Mail: (Future des Batches, Position im Batch) oder None
+            for batch in plan_extraction_batches([texts[i] for i in need_llm]):
+                members = [need_llm[j] for j in batch]
+                fut = pool.submit(call_gemini_batch, [texts[i] for i in members], budget)
+                for pos, i in enumerate(members):
+                    slots[i] = (fut, pos)
+            extractions = []  # pro E-Mail: (extracted, source) oder None (verschoben)
+            for i in range(len(emails)):
+                llm = slots[i][0].result()[slots[i][1]] if slots[i] else None
+                extractions.append(None if isinstance(llm, ExtractionDeferred) else combine_extraction(locals_[i], llm))
 
-        # Prüfe ob Kunde bereits existiert (Duplikats-Check)
-        extracted_name = (extracted.get("name") or "").strip() if extracted else ""
-        extracted_email = (extracted.get("email") or "").strip() if extracted else ""
-        
-        if extracted_name or extracted_email:
-            existing_customer = find_existing_customer(extracted_name, extracted_email)
-            if existing_customer:
-                # Kunde bereits vorhanden - sende Bestätigungs-E-Mail
-                sub, body_mail = compose_duplicate_reply(
-                    subject, 
-                    existing_customer["kunden_id"], 
-                    existing_customer["name_vollstaendig"]
-                )
-                if send_email(from_addr, sub, body_mail):
-                    mark_responded(bucket, raw_name)
-                print(f"INFO: Duplikat erkannt - Kunde {existing_customer['name_vollstaendig']} (ID: {existing_customer['kunden_id']}) bereits vorhanden")
-                continue
-        
-        # Neuen Case erstellen
-        case_id = str(uuid.uuid4())
-        
-        if is_complete(extracted, REQ_FIELDS):
-            # Vollständiger Case - direkt in Kundentabelle
-            ok = create_database_entry(extracted, from_addr, subject)
-            sub, body_mail = compose_reply(subject, [])
-            if send_email(from_addr, sub, body_mail):
-                mark_responded(bucket, raw_name)
-            print(f"INFO: Complete (sofort) angelegt und abgeschlossen: {case_id}")
-        else:
-            # Unvollständiger Case - in Pending-Tabelle
-            save_pending_to_db(case_id, raw_name, subject, from_addr, extracted)
-            case_tag = case_id[:8]
-            sub, body_mail = compose_reply(f"[PEAR-{case_tag}] – {subject or ''}".strip(), extracted["missing"])
-            if send_email(from_addr, sub, body_mail):
-                mark_responded(bucket, raw_name)
-            print(f"INFO: Pending angelegt: {case_id} (fehlend: {extracted['missing']})")
+    uow = new_case_writer()
+    try:
+        with result.stage("match"):
+            # Matching-Kandidaten des Abschnitts mit zwei Abfragen vorladen (statt bis zu fünf pro E-Mail)
+            with _COMMIT_LOCK:
+                resolver = CaseResolver.for_emails([
+                    (subject, from_addr, body, ex[0] if ex and isinstance(ex[0], dict) else None)
+                    for (_, _, _, subject, from_addr, body), ex in zip(emails, extractions)])
+            for (raw_name, created_ts, raw, subject, from_addr, body), ex in zip(emails, extractions):
+                if ex is None:
+                    result.deferred += 1
+                    continue
+                extracted, source = ex
+                _commit_email(bucket, index, raw_name, created_ts, raw, subject, from_addr, body,
+                              extracted, result, source, resolver, uow)
+    finally:
+        # Auch bei Abbruch: bereits Verarbeitetes schreiben
+        with result.stage("persist"):
+            _flush_writes(uow)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,204 @@
+"""
+db_pool.py — PEARv2.2
+Gemeinsamer MySQL-Connection-Pool für die Ingest-Pipeline.
+
+- Verbindungen werden lazy aufgebaut (max. DB_POOL_SIZE) und nach Gebrauch wiederverwendet.
+- Health-Check: War eine Verbindung länger als DB_POOL_PING_AFTER Sekunden ungenutzt,
+  wird sie vor der Ausgabe angepingt; tote Verbindungen werden verworfen und neu aufgebaut.
+- Zähler pro Lauf: Pool-Hits (wiederverwendet) vs. neue Verbindungen, Reconnects, Wartezeiten.
+- Metriken (metrics.py): Wartezeit auf einen Slot, Belegungsdauer und Fehler je op – connection(op)
+  benennt den DB-Helper, damit /metrics zeigt, welcher Zugriff Zeit kostet.
+
+ENV:
+  DB_HOST, DB_PORT=3306, DB_USER, DB_PASSWORD, DB_NAME
+  DB_POOL_SIZE=5, DB_POOL_TIMEOUT=10, DB_POOL_PING_AFTER=30, DB_CONNECT_TIMEOUT=10
+"""
+
+import os
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+import mysql.connector
+from mysql.connector import Error
+
+import metrics
+
+POOL_WAIT_SECONDS = metrics.histogram("pear_db_pool_wait_seconds", "Wartezeit auf eine Pool-Verbindung")
+DB_SECONDS = metrics.histogram("pear_db_seconds", "Dauer eines DB-Zugriffs (Verbindung ausgeliehen bis zurückgegeben)", ("op",))
+DB_ERRORS = metrics.counter("pear_db_errors_total", "Fehlgeschlagene DB-Zugriffe", ("op",))
+
+
+class PoolTimeout(Error):
+    """Kein freier Slot im Pool innerhalb von DB_POOL_TIMEOUT."""
+
+
+def db_configured() -> bool:
+    """True, wenn alle DB-Variablen gesetzt sind."""
+    return all([os.getenv("DB_HOST"), os.getenv("DB_USER"), os.getenv("DB_PASSWORD"), os.getenv("DB_NAME")])
+
+
+class ConnectionPool:
+    def __init__(self, size: int = 5, timeout: float = 10.0, ping_after: float = 30.0, **conn_args):
+        self.size = max(1, size)
+        self.timeout = timeout
+        self.ping_after = ping_after
+        self._conn_args = conn_args
+        self._idle = deque()  # (conn, zuletzt_benutzt)
+        self._open = 0
+        self._cond = threading.Condition()
+        self._stats = {"hits": 0, "new": 0, "reconnects": 0, "discarded": 0, "waits": 0}
+
+    def _count(self, key: str):
+        with self._cond:
+            self._stats[key] += 1
+
+    def _connect(self):
+        return mysql.connector.connect(**self._conn_args)
+
+    def _acquire(self):
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            while True:
+                if self._idle:
+                    # LIFO: die zuletzt benutzte (wärmste) Verbindung zuerst
+                    conn, last_used = self._idle.pop()
+                    break
+                if self._open < self.size:
+                    self._open += 1
+                    conn, last_used = None, None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeout(msg=f"Kein freier DB-Slot nach {self.timeout}s (Pool-Größe {self.size})")
+                self._stats["waits"] += 1
+                self._cond.wait(remaining)
+
+        if conn is not None and time.monotonic() - last_used >= self.ping_after:
+            try:
+                conn.ping(reconnect=False)
+            except Exception:
+                self._close_quietly(conn)
+                conn = None
+                self._count("reconnects")
+
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._open -= 1
+                    self._cond.notify()
+                raise
+            self._count("new")
+        else:
+            self._count("hits")
+        return conn
+
+    def _release(self, conn, suspect: bool = False):
+        healthy = True
+        try:
+            if suspect and not conn.is_connected():
+                healthy = False
+            elif conn.in_transaction:
+                conn.rollback()
+        except Exception:
+            healthy = False
+
+        with self._cond:
+            if healthy:
+                self._idle.append((conn, time.monotonic()))
+            else:
+                self._open -= 1
+                self._stats["discarded"] += 1
+            self._cond.notify()
+        if not healthy:
+            self._close_quietly(conn)
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    @contextmanager
+    def connection(self, op: str = "other"):
+        """Leiht eine Verbindung aus; offene Transaktionen werden bei Rückgabe zurückgerollt."""
+        started = time.perf_counter()
+        try:
+            conn = self._acquire()
+        except Exception:
+            DB_ERRORS.inc(op=op)
+            raise
+        POOL_WAIT_SECONDS.observe(time.perf_counter() - started)
+        suspect = False
+        try:
+            yield conn
+        except Exception:
+            suspect = True
+            DB_ERRORS.inc(op=op)
+            raise
+        finally:
+            self._release(conn, suspect=suspect)
+            DB_SECONDS.observe(time.perf_counter() - started, op=op)
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            out = dict(self._stats)
+            out["open"] = self._open
+            out["idle"] = len(self._idle)
+        return out
+
+    def reset_stats(self):
+        with self._cond:
+            for k in self._stats:
+                self._stats[k] = 0
+
+    def close_all(self):
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._open -= len(idle)
+        for conn, _ in idle:
+            self._close_quietly(conn)
+
+
+_POOL: Optional[ConnectionPool] = None
+_POOL_LOCK = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """Liefert den prozessweiten Pool (wird beim ersten Zugriff aus den ENV-Variablen gebaut)."""
+    global _POOL
+    if _POOL is None:
+        with _POOL_LOCK:
+            if _POOL is None:
+                _POOL = ConnectionPool(
+                    size=int(os.getenv("DB_POOL_SIZE", "5")),
+                    timeout=float(os.getenv("DB_POOL_TIMEOUT", "10")),
+                    ping_after=float(os.getenv("DB_POOL_PING_AFTER", "30")),
+                    host=os.getenv("DB_HOST"),
+                    port=int(os.getenv("DB_PORT", "3306")),
+                    user=os.getenv("DB_USER"),
+                    password=os.getenv("DB_PASSWORD"),
+                    database=os.getenv("DB_NAME"),
+                    connection_timeout=int(os.getenv("DB_CONNECT_TIMEOUT", "10")),
+                )
+    return _POOL
+
+
+def connection(op: str = "other"):
+    """Kurzform für get_pool().connection(); op = Name des Zugriffs für die Metriken."""
+    return get_pool().connection(op)
+
+
+def pool_stats() -> Dict[str, int]:
+    return get_pool().stats() if _POOL is not None else {}
+
+
+def reset_pool_stats():
+    if _POOL is not None:
+        _POOL.reset_stats()
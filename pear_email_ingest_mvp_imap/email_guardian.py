@@ -14,31 +14,38 @@ Features:
 import os
 import time
 import json
+import atexit
+import threading
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple
 from dataclasses import dataclass
 from dotenv import load_dotenv
-import mysql.connector
 from mysql.connector import Error
 
+import db_pool
+
 load_dotenv()
 
 # Guardian Configuration
+# Volume/SMTP limits block processing until the window has passed (GUARDIAN_ENFORCE_LIMITS=false: warn only).
+# Backlog mail - delivered to the mailbox more than GUARDIAN_BACKLOG_AGE seconds before ingest - is counted
+# separately and does not count against the per-minute/hour volume limits
 MAX_EMAILS_PER_MINUTE = int(os.getenv('MAX_EMAILS_PER_MINUTE', '10'))
 MAX_EMAILS_PER_HOUR = int(os.getenv('MAX_EMAILS_PER_HOUR', '100'))  
 MAX_PENDING_CASES = int(os.getenv('MAX_PENDING_CASES', '500'))
 MAX_DAILY_GEMINI_CALLS = int(os.getenv('MAX_DAILY_GEMINI_CALLS', '1000'))
 MAX_DAILY_SMTP_SENDS = int(os.getenv('MAX_DAILY_SMTP_SENDS', '200'))
+GUARDIAN_ENFORCE_LIMITS = os.getenv('GUARDIAN_ENFORCE_LIMITS', 'true').lower() == 'true'
+GUARDIAN_BACKLOG_AGE = int(os.getenv('GUARDIAN_BACKLOG_AGE', '3600'))
 
 EMERGENCY_LOCKDOWN_FILE = "emergency_lockdown.flag"
 GUARDIAN_LOG_FILE = "email_guardian.log"
-
-# Database connection
-DB_HOST = os.getenv("DB_HOST")
-DB_PORT = int(os.getenv("DB_PORT", "3306"))
-DB_USER = os.getenv("DB_USER")
-DB_PASSWORD = os.getenv("DB_PASSWORD")
-DB_NAME = os.getenv("DB_NAME")
+# Usage counters (emails, Gemini calls, SMTP sends) are shared by all processes via tbl_guardian_usage
+GUARDIAN_PERSIST_INTERVAL = float(os.getenv('GUARDIAN_PERSIST_INTERVAL', '5'))
+GUARDIAN_USAGE_READ_TTL = float(os.getenv('GUARDIAN_USAGE_READ_TTL', '5'))
+SUSPICIOUS_SENDER_PER_HOUR = int(os.getenv('SUSPICIOUS_SENDER_PER_HOUR', '5'))
+# guardian_check results are reused for this many seconds (status polling, per-email push checks)
+GUARDIAN_CACHE_TTL = float(os.getenv('GUARDIAN_CACHE_TTL', '10'))
 
 @dataclass
 class EmailStats:
@@ -50,6 +57,7 @@ class EmailStats:
     gemini_calls_today: int
     smtp_sends_today: int
     suspicious_patterns: List[str]
+    backlog_emails_today: int = 0
 
 @dataclass
 class GuardianResult:
@@ -59,9 +67,300 @@ class GuardianResult:
     action: str
     stats: EmailStats
 
-class EmailGuardian:
+class SlidingWindow:
+    """Event count over the last `span` seconds, kept in a ring of `slots` buckets (O(1) add/total)"""
+    def __init__(self, span: int, slots: int):
+        self.width = span / slots
+        self.counts = [0] * slots
+        self.head = -1          # absolute bucket number of the newest slot
+        self.count = 0
+
+    def _advance(self, now: float) -> int:
+        slot = int(now // self.width)
+        if slot > self.head:
+            n = len(self.counts)
+            if slot - self.head >= n:
+                self.counts = [0] * n
+                self.count = 0
+            else:
+                for s in range(self.head + 1, slot + 1):
+                    self.count -= self.counts[s % n]
+                    self.counts[s % n] = 0
+            self.head = slot
+        return slot
+
+    def add(self, now: float, n: int = 1):
+        slot = self._advance(now)
+        self.counts[slot % len(self.counts)] += n
+        self.count += n
+
+    def total(self, now: float) -> int:
+        self._advance(now)
+        return self.count
+
+class DayCounter:
+    """Event count for the current calendar day (daily quotas reset at midnight)"""
     def __init__(self):
+        self.day = None
+        self.count = 0
+
+    def _roll(self, now: float):
+        day = datetime.fromtimestamp(now).date().isoformat()
+        if day != self.day:
+            self.day = day
+            self.count = 0
+
+    def add(self, now: float, n: int = 1):
+        self._roll(now)
+        self.count += n
+
+    def total(self, now: float) -> int:
+        self._roll(now)
+        return self.count
+
+class WindowSet:
+    """Minute / hour / day counters for one event type or sender"""
+    def __init__(self):
+        self.minute = SlidingWindow(60, 60)
+        self.hour = SlidingWindow(3600, 60)
+        self.day = DayCounter()
+
+    def add(self, now: float, n: int = 1):
+        for w in (self.minute, self.hour, self.day):
+            w.add(now, n)
+
+    def totals(self, now: float) -> Dict[str, int]:
+        return {"minute": self.minute.total(now), "hour": self.hour.total(now), "day": self.day.total(now)}
+
+class UsageCounters:
+    """Event counters (emails, Gemini calls, SMTP sends; emails also per sender), shared via MySQL.
+
+    Every process (Flask server, CLI scripts, further instances) adds its events to tbl_guardian_usage as
+    per-minute deltas at most every GUARDIAN_PERSIST_INTERVAL seconds and at exit, so all of them see
+    the same windows. Reads use one aggregated query, reused for GUARDIAN_USAGE_READ_TTL seconds, plus the
+    deltas this process has not written yet. Minute/hour totals are sliding estimates (the oldest
+    minute is weighted by how much of it is still inside the window).
+
+    Without a DB (local development) the counts stay in memory for this process only.
+    """
+    def __init__(self, persist_interval: float = GUARDIAN_PERSIST_INTERVAL,
+                 read_ttl: float = GUARDIAN_USAGE_READ_TTL, use_db: Optional[bool] = None):
+        self.persist_interval = persist_interval
+        self.read_ttl = read_ttl
+        self.use_db = db_pool.db_configured() if use_db is None else use_db
+        self._lock = threading.Lock()
+        # In-memory windows: the only source without DB
+        self._events: Dict[str, WindowSet] = {}
+        self._senders: Dict[str, WindowSet] = {}
+        self._hot: Dict[str, None] = {}   # senders at/over the suspicious threshold
+        # DB mode: unwritten deltas and the last aggregated read
+        self._pending: Dict[Tuple[str, str, int], int] = {}
+        self._last_flush = time.time()
+        self._last_prune = 0.0
+        self._read: Optional[Tuple[float, Dict[str, Dict[str, int]], List[Tuple[str, int]]]] = None
+
+    @staticmethod
+    def _sender_key(sender: Optional[str]) -> str:
+        return (sender or "").strip().lower()
+
+    def record(self, event: str, sender: Optional[str] = None, n: int = 1):
+        now = time.time()
+        key = self._sender_key(sender)
+        with self._lock:
+            if self.use_db:
+                minute = int(now // 60)
+                for who in ([""] + ([key] if key else [])):
+                    self._pending[(event, who, minute)] = self._pending.get((event, who, minute), 0) + n
+                due = now - self._last_flush >= self.persist_interval
+            else:
+                self._events.setdefault(event, WindowSet()).add(now, n)
+                if key:
+                    ws = self._senders.setdefault(key, WindowSet())
+                    ws.add(now, n)
+                    if ws.hour.total(now) >= SUSPICIOUS_SENDER_PER_HOUR:
+                        self._hot[key] = None
+                due = False
+        if due:
+            self.flush()
+
+    # ---- DB mode ----
+    @staticmethod
+    def _window_bounds(now: float) -> Tuple[int, float, int]:
+        """(current minute, share of the oldest minute still inside the window, first minute of today)"""
+        minute = int(now // 60)
+        day_start = datetime.fromtimestamp(now).replace(hour=0, minute=0, second=0, microsecond=0)
+        return minute, 1.0 - (now % 60) / 60, int(day_start.timestamp() // 60)
+
+    @staticmethod
+    def _sum_windows(rows, now: float) -> Dict[str, float]:
+        """rows: (minute, count) → minute/hour/day totals as sliding estimates"""
+        minute, edge, day_start = UsageCounters._window_bounds(now)
+        totals = {"minute": 0.0, "hour": 0.0, "day": 0.0}
+        for m, count in rows:
+            if m == minute:
+                totals["minute"] += count
+            elif m == minute - 1:
+                totals["minute"] += count * edge
+            if minute - 59 <= m <= minute:
+                totals["hour"] += count
+            elif m == minute - 60:
+                totals["hour"] += count * edge
+            if day_start <= m <= minute:
+                totals["day"] += count
+        return totals
+
+    def _query(self, now: float) -> Tuple[Dict[str, Dict[str, int]], List[Tuple[str, int]]]:
+        """One aggregated read: global totals per event + senders over the suspicious threshold"""
+        minute, edge, day_start = self._window_bounds(now)
+        since = min(minute - 60, day_start)
+        events: Dict[str, Dict[str, float]] = {}
+        with db_pool.connection("guardian_usage_read") as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT event, minute, count FROM tbl_guardian_usage
+                WHERE sender = '' AND minute >= %s
+            """, (since,))
+            rows: Dict[str, list] = {}
+            for event, m, count in cur.fetchall():
+                rows.setdefault(event, []).append((int(m), int(count)))
+            for event, event_rows in rows.items():
+                events[event] = self._sum_windows(event_rows, now)
+            cur.execute("""
+                SELECT sender, SUM(count) FROM tbl_guardian_usage
+                WHERE event = 'emails' AND sender <> '' AND minute > %s
+                GROUP BY sender HAVING SUM(count) >= %s
+            """, (minute - 60, SUSPICIOUS_SENDER_PER_HOUR))
+            hot = [(sender, int(count)) for sender, count in cur.fetchall()]
+            cur.close()
+        return {e: {k: int(round(v)) for k, v in t.items()} for e, t in events.items()}, hot
+
+    def _db_view(self) -> Tuple[Dict[str, Dict[str, int]], List[Tuple[str, int]]]:
+        now = time.time()
+        with self._lock:
+            cached = self._read
+        if cached is None or now - cached[0] >= self.read_ttl:
+            if now - self._last_flush >= self.persist_interval:
+                self.flush()
+            try:
+                events, hot = self._query(now)
+            except Error as e:
+                print(f"WARNING: Guardian-Zähler nicht lesbar ({e}) – verwende letzten Stand.")
+                events, hot = (cached[1], cached[2]) if cached else ({}, [])
+            cached = (now, events, hot)
+            with self._lock:
+                self._read = cached
+        return cached[1], cached[2]
+
+    def _unflushed(self, event: str, sender: str) -> Dict[str, int]:
+        with self._lock:
+            rows = [(m, c) for (e, s, m), c in self._pending.items() if e == event and s == sender]
+        return {k: int(round(v)) for k, v in self._sum_windows(rows, time.time()).items()}
+
+    def flush(self):
+        """Write this process' deltas (one upsert per batch) and drop minutes older than two days"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = now = time.time()
+        if not (self.use_db and pending):
+            return
+        try:
+            with db_pool.connection("guardian_usage_write") as conn:
+                cur = conn.cursor()
+                cur.executemany("""
+                    INSERT INTO tbl_guardian_usage (event, sender, minute, count) VALUES (%s, %s, %s, %s)
+                    ON DUPLICATE KEY UPDATE count = count + VALUES(count)
+                """, [(e, s, m, c) for (e, s, m), c in pending.items()])
+                if now - self._last_prune >= 3600:
+                    cur.execute("DELETE FROM tbl_guardian_usage WHERE minute < %s", (int(now // 60) - 2 * 1440,))
+                    self._last_prune = now
+                conn.commit()
+                cur.close()
+        except Error as e:
+            # Counting must never break processing: keep the deltas for the next attempt
+            print(f"WARNING: Guardian-Zähler nicht gespeichert ({e}) – neuer Versuch beim nächsten Flush.")
+            with self._lock:
+                for k, c in pending.items():
+                    self._pending[k] = self._pending.get(k, 0) + c
+            return
+        with self._lock:
+            self._read = None  # the cached read does not contain these deltas yet
+
+    # ---- Reads ----
+    def totals(self, event: str) -> Dict[str, int]:
+        if self.use_db:
+            events, _ = self._db_view()
+            shared = events.get(event, {})
+            local = self._unflushed(event, "")
+            return {k: shared.get(k, 0) + local[k] for k in ("minute", "hour", "day")}
+        now = time.time()
+        with self._lock:
+            ws = self._events.get(event)
+            return ws.totals(now) if ws else {"minute": 0, "hour": 0, "day": 0}
+
+    def hot_senders(self) -> List[Tuple[str, int]]:
+        """Senders with >= SUSPICIOUS_SENDER_PER_HOUR emails in the last hour"""
+        if self.use_db:
+            _, hot = self._db_view()
+            return hot
+        now = time.time()
+        out = []
+        with self._lock:
+            for sender in list(self._hot):
+                ws = self._senders.get(sender)
+                count = ws.hour.total(now) if ws else 0
+                if count >= SUSPICIOUS_SENDER_PER_HOUR:
+                    out.append((sender, count))
+                else:
+                    del self._hot[sender]
+        return out
+
+_USAGE: Optional[UsageCounters] = None
+_USAGE_LOCK = threading.Lock()
+
+def get_usage() -> UsageCounters:
+    """Process-wide usage counters"""
+    global _USAGE
+    with _USAGE_LOCK:
+        if _USAGE is None:
+            _USAGE = UsageCounters()
+            atexit.register(_USAGE.flush)
+        return _USAGE
+
+def is_backlog(delivered_at: Optional[str], now: Optional[datetime] = None) -> bool:
+    """True if the mail reached the mailbox (IMAP INTERNALDATE, UTC ISO) more than GUARDIAN_BACKLOG_AGE seconds ago"""
+    if not delivered_at:
+        return False
+    try:
+        delivered = datetime.fromisoformat(delivered_at[:-1] if delivered_at.endswith("Z") else delivered_at)
+    except ValueError:
+        return False
+    return ((now or datetime.utcnow()) - delivered).total_seconds() > GUARDIAN_BACKLOG_AGE
+
+def record_email(sender: Optional[str], delivered_at: Optional[str] = None):
+    """Count one ingested email (globally and for its sender); backlog mail only in backlog_emails"""
+    if is_backlog(delivered_at):
+        get_usage().record("backlog_emails")
+    else:
+        get_usage().record("emails", sender)
+
+def record_gemini_call():
+    """Count one Gemini API request (every attempt, retries included)"""
+    get_usage().record("gemini_calls")
+
+def record_smtp_send():
+    """Count one successfully sent SMTP message"""
+    get_usage().record("smtp_sends")
+
+class EmailGuardian:
+    def __init__(self, cache_ttl: float = GUARDIAN_CACHE_TTL):
         self.start_time = datetime.now()
+        self.cache_ttl = cache_ttl
+        self._lock = threading.RLock()
+        self._cached: Optional[GuardianResult] = None
+        self._cached_at = 0.0
+        self._lockdown: Optional[dict] = None   # in-memory copy of EMERGENCY_LOCKDOWN_FILE
+        self._lockdown_mtime: Optional[float] = None
+        self._load_lockdown()
         
     def log_guardian_event(self, message: str, level: str = "INFO"):
         """Log guardian events"""
@@ -76,72 +375,61 @@ class EmailGuardian:
         
         print(f"🛡️ GUARDIAN {level}: {message}")
     
-    def get_db_connection(self):
-        """Get database connection"""
-        if not all([DB_HOST, DB_USER, DB_PASSWORD, DB_NAME]):
-            return None
-            
-        try:
-            conn = mysql.connector.connect(
-                host=DB_HOST, port=DB_PORT,
-                user=DB_USER, password=DB_PASSWORD, database=DB_NAME
-            )
-            return conn
-        except Error:
-            return None
-    
     def collect_email_stats(self) -> EmailStats:
         """Collect comprehensive email processing statistics"""
-        now = datetime.now()
-        one_minute_ago = now - timedelta(minutes=1)
-        one_hour_ago = now - timedelta(hours=1)
-        today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-        
-        stats = EmailStats(
-            emails_last_minute=0,
-            emails_last_hour=0, 
-            emails_today=0,
-            pending_cases=0,
-            gemini_calls_today=0,
-            smtp_sends_today=0,
-            suspicious_patterns=[]
-        )
+        stats = self.collect_usage_stats()
         
-        conn = self.get_db_connection()
-        if not conn:
+        if not db_pool.db_configured():
             self.log_guardian_event("Database connection failed - operating in safe mode", "WARNING")
             return stats
             
         try:
-            cursor = conn.cursor()
-            
-            # Count pending cases
-            cursor.execute("SELECT COUNT(*) FROM tbl_onboarding_pending WHERE status = 'PENDING'")
-            result = cursor.fetchone()
-            if result:
-                stats.pending_cases = result[0]
-            
-            # Check for suspicious patterns in recent pending cases
-            cursor.execute("""
-                SELECT source_sender, COUNT(*) as count 
-                FROM tbl_onboarding_pending 
-                WHERE created_at >= %s 
-                GROUP BY source_sender 
-                HAVING count >= 5
-            """, (one_hour_ago,))
-            
-            suspicious_senders = cursor.fetchall()
-            for sender, count in suspicious_senders:
-                stats.suspicious_patterns.append(f"Sender '{sender}': {count} emails in 1 hour")
-            
-            cursor.close()
-            conn.close()
+            with db_pool.connection("guardian_stats") as conn:
+                cursor = conn.cursor()
+                
+                # Count pending cases
+                cursor.execute("SELECT COUNT(*) FROM tbl_onboarding_pending WHERE status = 'PENDING'")
+                result = cursor.fetchone()
+                if result:
+                    stats.pending_cases = result[0]
+                
+                cursor.close()
             
         except Error as e:
             self.log_guardian_event(f"Database query error: {e}", "ERROR")
         
         return stats
     
+    def collect_usage_stats(self) -> EmailStats:
+        """Volume/cost counters from the in-memory sliding windows (no DB access)"""
+        usage = get_usage()
+        emails = usage.totals("emails")
+        stats = EmailStats(
+            emails_last_minute=emails["minute"],
+            emails_last_hour=emails["hour"],
+            emails_today=emails["day"],
+            pending_cases=0,
+            gemini_calls_today=usage.totals("gemini_calls")["day"],
+            smtp_sends_today=usage.totals("smtp_sends")["day"],
+            suspicious_patterns=[],
+            backlog_emails_today=usage.totals("backlog_emails")["day"]
+        )
+        # High volume from a single sender
+        for sender, count in usage.hot_senders():
+            stats.suspicious_patterns.append(f"Sender '{sender}': {count} emails in 1 hour")
+        return stats
+    
+    def check_limits(self, stats: EmailStats) -> List[str]:
+        """Hard limits that block processing until the window has passed"""
+        exceeded = []
+        if stats.emails_last_minute > MAX_EMAILS_PER_MINUTE:
+            exceeded.append(f"{stats.emails_last_minute} emails/minute (max {MAX_EMAILS_PER_MINUTE})")
+        if stats.emails_last_hour > MAX_EMAILS_PER_HOUR:
+            exceeded.append(f"{stats.emails_last_hour} emails/hour (max {MAX_EMAILS_PER_HOUR})")
+        if stats.smtp_sends_today >= MAX_DAILY_SMTP_SENDS:
+            exceeded.append(f"{stats.smtp_sends_today} SMTP sends today (max {MAX_DAILY_SMTP_SENDS})")
+        return exceeded
+    
     def detect_suspicious_patterns(self, stats: EmailStats) -> List[str]:
         """Detect suspicious email patterns"""
         patterns = []
@@ -163,9 +451,26 @@ class EmailGuardian:
         
         return patterns
     
+    def _load_lockdown(self):
+        """Sync the in-memory lockdown state with EMERGENCY_LOCKDOWN_FILE (only re-read when it changed)"""
+        try:
+            mtime = os.stat(EMERGENCY_LOCKDOWN_FILE).st_mtime
+        except OSError:
+            self._lockdown, self._lockdown_mtime = None, None
+            return
+        if mtime == self._lockdown_mtime:
+            return
+        try:
+            with open(EMERGENCY_LOCKDOWN_FILE, 'r') as f:
+                self._lockdown = json.load(f)
+        except Exception:
+            self._lockdown = {"reason": "Unknown"}
+        self._lockdown_mtime = mtime
+    
     def check_emergency_lockdown(self) -> bool:
         """Check if emergency lockdown is active"""
-        return os.path.exists(EMERGENCY_LOCKDOWN_FILE)
+        with self._lock:
+            return self._lockdown is not None
     
     def activate_emergency_lockdown(self, reason: str):
         """Activate emergency lockdown"""
@@ -175,41 +480,48 @@ class EmailGuardian:
             "auto_unlock_after": (datetime.now() + timedelta(hours=1)).isoformat()
         }
         
-        try:
-            with open(EMERGENCY_LOCKDOWN_FILE, 'w') as f:
-                json.dump(lockdown_data, f, indent=2)
+        with self._lock:
+            self._lockdown = lockdown_data
+            self._cached = None
+            try:
+                with open(EMERGENCY_LOCKDOWN_FILE, 'w') as f:
+                    json.dump(lockdown_data, f, indent=2)
+                self._lockdown_mtime = os.stat(EMERGENCY_LOCKDOWN_FILE).st_mtime
+                    
+                self.log_guardian_event(f"🚨 EMERGENCY LOCKDOWN ACTIVATED: {reason}", "CRITICAL")
                 
-            self.log_guardian_event(f"🚨 EMERGENCY LOCKDOWN ACTIVATED: {reason}", "CRITICAL")
-            
-        except Exception as e:
-            self.log_guardian_event(f"Failed to activate lockdown: {e}", "ERROR")
+            except Exception as e:
+                self.log_guardian_event(f"Failed to persist lockdown: {e}", "ERROR")
     
     def deactivate_emergency_lockdown(self):
         """Deactivate emergency lockdown"""
-        try:
-            if os.path.exists(EMERGENCY_LOCKDOWN_FILE):
-                os.remove(EMERGENCY_LOCKDOWN_FILE)
-                self.log_guardian_event("🟢 Emergency lockdown deactivated", "INFO")
-        except Exception as e:
-            self.log_guardian_event(f"Failed to deactivate lockdown: {e}", "ERROR")
+        with self._lock:
+            was_active = self._lockdown is not None
+            self._lockdown, self._lockdown_mtime = None, None
+            self._cached = None
+            try:
+                if os.path.exists(EMERGENCY_LOCKDOWN_FILE):
+                    os.remove(EMERGENCY_LOCKDOWN_FILE)
+                if was_active:
+                    self.log_guardian_event("🟢 Emergency lockdown deactivated", "INFO")
+            except Exception as e:
+                self.log_guardian_event(f"Failed to deactivate lockdown: {e}", "ERROR")
     
     def check_auto_unlock(self):
         """Check if emergency lockdown should be auto-unlocked"""
-        if not self.check_emergency_lockdown():
-            return
-            
-        try:
-            with open(EMERGENCY_LOCKDOWN_FILE, 'r') as f:
-                lockdown_data = json.load(f)
-            
-            auto_unlock_time = datetime.fromisoformat(lockdown_data.get("auto_unlock_after", ""))
-            
-            if datetime.now() > auto_unlock_time:
-                self.deactivate_emergency_lockdown()
-                self.log_guardian_event("Auto-unlock successful", "INFO")
+        with self._lock:
+            if self._lockdown is None:
+                return
+                
+            try:
+                auto_unlock_time = datetime.fromisoformat(self._lockdown.get("auto_unlock_after", ""))
                 
-        except Exception as e:
-            self.log_guardian_event(f"Auto-unlock check failed: {e}", "ERROR")
+                if datetime.now() > auto_unlock_time:
+                    self.deactivate_emergency_lockdown()
+                    self.log_guardian_event("Auto-unlock successful", "INFO")
+                    
+            except Exception as e:
+                self.log_guardian_event(f"Auto-unlock check failed: {e}", "ERROR")
     
     def evaluate_threat_level(self, stats: EmailStats) -> str:
         """Evaluate current threat level"""
@@ -224,27 +536,41 @@ class EmailGuardian:
         else:
             return "NORMAL"
     
-    def guardian_check(self) -> GuardianResult:
-        """Main guardian check - the 'Spion' function"""
+    def guardian_check(self, max_age: Optional[float] = None) -> GuardianResult:
+        """Main guardian check - the 'Spion' function
+
+        Returns the last evaluation while it is younger than `max_age` (default: cache_ttl) seconds.
+        Lockdown changes invalidate the cached result immediately.
+        """
+        max_age = self.cache_ttl if max_age is None else max_age
+        with self._lock:
+            if self._cached is not None and time.monotonic() - self._cached_at < max_age:
+                return self._cached
+            result = self._evaluate()
+            self._cached, self._cached_at = result, time.monotonic()
+            return result
+    
+    def invalidate(self):
+        """Force a fresh evaluation on the next guardian_check"""
+        with self._lock:
+            self._cached = None
+    
+    def _evaluate(self) -> GuardianResult:
         self.log_guardian_event("🕵️‍♂️ Starting guardian patrol...")
         
-        # Check auto-unlock first
+        # Pick up lockdowns set/cleared by other processes, then check auto-unlock
+        self._load_lockdown()
         self.check_auto_unlock()
         
         # Check emergency lockdown
-        if self.check_emergency_lockdown():
-            try:
-                with open(EMERGENCY_LOCKDOWN_FILE, 'r') as f:
-                    lockdown_data = json.load(f)
-                reason = lockdown_data.get("reason", "Unknown")
-                return GuardianResult(
-                    allow_processing=False,
-                    reason=f"Emergency lockdown active: {reason}",
-                    action="BLOCKED",
-                    stats=EmailStats(0, 0, 0, 0, 0, 0, [])
-                )
-            except Exception:
-                pass
+        if self._lockdown is not None:
+            reason = self._lockdown.get("reason", "Unknown")
+            return GuardianResult(
+                allow_processing=False,
+                reason=f"Emergency lockdown active: {reason}",
+                action="BLOCKED",
+                stats=self.collect_usage_stats()
+            )
         
         # Collect current statistics
         stats = self.collect_email_stats()
@@ -266,6 +592,20 @@ class EmailGuardian:
                 stats=stats
             )
         
+        # Rate/cost limits - block processing until the window has passed
+        exceeded = self.check_limits(stats)
+        if exceeded and not GUARDIAN_ENFORCE_LIMITS:
+            self.log_guardian_event(f"Limits exceeded (GUARDIAN_ENFORCE_LIMITS=false): {', '.join(exceeded)}", "WARNING")
+        elif exceeded:
+            reason = f"Rate limit exceeded: {', '.join(exceeded)}"
+            self.log_guardian_event(reason, "WARNING")
+            return GuardianResult(
+                allow_processing=False,
+                reason=reason,
+                action="TEMPORARY_BLOCK",
+                stats=stats
+            )
+        
         # High threat - block processing temporarily
         if threat_level == "HIGH":
             return GuardianResult(
@@ -286,9 +626,20 @@ class EmailGuardian:
             stats=stats
         )
 
+_GUARDIAN: Optional[EmailGuardian] = None
+_GUARDIAN_LOCK = threading.Lock()
+
+def get_guardian() -> EmailGuardian:
+    """Process-wide guardian (shares cached evaluation and lockdown state)"""
+    global _GUARDIAN
+    with _GUARDIAN_LOCK:
+        if _GUARDIAN is None:
+            _GUARDIAN = EmailGuardian()
+        return _GUARDIAN
+
 def main():
     """Test the Guardian system"""
-    guardian = EmailGuardian()
+    guardian = get_guardian()
     result = guardian.guardian_check()
     
     print(f"🛡️ Guardian Result:")
@@ -0,0 +1,154 @@
+"""
+extraction_cache.py — PEARv2.2
+Content-adressierter Cache vor call_gemini.
+
+- Key: SHA-256 über normalisierten Body + GEMINI_MODEL + Prompt-Version (Hash von Modell, BASE_INSTR und
+  BATCH_INSTR – jedes Template, über das ein gecachtes Ergebnis entstehen kann).
+- L1: In-Process-LRU (EXTRACTION_CACHE_SIZE Einträge).
+- L2: tbl_email_processing (email_hash UNIQUE, extracted_data JSON), gültig für EXTRACTION_CACHE_TTL_HOURS.
+- Treffer überspringen den API-Call komplett und werden gezählt (Stats pro Lauf).
+
+ENV:
+  EXTRACTION_CACHE_SIZE=1000 (0 = kein LRU), EXTRACTION_CACHE_TTL_HOURS=720 (0 = keine DB-Ablage)
+"""
+
+import copy
+import hashlib
+import json
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import db_pool
+
+_WS_RE = re.compile(r"[ \t\u00a0]+")
+_TRAILING_WS_RE = re.compile(r"[ \t]+\n")
+_MANY_NL_RE = re.compile(r"\n{3,}")
+
+
+def normalize_body(body: str) -> str:
+    """Normalisiert Whitespace/Zeilenenden, damit fast identische Bodies denselben Key bekommen."""
+    text = unicodedata.normalize("NFC", body or "")
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    text = _WS_RE.sub(" ", text)
+    text = _TRAILING_WS_RE.sub("\n", text)
+    text = _MANY_NL_RE.sub("\n\n", text)
+    return text.strip()
+
+
+def prompt_version(*parts: str) -> str:
+    """Kurzer Hash über Modell und alle Prompt-Templates – jede Änderung invalidiert den Cache."""
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part.encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()[:12]
+
+
+class ExtractionCache:
+    def __init__(self, model: str, prompt_version: str, size: int = 1000, ttl_hours: int = 720):
+        self.model = model
+        self.prompt_version = prompt_version
+        self.size = max(0, size)
+        self.ttl_hours = max(0, ttl_hours)
+        self._lru: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "db_hits": 0, "misses": 0, "stores": 0}
+
+    def key(self, body: str) -> str:
+        h = hashlib.sha256()
+        for part in (self.model, self.prompt_version, normalize_body(body)):
+            h.update(part.encode("utf-8"))
+            h.update(b"\x00")
+        return h.hexdigest()
+
+    def _count(self, key: str):
+        with self._lock:
+            self._stats[key] += 1
+
+    def _remember(self, key: str, data: Dict[str, Any]):
+        if not self.size:
+            return
+        with self._lock:
+            self._lru[key] = data
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.size:
+                self._lru.popitem(last=False)
+
+    def get(self, body: str) -> Optional[Dict[str, Any]]:
+        """Liefert eine Kopie des gecachten Ergebnisses oder None."""
+        key = self.key(body)
+        with self._lock:
+            data = self._lru.get(key)
+            if data is not None:
+                self._lru.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return copy.deepcopy(data)
+
+        data = self._db_get(key)
+        if data is not None:
+            self._count("db_hits")
+            self._remember(key, data)
+            return copy.deepcopy(data)
+
+        self._count("misses")
+        return None
+
+    def put(self, body: str, data: Dict[str, Any]):
+        key = self.key(body)
+        stored = copy.deepcopy(data)
+        self._remember(key, stored)
+        self._db_put(key, stored)
+        self._count("stores")
+
+    def _db_get(self, key: str) -> Optional[Dict[str, Any]]:
+        if not (self.ttl_hours and db_pool.db_configured()):
+            return None
+        try:
+            with db_pool.connection("cache_get") as conn:
+                cur = conn.cursor()
+                cur.execute("""
+                    SELECT extracted_data FROM tbl_email_processing
+                    WHERE email_hash = %s AND status = 'extracted'
+                    AND processed_at >= NOW() - INTERVAL %s HOUR
+                """, (key, self.ttl_hours))
+                row = cur.fetchone()
+                cur.close()
+        except Exception as e:
+            print(f"ERROR: DB-Fehler beim Lesen des Extraktions-Caches: {e}")
+            return None
+        if not row or row[0] is None:
+            return None
+        try:
+            data = json.loads(row[0]) if isinstance(row[0], (str, bytes, bytearray)) else row[0]
+        except ValueError:
+            return None
+        return data if isinstance(data, dict) else None
+
+    def _db_put(self, key: str, data: Dict[str, Any]):
+        if not (self.ttl_hours and db_pool.db_configured()):
+            return
+        try:
+            with db_pool.connection("cache_put") as conn:
+                cur = conn.cursor()
+                cur.execute("""
+                    INSERT INTO tbl_email_processing (email_hash, status, extracted_data, processed_at)
+                    VALUES (%s, 'extracted', %s, NOW())
+                    ON DUPLICATE KEY UPDATE status = VALUES(status),
+                        extracted_data = VALUES(extracted_data), processed_at = NOW()
+                """, (key, json.dumps(data, ensure_ascii=False)))
+                conn.commit()
+                cur.close()
+        except Exception as e:
+            print(f"ERROR: DB-Fehler beim Schreiben des Extraktions-Caches: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats)
+
+    def reset_stats(self):
+        with self._lock:
+            for k in self._stats:
+                self._stats[k] = 0
@@ -0,0 +1,204 @@
+"""
+gemini_limiter.py — PEARv2.2
+Rate-Limit, Retry und Circuit Breaker für alle Gemini-Requests eines Prozesses.
+
+- Token Bucket: GEMINI_RPM Requests/Minute, Bursts bis GEMINI_BURST; wer länger als
+  GEMINI_RATE_WAIT Sekunden auf einen Token warten müsste, wird zurückgestellt.
+- Retry: 429/5xx/Timeouts werden bis zu GEMINI_MAX_RETRIES mal wiederholt,
+  exponentielles Backoff mit Full Jitter (GEMINI_BACKOFF_BASE .. GEMINI_BACKOFF_MAX Sekunden).
+- Circuit Breaker: nach GEMINI_BREAKER_FAILURES retrybaren Fehlern in Folge ist die API für
+  GEMINI_BREAKER_RESET Sekunden gesperrt; danach ein Probe-Request (half-open).
+- GeminiUnavailable: Aufrufer sollen die E-Mail zurückstellen, nicht als verarbeitet markieren.
+"""
+
+import os
+import random
+import threading
+import time
+from typing import Any, Callable, Optional
+
+try:
+    from google.api_core import exceptions as api_exceptions
+    _RETRYABLE_TYPES = (
+        api_exceptions.TooManyRequests,
+        api_exceptions.ResourceExhausted,
+        api_exceptions.ServiceUnavailable,
+        api_exceptions.InternalServerError,
+        api_exceptions.BadGateway,
+        api_exceptions.GatewayTimeout,
+        api_exceptions.DeadlineExceeded,
+    )
+except Exception:  # google-api-core fehlt: nur Statuscode-/Text-Erkennung
+    _RETRYABLE_TYPES = ()
+
+_RETRYABLE_CODES = {429, 500, 502, 503, 504}
+_RETRYABLE_TEXT = ("429", "resource exhausted", "rate limit", "quota", "unavailable", "deadline exceeded",
+                   "timed out", "timeout", "internal error", "503", "502", "504")
+
+
+class GeminiUnavailable(Exception):
+    """API aktuell nicht nutzbar (Breaker offen, Rate-Limit-Wartezeit oder Retries erschöpft)."""
+
+
+def is_retryable(exc: BaseException) -> bool:
+    if _RETRYABLE_TYPES and isinstance(exc, _RETRYABLE_TYPES):
+        return True
+    code = getattr(exc, "code", None)
+    if isinstance(code, int) and code in _RETRYABLE_CODES:
+        return True
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return True
+    text = str(exc).lower()
+    return any(t in text for t in _RETRYABLE_TEXT)
+
+
+class TokenBucket:
+    def __init__(self, rate_per_sec: float, capacity: int):
+        self.rate = max(rate_per_sec, 1e-6)
+        self.capacity = max(1, capacity)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, timeout: float) -> bool:
+        """Nimmt einen Token; wartet höchstens `timeout` Sekunden."""
+        deadline = time.monotonic() + max(0.0, timeout)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 120.0):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probe_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half_open" if time.monotonic() - self._opened_at >= self.reset_timeout else "open"
+
+    def allow(self) -> bool:
+        """Darf ein Request raus? Im half-open-Zustand genau ein Probe-Request."""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._probe_running:
+                return False
+            self._probe_running = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probe_running = False
+
+    def release_probe(self):
+        """Probe-Request kam nicht zustande (z.B. Rate-Limit) – nächster Aufrufer darf proben."""
+        with self._lock:
+            self._probe_running = False
+
+    def record_failure(self) -> bool:
+        """Zählt einen Fehler; True wenn der Breaker (wieder) offen ist."""
+        with self._lock:
+            self._failures += 1
+            if self._probe_running or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._probe_running = False
+                return True
+            return False
+
+
+class GeminiLimiter:
+    def __init__(self, rpm: float = 60, burst: int = 10, max_retries: int = 4, backoff_base: float = 1.0,
+                 backoff_max: float = 30.0, rate_wait: float = 30.0, breaker_failures: int = 5,
+                 breaker_reset: float = 120.0, on_call: Optional[Callable[[], None]] = None):
+        self.bucket = TokenBucket(rpm / 60.0, burst)
+        self.breaker = CircuitBreaker(breaker_failures, breaker_reset)
+        self.max_retries = max(0, max_retries)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.rate_wait = rate_wait
+        self.on_call = on_call
+        self._stats = {"calls": 0, "retries": 0, "rate_limited": 0, "breaker_rejects": 0, "failures": 0}
+        self._stats_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, on_call: Optional[Callable[[], None]] = None) -> "GeminiLimiter":
+        return cls(
+            rpm=float(os.getenv("GEMINI_RPM", "60")),
+            burst=int(os.getenv("GEMINI_BURST", "10")),
+            max_retries=int(os.getenv("GEMINI_MAX_RETRIES", "4")),
+            backoff_base=float(os.getenv("GEMINI_BACKOFF_BASE", "1.0")),
+            backoff_max=float(os.getenv("GEMINI_BACKOFF_MAX", "30")),
+            rate_wait=float(os.getenv("GEMINI_RATE_WAIT", "30")),
+            breaker_failures=int(os.getenv("GEMINI_BREAKER_FAILURES", "5")),
+            breaker_reset=float(os.getenv("GEMINI_BREAKER_RESET", "120")),
+            on_call=on_call,
+        )
+
+    def _count(self, key: str):
+        with self._stats_lock:
+            self._stats[key] += 1
+
+    def is_open(self) -> bool:
+        return self.breaker.state == "open"
+
+    def call(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Führt einen Gemini-Request mit Rate-Limit, Retry und Breaker aus."""
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                self._count("breaker_rejects")
+                raise GeminiUnavailable("Gemini-API gestört (Circuit Breaker offen)")
+            if not self.bucket.acquire(self.rate_wait):
+                self._count("rate_limited")
+                self.breaker.release_probe()
+                raise GeminiUnavailable(f"Gemini-Rate-Limit: kein Slot innerhalb {self.rate_wait:.0f}s")
+            self._count("calls")
+            if self.on_call:
+                self.on_call()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                if not is_retryable(e):
+                    self.breaker.record_success()  # API erreichbar, Fehler liegt am Request
+                    raise
+                self._count("failures")
+                if self.breaker.record_failure():
+                    raise GeminiUnavailable(f"Gemini-API gestört, Circuit Breaker geöffnet: {e}") from e
+                if attempt >= self.max_retries:
+                    raise GeminiUnavailable(f"Gemini-API nach {attempt + 1} Versuchen nicht erreichbar: {e}") from e
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+                print(f"INFO: Gemini retrybarer Fehler ({e}) – neuer Versuch in {delay:.1f}s")
+                self._count("retries")
+                attempt += 1
+                time.sleep(delay)
+                continue
+            self.breaker.record_success()
+            return result
+
+    def stats(self):
+        with self._stats_lock:
+            out = dict(self._stats)
+        out["breaker"] = self.breaker.state
+        return out
@@ -1,9 +1,24 @@
 import os
+import re
+import sys
+import json
+import time
+import base64
+import quopri
+import ssl
+import select
 import imaplib
+import itertools
 import email
+import threading
+from dataclasses import dataclass, asdict
+from email.parser import BytesHeaderParser
+from typing import Dict, List, Optional, Tuple
 import requests
 from dotenv import load_dotenv
 
+import metrics
+
 load_dotenv()
 
 IMAP_HOST = os.getenv("IMAP_HOST")
@@ -11,82 +26,623 @@ IMAP_PORT = int(os.getenv("IMAP_PORT", "993"))
 IMAP_USER = os.getenv("IMAP_USER")
 IMAP_PASSWORD = os.getenv("IMAP_PASSWORD")
 USE_SSL = os.getenv("IMAP_USE_SSL", "true").lower() == "true"
+IMAP_TIMEOUT = int(os.getenv("IMAP_TIMEOUT", "60"))
+IMAP_MAILBOX = os.getenv("IMAP_MAILBOX", "INBOX")
+# Long-running mode: IDLE is re-issued after IMAP_IDLE_TIMEOUT (RFC 2177: < 29 min),
+# servers without IDLE are polled via NOOP every IMAP_POLL_INTERVAL seconds
+IMAP_IDLE_TIMEOUT = int(os.getenv("IMAP_IDLE_TIMEOUT", "300"))
+IMAP_POLL_INTERVAL = int(os.getenv("IMAP_POLL_INTERVAL", "30"))
+IMAP_FETCH_CHUNK = int(os.getenv("IMAP_FETCH_CHUNK", "100"))
+IMAP_STATE_FILE = os.getenv("IMAP_STATE_FILE", "imap_state.json")
 INGEST_URL = os.getenv("INGEST_URL", "http://localhost:8080/ingest")
+INGEST_BATCH_URL = os.getenv("INGEST_BATCH_URL", INGEST_URL.rstrip("/") + "/batch")
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "50"))
+INGEST_TIMEOUT = int(os.getenv("INGEST_TIMEOUT", "60"))
 SUBJECT_KEYWORDS = [s.strip().lower() for s in os.getenv("SUBJECT_KEYWORDS", "").split(",") if s.strip()]
 
+_UID_RE = re.compile(rb"UID (\d+)")
+_MSG_START_RE = re.compile(rb"^\d+ \(")
+# Prefilter: only these headers + the MIME structure cross the wire before we decide to download
+HEADER_FETCH = '(UID INTERNALDATE BODY.PEEK[HEADER.FIELDS (SUBJECT FROM TO MESSAGE-ID)] BODYSTRUCTURE)'
+HEADER_KEY = 'BODY[HEADER.FIELDS (SUBJECT FROM TO MESSAGE-ID)]'
+
+IMAP_FETCH_SECONDS = metrics.histogram("pear_imap_fetch_seconds", "Duration of one IMAP fetch cycle")
+IMAP_FETCH_ERRORS = metrics.counter("pear_imap_fetch_errors_total", "IMAP fetch cycles aborted by an exception")
+IMAP_MESSAGES = metrics.counter("pear_imap_messages_total", "Messages per fetch outcome", ("result",))
+INGEST_POST_SECONDS = metrics.histogram("pear_ingest_post_seconds", "Duration of a POST to the ingest service", ("endpoint",))
+
+@dataclass
+class FetchResult:
+    """Result of one fetch cycle"""
+    found: int = 0
+    skipped: int = 0
+    posted: int = 0
+    quarantined: int = 0
+    errors: int = 0
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
 def subject_matches(subject: str) -> bool:
     if not SUBJECT_KEYWORDS:
         return True
     if not subject:
         return False
-    
+
     # Dekodiere UTF-8 encoded subjects
     try:
         from email.header import decode_header, make_header
         decoded_subject = str(make_header(decode_header(subject)))
     except:
         decoded_subject = subject
-        
+
     s = decoded_subject.lower()
     return any(k.lower() in s for k in SUBJECT_KEYWORDS)
 
 def connect_imap():
     if USE_SSL:
-        M = imaplib.IMAP4_SSL(IMAP_HOST, IMAP_PORT)
+        M = imaplib.IMAP4_SSL(IMAP_HOST, IMAP_PORT, timeout=IMAP_TIMEOUT)
     else:
-        M = imaplib.IMAP4(IMAP_HOST, IMAP_PORT)
+        M = imaplib.IMAP4(IMAP_HOST, IMAP_PORT, timeout=IMAP_TIMEOUT)
     M.login(IMAP_USER, IMAP_PASSWORD)
     return M
 
-def main():
-    M = connect_imap()
-    M.select("INBOX")
-    typ, data = M.search(None, '(UNSEEN)')
-    if typ != 'OK':
-        print("IMAP search failed", typ, data)
-        return
-    ids = data[0].split()
-    print(f"Found {len(ids)} unseen messages.")
-    for num in ids:
-        typ, msg_data = M.fetch(num, '(RFC822)')
-        if typ != 'OK':
-            continue
-        msg = email.message_from_bytes(msg_data[0][1])
-        subject = msg.get('Subject', '')
-        from_email = email.utils.parseaddr(msg.get('From'))[1] or msg.get('From', '')
-        to_email = email.utils.parseaddr(msg.get('To'))[1] or msg.get('To', '')
+def extract_body_text(msg) -> str:
+    """Extract plain text body"""
+    body_text = ""
+    if msg.is_multipart():
+        for part in msg.walk():
+            ctype = part.get_content_type()
+            cdispo = str(part.get('Content-Disposition'))
+            if ctype == 'text/plain' and 'attachment' not in cdispo:
+                charset = part.get_content_charset() or 'utf-8'
+                body_text += part.get_payload(decode=True).decode(charset, errors='ignore')
+    else:
+        charset = msg.get_content_charset() or 'utf-8'
+        body_text = msg.get_payload(decode=True).decode(charset, errors='ignore')
+    return body_text
+
+_SESSION: Optional[requests.Session] = None
+_SESSION_LOCK = threading.Lock()
+
+def http_session() -> requests.Session:
+    """Shared keep-alive session for all ingest calls"""
+    global _SESSION
+    with _SESSION_LOCK:
+        if _SESSION is None:
+            _SESSION = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=2, pool_maxsize=4)
+            _SESSION.mount("http://", adapter)
+            _SESSION.mount("https://", adapter)
+        return _SESSION
+
+def _post_single(payload: dict) -> Optional[str]:
+    """POST /ingest; returns the ingest status ("ok", "quarantined") or None if not delivered"""
+    try:
+        with INGEST_POST_SECONDS.time(endpoint="single"):
+            resp = http_session().post(INGEST_URL, json=payload, timeout=15)
+        print("POST /ingest:", resp.status_code, resp.text[:300])
+        if not resp.ok:
+            return None
+        try:
+            return resp.json().get("status") or "ok"
+        except ValueError:
+            return "ok"
+    except Exception as e:
+        print("Error posting to ingest:", e)
+        return None
+
+def post_to_ingest(payload: dict) -> bool:
+    return _post_single(payload) is not None
+
+def post_batch_to_ingest(payloads: List[dict]) -> List[Optional[str]]:
+    """POST /ingest/batch; returns the ingest status per payload, None = not delivered
+    (falls back to /ingest on older servers)"""
+    try:
+        with INGEST_POST_SECONDS.time(endpoint="batch"):
+            resp = http_session().post(INGEST_BATCH_URL, json={"messages": payloads}, timeout=INGEST_TIMEOUT)
+        print(f"POST /ingest/batch ({len(payloads)}):", resp.status_code)
+        if resp.status_code in (404, 405):
+            return [_post_single(p) for p in payloads]
+        if not resp.ok:
+            print("Batch ingest failed:", resp.text[:300])
+            return [None] * len(payloads)
+        results = resp.json().get("results") or []
+    except Exception as e:
+        print("Error posting batch to ingest:", e)
+        return [None] * len(payloads)
+    statuses = [results[i].get("status") if i < len(results) else None for i in range(len(payloads))]
+    return [None if s in (None, "error") else s for s in statuses]
 
-        if not subject_matches(subject):
-            print(f"Skip (subject): {subject}")
+def uid_ranges(uids: List[int]) -> str:
+    """Compress UIDs into an IMAP sequence set: [1,2,3,7,9,10] -> '1:3,7,9:10'"""
+    parts = []
+    for uid in sorted(set(uids)):
+        if parts and uid == parts[-1][1] + 1:
+            parts[-1][1] = uid
+        else:
+            parts.append([uid, uid])
+    return ",".join(str(a) if a == b else f"{a}:{b}" for a, b in parts)
+
+def iter_fetch_literals(data):
+    """Yield (uid, literal) pairs from a UID FETCH response (UID may come before or after the literal)"""
+    items = list(data or [])
+    for i, item in enumerate(items):
+        if not isinstance(item, tuple):
             continue
+        m = _UID_RE.search(item[0])
+        if not m and i + 1 < len(items) and isinstance(items[i + 1], bytes):
+            m = _UID_RE.search(items[i + 1])
+        if m:
+            yield int(m.group(1)), item[1]
+
+def _parse_value(buf: bytes, i: int):
+    """Parse one IMAP value (list, quoted string, literal, NIL or atom) starting at buf[i]"""
+    while buf[i:i + 1] == b' ':
+        i += 1
+    c = buf[i:i + 1]
+    if c == b'(':
+        out = []
+        i += 1
+        while True:
+            while buf[i:i + 1] == b' ':
+                i += 1
+            if buf[i:i + 1] == b')':
+                return out, i + 1
+            if i >= len(buf):
+                raise ValueError("unterminated list")
+            value, i = _parse_value(buf, i)
+            out.append(value)
+    if c == b'"':
+        i += 1
+        res = bytearray()
+        while buf[i:i + 1] != b'"':
+            if i >= len(buf):
+                raise ValueError("unterminated string")
+            if buf[i:i + 1] == b'\\':
+                i += 1
+            res += buf[i:i + 1]
+            i += 1
+        return res.decode('utf-8', errors='replace'), i + 1
+    if c == b'{':
+        end = buf.index(b'}', i)
+        size = int(buf[i + 1:end])
+        start = end + 1
+        if buf[start:start + 2] == b'\r\n':
+            start += 2
+        return bytes(buf[start:start + size]), start + size
+    j = i
+    while j < len(buf) and buf[j:j + 1] not in (b' ', b'(', b')'):
+        if buf[j:j + 1] == b'[':
+            j = buf.index(b']', j)
+        j += 1
+    atom = buf[i:j].decode('ascii', errors='replace')
+    return (None if atom.upper() == 'NIL' else atom), j
 
-        # Extract plain text body
-        body_text = ""
-        if msg.is_multipart():
-            for part in msg.walk():
-                ctype = part.get_content_type()
-                cdispo = str(part.get('Content-Disposition'))
-                if ctype == 'text/plain' and 'attachment' not in cdispo:
-                    charset = part.get_content_charset() or 'utf-8'
-                    body_text += part.get_payload(decode=True).decode(charset, errors='ignore')
+def parse_fetch_response(data) -> Dict[int, dict]:
+    """Parse a UID FETCH response into {uid: {ITEM: value}} (literals are re-joined as on the wire)"""
+    messages = []
+    for item in data or []:
+        if item is None:
+            continue
+        head = item[0] if isinstance(item, tuple) else item
+        chunk = item[0] + b'\r\n' + item[1] if isinstance(item, tuple) else item
+        if _MSG_START_RE.match(head) or not messages:
+            messages.append(bytearray(chunk))
         else:
-            charset = msg.get_content_charset() or 'utf-8'
-            body_text = msg.get_payload(decode=True).decode(charset, errors='ignore')
+            messages[-1] += chunk
+
+    out = {}
+    for raw in messages:
+        try:
+            values, _ = _parse_value(bytes(raw), raw.index(b'('))
+            fields = {str(values[k]).upper(): values[k + 1] for k in range(0, len(values) - 1, 2)}
+            out[int(fields['UID'])] = fields
+        except (ValueError, IndexError, KeyError, TypeError):
+            continue
+    return out
+
+def _text_parts(bs, section: str) -> List[Tuple[str, str, str, str]]:
+    if not isinstance(bs, list) or not bs:
+        raise ValueError("malformed BODYSTRUCTURE")
+    if isinstance(bs[0], list):  # multipart: children first, then subtype + extension data
+        parts = []
+        for n, child in enumerate(bs, start=1):
+            if not isinstance(child, list):
+                break
+            parts += _text_parts(child, f"{section}.{n}" if section else str(n))
+        return parts
+    section = section or "1"
+    ctype = str(bs[0] or "").lower()
+    subtype = str(bs[1] or "").lower() if len(bs) > 1 else ""
+    if ctype == "message" and subtype == "rfc822":
+        # Forwarded as attachment: the encapsulated body is bs[8]; its parts are section.1, section.2, ...
+        nested = bs[8] if len(bs) > 8 else None
+        if isinstance(nested, list) and nested and isinstance(nested[0], list):
+            return _text_parts(nested, section)
+        return _text_parts(nested, f"{section}.1")
+    if ctype != "text" or subtype not in ("plain", "html"):
+        return []
+    params = bs[2] if len(bs) > 2 and isinstance(bs[2], list) else []
+    charset = next((str(params[k + 1]) for k in range(0, len(params) - 1, 2)
+                    if str(params[k]).lower() == "charset"), "utf-8")
+    encoding = str(bs[5] or "7bit").lower() if len(bs) > 5 else "7bit"
+    disposition = bs[9] if len(bs) > 9 else None
+    if isinstance(disposition, list) and disposition and str(disposition[0]).lower() == "attachment":
+        return []
+    return [(section, subtype, charset, encoding)]
+
+def find_text_parts(bs) -> Optional[List[Tuple[str, str, str, str]]]:
+    """Walk a BODYSTRUCTURE: [(section, subtype, charset, encoding)] of inline text/plain + text/html parts,
+    including those of attached message/rfc822 mails.
+
+    None = structure missing/unparseable or no text part found -> download the full message instead.
+    """
+    try:
+        parts = _text_parts(bs, "")
+    except (ValueError, TypeError, IndexError):
+        return None
+    return parts or None
+
+def internaldate_iso(value) -> Optional[str]:
+    """IMAP INTERNALDATE ("17-Jul-2026 02:44:25 -0700") as UTC ISO string, None if missing/unparseable"""
+    if not isinstance(value, str):
+        return None
+    parsed = imaplib.Internaldate2tuple(b'INTERNALDATE "' + value.encode('ascii', errors='ignore') + b'"')
+    if parsed is None:
+        return None
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.mktime(parsed)))
+
+def decode_part(data: bytes, encoding: str, charset: str) -> str:
+    try:
+        if encoding == "base64":
+            data = base64.b64decode(data)
+        elif encoding == "quoted-printable":
+            data = quopri.decodestring(data)
+    except Exception:
+        pass
+    try:
+        return data.decode(charset or 'utf-8', errors='ignore')
+    except LookupError:
+        return data.decode('utf-8', errors='ignore')
+
+def load_state() -> dict:
+    try:
+        with open(IMAP_STATE_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+def save_state(state: dict):
+    tmp = IMAP_STATE_FILE + ".tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(tmp, IMAP_STATE_FILE)
+
+_idle_tags = itertools.count(1)
 
-        payload = {
-            "subject": subject,
+def _has_buffered_data(M) -> bool:
+    """True if a response line can be read without blocking.
+
+    imaplib reads through a buffered file object, so lines that arrived together with an earlier
+    response sit in that buffer where select() on the socket cannot see them. A non-blocking peek
+    checks the buffer and pulls in whatever the socket already has, without consuming anything.
+    """
+    sock = M.socket()
+    if getattr(sock, 'pending', lambda: 0)():  # decrypted TLS bytes not yet handed to the buffer
+        return True
+    timeout = sock.gettimeout()
+    sock.setblocking(False)
+    try:
+        return bool(M.file.peek(1))
+    except (BlockingIOError, ssl.SSLWantReadError):
+        return False
+    finally:
+        sock.settimeout(timeout)
+
+def idle_wait(M, timeout: float, stop: Optional[threading.Event] = None) -> bool:
+    """RFC 2177 IDLE on a selected mailbox using only public imaplib calls (send/readline/socket).
+
+    Returns True when the server reports new mail (EXISTS/RECENT), False after `timeout` seconds or
+    when `stop` is set. Waits with select() only while nothing is buffered; the IDLE command uses its
+    own tag, so imaplib's tag bookkeeping is never touched. Always ends IDLE with DONE and reads up to
+    the tagged completion, leaving the connection ready for the next command.
+    """
+    tag = b'PEARIDLE%d' % next(_idle_tags)
+    M.send(tag + b' IDLE\r\n')
+    got_mail = False
+    while True:
+        line = M.readline()
+        if not line:
+            raise imaplib.IMAP4.abort("connection closed before IDLE")
+        if line.startswith(b'+'):
+            break
+        if line.startswith(tag):
+            raise imaplib.IMAP4.error(f"IDLE rejected: {line!r}")
+        if line.startswith(b'*') and (b'EXISTS' in line or b'RECENT' in line):
+            got_mail = True  # arrived before the continuation: end IDLE right away
+
+    deadline = time.monotonic() + timeout
+    try:
+        while not got_mail and not (stop is not None and stop.is_set()):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if not _has_buffered_data(M):
+                select.select([M.socket()], [], [], min(remaining, 5))
+                continue
+            line = M.readline()
+            if not line or line.startswith(b'* BYE'):
+                raise imaplib.IMAP4.abort("connection closed during IDLE")
+            if line.startswith(b'*') and (b'EXISTS' in line or b'RECENT' in line):
+                got_mail = True
+                break
+    finally:
+        M.send(b'DONE\r\n')
+        while True:
+            line = M.readline()
+            if not line:
+                raise imaplib.IMAP4.abort("connection closed after IDLE")
+            if line.startswith(tag):
+                break
+            if line.startswith(b'*') and b'EXISTS' in line:
+                got_mail = True
+    return got_mail
+
+class ImapFetcher:
+    """Keeps one authenticated IMAP session and only fetches UIDs above the stored high-water mark"""
+
+    def __init__(self):
+        self._conn = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._state = load_state()  # {"uidvalidity": int, "last_uid": int}
+
+    def _ensure_connected(self):
+        if self._conn is not None:
+            try:
+                if self._conn.noop()[0] == 'OK':
+                    return self._conn
+            except Exception:
+                pass
+            self.close()
+        self._conn = connect_imap()
+        typ, _ = self._conn.select(IMAP_MAILBOX)
+        if typ != 'OK':
+            raise imaplib.IMAP4.error(f"Cannot select {IMAP_MAILBOX}")
+        return self._conn
+
+    def close(self):
+        if self._conn is None:
+            return
+        try:
+            self._conn.logout()
+        except Exception:
+            pass
+        self._conn = None
+
+    def stop(self):
+        self._stop.set()
+
+    def _new_uids(self, M) -> List[int]:
+        """UIDs above the high-water mark; on first run / UIDVALIDITY change seed from UNSEEN"""
+        typ, data = M.status(IMAP_MAILBOX, '(UIDVALIDITY UIDNEXT)')
+        status = data[0].decode() if typ == 'OK' and data and data[0] else ""
+        validity = re.search(r"UIDVALIDITY (\d+)", status)
+        uidnext = re.search(r"UIDNEXT (\d+)", status)
+        validity = int(validity.group(1)) if validity else None
+
+        if validity is None or self._state.get("uidvalidity") != validity:
+            print(f"IMAP state reset (UIDVALIDITY {self._state.get('uidvalidity')} -> {validity})")
+            typ, data = M.uid('SEARCH', None, 'UNSEEN')
+            uids = [int(u) for u in data[0].split()] if typ == 'OK' and data and data[0] else []
+            base = int(uidnext.group(1)) - 1 if uidnext else 0
+            if uids:
+                base = min(base, min(uids) - 1)
+            self._state = {"uidvalidity": validity, "last_uid": base}
+            return uids
+
+        last_uid = int(self._state.get("last_uid", 0))
+        typ, data = M.uid('SEARCH', None, f'UID {last_uid + 1}:*')
+        if typ != 'OK':
+            raise imaplib.IMAP4.error(f"UID SEARCH failed: {data}")
+        # "n:*" always matches the newest message, even if its UID is below n
+        return sorted(u for u in (int(x) for x in (data[0] or b"").split()) if u > last_uid)
+
+    def fetch_once(self, max_seconds: Optional[float] = None) -> FetchResult:
+        """One cycle; with max_seconds no new chunk is started after that (the rest follows next cycle)"""
+        deadline = None if max_seconds is None else time.monotonic() + max_seconds
+        with self._lock, IMAP_FETCH_SECONDS.time():
+            try:
+                result = self._fetch_once(deadline)
+            except Exception:
+                IMAP_FETCH_ERRORS.inc()
+                self.close()
+                raise
+        for outcome, count in result.as_dict().items():
+            IMAP_MESSAGES.inc(count, result=outcome)
+        return result
+
+    def _fetch_once(self, deadline: Optional[float] = None) -> FetchResult:
+        result = FetchResult()
+        M = self._ensure_connected()
+        uids = self._new_uids(M)
+        result.found = len(uids)
+        print(f"Found {len(uids)} new messages.")
+
+        for start in range(0, len(uids), IMAP_FETCH_CHUNK):
+            if deadline is not None and time.monotonic() > deadline:
+                print(f"Time budget reached - {len(uids) - start} messages left for the next cycle.")
+                break
+            chunk = uids[start:start + IMAP_FETCH_CHUNK]
+            typ, data = M.uid('FETCH', uid_ranges(chunk), HEADER_FETCH)
+            if typ != 'OK':
+                result.errors += 1
+                break
+            meta = parse_fetch_response(data)
+
+            plan = []  # (uid, subject matched?, parts; None = no usable structure or text part -> full download)
+            for uid in chunk:
+                item = meta.get(uid)
+                if item is None or not isinstance(item.get(HEADER_KEY), bytes):
+                    plan.append((uid, True, None))
+                    continue
+                subject = BytesHeaderParser().parsebytes(item[HEADER_KEY]).get('Subject', '')
+                if not subject_matches(subject):
+                    print(f"Skip (subject): {subject}")
+                    result.skipped += 1
+                    plan.append((uid, False, []))
+                    continue
+                plan.append((uid, True, find_text_parts(item.get('BODYSTRUCTURE'))))
+
+            bodies = self._fetch_bodies(M, [(uid, parts) for uid, matched, parts in plan if matched])
+            ready = []  # (uid, payload or None if skipped), in UID order
+            complete = True
+            for uid, matched, parts in plan:
+                payload = bodies.get(uid) if matched else None
+                if matched and payload is None:
+                    result.errors += 1
+                    complete = False
+                    break
+                if payload is not None and meta.get(uid):
+                    # Server delivery time: lets the Guardian tell backlog from live volume
+                    delivered_at = internaldate_iso(meta[uid].get('INTERNALDATE'))
+                    if delivered_at:
+                        payload["delivered_at"] = delivered_at
+                if payload is not None and parts is None and not subject_matches(payload["subject"]):
+                    print(f"Skip (subject): {payload['subject']}")
+                    result.skipped += 1
+                    payload = None
+                ready.append((uid, payload))
+            delivered = self._deliver(ready, result) and complete
+            save_state(self._state)
+            if not delivered:
+                break
+        return result
+
+    def _deliver(self, ready: List[Tuple[int, Optional[dict]]], result: FetchResult) -> bool:
+        """Post in INGEST_BATCH_SIZE batches; the high-water mark stops at the first undelivered message"""
+        outgoing = [p for _, p in ready if p is not None]
+        statuses: List[Optional[str]] = []
+        for start in range(0, len(outgoing), max(1, INGEST_BATCH_SIZE)):
+            batch = outgoing[start:start + max(1, INGEST_BATCH_SIZE)]
+            if statuses and not all(statuses):
+                statuses += [None] * len(batch)
+            else:
+                statuses += post_batch_to_ingest(batch)
+
+        delivered = iter(statuses)
+        for uid, payload in ready:
+            if payload is not None:
+                status = next(delivered)
+                if status is None:
+                    # Keep the high-water mark here so the message is retried next cycle
+                    result.errors += 1
+                    return False
+                result.posted += 1
+                if status == "quarantined":
+                    # Sender over limit: /ingest kept it under QUARANTINE_PREFIX
+                    print(f"Quarantined (sender over limit): {payload['from_email']}")
+                    result.quarantined += 1
+            self._state["last_uid"] = max(uid, int(self._state.get("last_uid", 0)))
+        return True
+
+    def _fetch_bodies(self, M, wanted: List[Tuple[int, Optional[list]]]) -> Dict[int, dict]:
+        """Download only the text parts of matching messages (grouped by identical section lists)"""
+        payloads = {}
+        groups: Dict[tuple, List[int]] = {}
+        for uid, parts in wanted:
+            groups.setdefault(tuple(parts) if parts is not None else None, []).append(uid)
+
+        for parts, group_uids in groups.items():
+            if parts is None:
+                payloads.update(self._fetch_full(M, group_uids))
+                continue
+            # BODY[n] (not PEEK) marks the message \Seen like the old RFC822 download did
+            sections = "".join(f" BODY[{p[0]}]" for p in parts)
+            wanted_items = f"(UID BODY.PEEK[HEADER.FIELDS (SUBJECT FROM TO MESSAGE-ID)]{sections})"
+            typ, data = M.uid('FETCH', uid_ranges(group_uids), wanted_items)
+            if typ != 'OK':
+                continue
+            incomplete = []
+            for uid, item in parse_fetch_response(data).items():
+                headers = BytesHeaderParser().parsebytes(item.get(HEADER_KEY) or b"")
+                plain, html = [], []
+                for section, subtype, charset, encoding in parts:
+                    raw = item.get(f"BODY[{section}]")
+                    if isinstance(raw, bytes):
+                        (plain if subtype == "plain" else html).append(decode_part(raw, encoding, charset))
+                if not (plain or html):
+                    # Sections missing from the response: never post an empty body
+                    incomplete.append(uid)
+                    continue
+                payload = self._payload(headers, "".join(plain))
+                if not plain and html:
+                    payload["body_html"] = html[0]
+                payloads[uid] = payload
+            if incomplete:
+                payloads.update(self._fetch_full(M, incomplete))
+        return payloads
+
+    def _fetch_full(self, M, uids: List[int]) -> Dict[int, dict]:
+        """Fallback for messages whose structure could not be parsed: full RFC822 download"""
+        typ, data = M.uid('FETCH', uid_ranges(uids), '(RFC822)')
+        if typ != 'OK':
+            return {}
+        out = {}
+        for uid, raw in iter_fetch_literals(data):
+            msg = email.message_from_bytes(raw)
+            out[uid] = self._payload(msg, extract_body_text(msg))
+        return out
+
+    @staticmethod
+    def _payload(headers, body_text: str) -> dict:
+        from_email = email.utils.parseaddr(headers.get('From'))[1] or headers.get('From', '')
+        to_email = email.utils.parseaddr(headers.get('To'))[1] or headers.get('To', '')
+        return {
+            "subject": headers.get('Subject', ''),
             "from_email": from_email.strip(),
             "to_email": to_email.strip(),
+            "message_id": (headers.get('Message-ID') or '').strip(),
             "body": body_text
         }
-        try:
-            resp = requests.post(INGEST_URL, json=payload, timeout=15)
-            print("POST /ingest:", resp.status_code, resp.text[:300])
-        except Exception as e:
-            print("Error posting to ingest:", e)
 
-    M.close()
-    M.logout()
+    def wait_for_new_mail(self, timeout: int = IMAP_IDLE_TIMEOUT) -> bool:
+        """Block until the server reports new mail (IDLE) or the timeout/poll interval passes"""
+        with self._lock:
+            M = self._ensure_connected()
+            if 'IDLE' not in M.capabilities:
+                self._stop.wait(min(timeout, IMAP_POLL_INTERVAL))
+                return True
+            return idle_wait(M, timeout, self._stop)
+
+    def run_forever(self):
+        """Long-running mode: fetch, then wait on IDLE (or NOOP polling); reconnects with backoff"""
+        backoff = 5
+        while not self._stop.is_set():
+            try:
+                self.fetch_once()
+                self.wait_for_new_mail()
+                backoff = 5
+            except Exception as e:
+                print(f"IMAP error: {e} - reconnecting in {backoff}s")
+                self.close()
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, 300)
+        self.close()
+
+def main():
+    fetcher = ImapFetcher()
+    if "--idle" in sys.argv:
+        try:
+            fetcher.run_forever()
+        except KeyboardInterrupt:
+            fetcher.stop()
+        return
+    try:
+        fetcher.fetch_once()
+    finally:
+        fetcher.close()
 
 if __name__ == "__main__":
     main()
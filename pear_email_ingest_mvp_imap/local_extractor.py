@@ -0,0 +1,235 @@
+"""
+local_extractor.py — PEARv2.2
+Deterministische Vor-Extraktion der REQ_FIELDS ohne API-Call.
+
+Erkennt die Formate, die BASE_INSTR als Beispiele nennt:
+- `Key: Value`-Zeilen (Vorname/Nachname/Telefon/E-Mail/Straße/Nr/PLZ/Ort, inkl. "PLZ Ort")
+- Pipe-Tabellen mit Kopfzeile (Spalten-Mapping) oder ohne (Zellen per Muster klassifiziert)
+- Mehrzeilige Adressen ("Rosenweg 12" + "10115 Berlin")
+
+Jedes Feld bekommt eine Konfidenz (Label/Kopfzeile > Muster > Freitext).
+Gemini wird nur gebraucht, wenn danach noch Pflichtfelder fehlen oder unsicher sind.
+"""
+
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+# Konfidenz je nach Herkunft eines Werts
+CONF_LABEL = 0.95     # "Telefon: 089-123" / Tabellen-Kopfzeile
+CONF_PATTERN = 0.9    # Tabellenzelle ohne Kopfzeile, per Muster erkannt
+CONF_DERIVED = 0.9    # z.B. Vor-/Nachname aus "Hans Schmidt"
+CONF_FREETEXT = 0.6   # Muster irgendwo im Fließtext
+
+EMAIL_RE = re.compile(r"^[\w.+\-]+@[\w\-]+(\.[\w\-]+)+$")
+EMAIL_ANY_RE = re.compile(r"[\w.+\-]+@[\w\-]+(?:\.[\w\-]+)+")
+PLZ_RE = re.compile(r"^\d{5}$")
+PHONE_RE = re.compile(r"^(?:\+49|0049|0)[\s\-/()]*\d(?:[\d\s\-/()]{4,18})\d$")
+PLZ_CITY_RE = re.compile(r"^(?:D-)?(\d{5})\s+([A-ZÄÖÜ][\wäöüßÄÖÜ.\- ()]+)$")
+STREET_RE = re.compile(r"^([A-ZÄÖÜ][\wäöüßÄÖÜ.\- ]*?(?:str\.?|straße|strasse|weg|allee|platz|ring|gasse|damm|ufer|"
+                       r"chaussee|steig|pfad|markt|berg|hof|park|[a-zäöüß]+))\s+(\d{1,4}\s?[a-zA-Z]?(?:\s?-\s?\d{1,4})?)$",
+                       re.IGNORECASE)
+HOUSE_NO_RE = re.compile(r"^\d{1,4}\s?[a-zA-Z]?(?:\s?-\s?\d{1,4})?$")
+NAME_RE = re.compile(r"^(?:(?:Frau|Herr|Hr\.|Fr\.)\s+)?([A-ZÄÖÜ][a-zäöüß\-']+(?:\s+(?:von|van|de|zu|der)?\s*"
+                     r"[A-ZÄÖÜ][a-zäöüß\-']+){1,3})$")
+KEY_VALUE_RE = re.compile(r"^\s*[-*•]?\s*([A-Za-zÄÖÜäöüß][A-Za-zÄÖÜäöüß .()/\-]{0,40}?)\s*[:=]\s*(.*?)\s*$")
+
+# Normalisierte Label → internes Feld ("street"/"house_no" werden zu address zusammengesetzt)
+LABELS = {
+    "name": "name", "vollständiger name": "name", "kunde": "name", "kundin": "name", "klient": "name",
+    "klientin": "name", "name des kunden": "name", "name der kundin": "name", "kundenname": "name",
+    "vorname": "first_name", "first name": "first_name", "firstname": "first_name",
+    "nachname": "last_name", "familienname": "last_name", "zuname": "last_name", "last name": "last_name",
+    "lastname": "last_name",
+    "e-mail": "email", "email": "email", "mail": "email", "e-mail-adresse": "email", "emailadresse": "email",
+    "telefon": "phone", "tel": "phone", "tel.": "phone", "telefonnummer": "phone", "mobil": "phone",
+    "handy": "phone", "mobilnummer": "phone", "phone": "phone", "festnetz": "phone",
+    "adresse": "address", "anschrift": "address", "straße": "street", "strasse": "street", "str.": "street",
+    "straße und hausnummer": "address", "strasse und hausnummer": "address", "straße/nr.": "address",
+    "hausnummer": "house_no", "hausnr.": "house_no", "hausnr": "house_no", "nr": "house_no", "nr.": "house_no",
+    "plz": "plz", "postleitzahl": "plz",
+    "ort": "city", "stadt": "city", "wohnort": "city", "city": "city",
+    "plz ort": "plz_city", "plz/ort": "plz_city", "plz, ort": "plz_city", "plz und ort": "plz_city",
+}
+
+
+@dataclass
+class LocalExtraction:
+    values: Dict[str, str] = field(default_factory=dict)
+    scores: Dict[str, float] = field(default_factory=dict)
+
+    def set(self, key: str, value: Optional[str], score: float):
+        value = (value or "").strip(" \t,;")
+        if value and score > self.scores.get(key, 0.0):
+            self.values[key] = value
+            self.scores[key] = score
+
+    def confident(self, fields: List[str], min_confidence: float) -> Dict[str, str]:
+        """Felder aus `fields`, die mit mindestens min_confidence erkannt wurden."""
+        return {f: self.values[f] for f in fields if f in self.values and self.scores.get(f, 0.0) >= min_confidence}
+
+    def is_sufficient(self, fields: List[str], min_confidence: float) -> bool:
+        return len(self.confident(fields, min_confidence)) == len(fields)
+
+    def as_extraction(self, fields: List[str]) -> Dict[str, Any]:
+        """Ergebnis im selben Format wie call_gemini (Felder, missing, confidence)."""
+        data: Dict[str, Any] = {f: self.values.get(f) for f in fields}
+        data["missing"] = [f for f in fields if not data[f]]
+        scores = [self.scores[f] for f in fields if f in self.scores]
+        data["confidence"] = 1.0 if not data["missing"] else round(min(scores or [0.0]), 2)
+        return data
+
+
+def _label(key: str) -> Optional[str]:
+    k = re.sub(r"\s+", " ", key.strip().lower().replace("_", " "))
+    return LABELS.get(k) or LABELS.get(k.rstrip("."))
+
+
+def _classify_cell(cell: str) -> Optional[Tuple[str, Any]]:
+    """Ordnet eine Tabellenzelle ohne Kopfzeile per Muster einem Feld zu."""
+    if EMAIL_RE.match(cell):
+        return "email", cell
+    if PLZ_RE.match(cell):
+        return "plz", cell
+    m = PLZ_CITY_RE.match(cell)
+    if m:
+        return "plz_city", (m.group(1), m.group(2))
+    if PHONE_RE.match(cell):
+        return "phone", cell
+    if STREET_RE.match(cell):
+        return "address", cell
+    if HOUSE_NO_RE.match(cell):
+        return "house_no", cell
+    if NAME_RE.match(cell):
+        return "name", cell
+    return None
+
+
+def _apply(result: LocalExtraction, key: str, value: Any, score: float):
+    if key == "plz_city":
+        if isinstance(value, tuple):
+            plz, city = value
+        else:
+            m = PLZ_CITY_RE.match(str(value).strip())
+            if not m:
+                return
+            plz, city = m.group(1), m.group(2)
+        result.set("plz", plz, score)
+        result.set("city", city, score)
+    elif key == "address":
+        # "Rosenweg 12, 10115 Berlin" in einem Feld
+        street, _, rest = str(value).partition(",")
+        m = PLZ_CITY_RE.match(rest.strip())
+        if m:
+            result.set("plz", m.group(1), score)
+            result.set("city", m.group(2), score)
+        result.set("address", street, score)
+    elif key == "email":
+        m = EMAIL_ANY_RE.search(str(value))
+        if m:
+            result.set("email", m.group(0), score)
+    elif key == "phone":
+        if len(re.sub(r"\D", "", str(value))) >= 6:
+            result.set("phone", str(value), score)
+    elif key == "plz":
+        m = re.search(r"\b\d{5}\b", str(value))
+        if m:
+            result.set("plz", m.group(0), score)
+    else:
+        result.set(key, str(value), score)
+
+
+def _parse_table(lines: List[str], result: LocalExtraction):
+    rows = [[c.strip() for c in line.strip().strip("|").split("|")] for line in lines]
+    rows = [r for r in rows if any(r) and not all(re.fullmatch(r":?-{2,}:?", c) for c in r if c)]
+    if not rows:
+        return
+    header = [_label(c) for c in rows[0]]
+    if sum(1 for h in header if h) >= 2:
+        for row in rows[1:2]:  # erste Datenzeile = der Kunde
+            for key, cell in zip(header, row):
+                if key and cell:
+                    _apply(result, key, cell, CONF_LABEL)
+        return
+    if len(rows) != 1:
+        return  # mehrere Zeilen ohne Kopfzeile: nicht eindeutig
+    for cell in rows[0]:
+        hit = _classify_cell(cell) if cell else None
+        if hit:
+            _apply(result, hit[0], hit[1], CONF_PATTERN)
+
+
+def extract_local(body: str, fields: List[str]) -> LocalExtraction:
+    """Schnelle Regex-Extraktion; liefert Werte + Konfidenz pro Feld."""
+    result = LocalExtraction()
+    lines = [l.rstrip() for l in (body or "").replace("\r\n", "\n").split("\n")]
+
+    table: List[str] = []
+    pending_label: Optional[str] = None
+    for i, line in enumerate(lines + [""]):
+        if line.count("|") >= 2:
+            table.append(line)
+            continue
+        if table:
+            _parse_table(table, result)
+            table = []
+
+        stripped = line.strip()
+        if pending_label and stripped:
+            # "Adresse:" mit Wert in den Folgezeilen
+            if pending_label == "address" and STREET_RE.match(stripped):
+                result.set("address", stripped, CONF_LABEL)
+                nxt = lines[i + 1].strip() if i + 1 < len(lines) else ""
+                m = PLZ_CITY_RE.match(nxt)
+                if m:
+                    result.set("plz", m.group(1), CONF_LABEL)
+                    result.set("city", m.group(2), CONF_LABEL)
+            elif pending_label != "address":
+                _apply(result, pending_label, stripped, CONF_LABEL)
+            pending_label = None
+            continue
+
+        m = KEY_VALUE_RE.match(line)
+        key = _label(m.group(1)) if m else None
+        if key:
+            if m.group(2):
+                _apply(result, key, m.group(2), CONF_LABEL)
+            else:
+                pending_label = key
+            continue
+
+        # Mehrzeilige Adresse ohne Label
+        if STREET_RE.match(stripped) and i + 1 < len(lines):
+            nxt = PLZ_CITY_RE.match(lines[i + 1].strip())
+            if nxt:
+                result.set("address", stripped, CONF_PATTERN)
+                result.set("plz", nxt.group(1), CONF_PATTERN)
+                result.set("city", nxt.group(2), CONF_PATTERN)
+
+    # Straße + Hausnummer getrennt angegeben
+    if "street" in result.values:
+        street = result.values["street"]
+        if "house_no" in result.values and not re.search(r"\d", street):
+            street = f"{street} {result.values['house_no']}"
+        result.set("address", street, min(result.scores["street"], result.scores.get("house_no", 1.0)))
+
+    # Name ↔ Vor-/Nachname
+    if "first_name" in result.values and "last_name" in result.values:
+        result.set("name", f"{result.values['first_name']} {result.values['last_name']}",
+                   min(result.scores["first_name"], result.scores["last_name"]))
+    elif "name" in result.values:
+        parts = result.values["name"].replace(",", " ").split()
+        if len(parts) == 2 and NAME_RE.match(result.values["name"]):
+            result.set("first_name", parts[0], CONF_DERIVED)
+            result.set("last_name", parts[1], CONF_DERIVED)
+
+    # Freitext-Fallback: genau eine E-Mail-Adresse im Text
+    if "email" not in result.values:
+        found = set(EMAIL_ANY_RE.findall(body or ""))
+        if len(found) == 1:
+            result.set("email", found.pop(), CONF_FREETEXT)
+
+    for helper in ("street", "house_no"):
+        result.values.pop(helper, None)
+        result.scores.pop(helper, None)
+    return result
@@ -1,20 +1,26 @@
 import os
 import json
-import uuid
+import hashlib
 from datetime import datetime
-from typing import Optional
+from typing import Optional, Tuple
 import threading
 import time
-import subprocess
 import logging
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from dotenv import load_dotenv
-from email_guardian import EmailGuardian
+from email_guardian import get_guardian, get_usage, record_email
+from imap_fetcher import ImapFetcher
+from sender_admission import QUARANTINE_PREFIX, SenderAdmission
+import metrics
+import smtp_outbox
 
 # GCS optional (lokal darf es auch ohne laufen)
 try:
     from google.cloud import storage  # pip install google-cloud-storage
+    from google.api_core import exceptions as gcs_exceptions
+    from processed_index import raw_partition
     _HAS_GCS = True
 except Exception:
     _HAS_GCS = False
@@ -41,6 +47,21 @@ app = Flask(__name__)
 # Email processing configuration
 EMAIL_CHECK_INTERVAL = int(os.getenv('EMAIL_CHECK_INTERVAL', 300))  # 5 minutes default
 AUTO_EMAIL_PROCESSING = os.getenv('AUTO_EMAIL_PROCESSING', 'true').lower() == 'true'
+# Push mode: process each raw object right after /ingest or a GCS notification
+PUSH_PROCESSING = os.getenv('PUSH_PROCESSING', 'true').lower() == 'true'
+PUSH_WORKERS = int(os.getenv('PUSH_WORKERS', '2'))
+IMAP_FETCH_TIMEOUT = int(os.getenv('IMAP_FETCH_TIMEOUT', 120))
+# IDLE mode: a dedicated thread keeps the IMAP session open and ingests mail as it arrives
+IMAP_IDLE_MODE = os.getenv('IMAP_IDLE_MODE', 'false').lower() == 'true'
+BUCKET_PROCESS_TIMEOUT = int(os.getenv('BUCKET_PROCESS_TIMEOUT', 300))
+# A stage thread cannot be killed: stages stop themselves at their timeout (IMAP chunks, sweep chunks, socket and
+# Gemini/DB deadlines). One still running after STAGE_STUCK_FACTOR x its timeout is reported as stuck and fails /healthz
+STAGE_STUCK_FACTOR = float(os.getenv('STAGE_STUCK_FACTOR', 3))
+# /ingest/batch: max messages per request and parallel GCS uploads
+INGEST_BATCH_MAX = int(os.getenv('INGEST_BATCH_MAX', 500))
+INGEST_UPLOAD_WORKERS = int(os.getenv('INGEST_UPLOAD_WORKERS', 8))
+# Dedupe markers (one per Message-ID hash) pointing at the time-partitioned raw object
+MESSAGE_ID_PREFIX = os.getenv('MESSAGE_ID_PREFIX', 'message-ids/')
 
 # Setup logging
 logging.basicConfig(
@@ -49,24 +70,119 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+_push_executor = ThreadPoolExecutor(max_workers=max(1, PUSH_WORKERS), thread_name_prefix="push")
+_processor = None
+_processor_lock = threading.Lock()
+
+# Long-lived stage runners (IMAP session, storage client, Gemini model and DB pool survive cycles)
+_stage_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="stage")
+_stage_futures = {}  # name -> (future, started, timeout)
+_imap_fetcher = ImapFetcher()
+# Per-sender token buckets: flooding senders go to QUARANTINE_PREFIX, everyone else keeps flowing
+_admission = SenderAdmission.from_env()
+
+# One storage client per process (token refresh + HTTP connection pool are reused)
+_gcs_bucket = None
+_gcs_lock = threading.Lock()
+_upload_executor = ThreadPoolExecutor(max_workers=max(1, INGEST_UPLOAD_WORKERS), thread_name_prefix="upload")
+
+GCS_UPLOAD_SECONDS = metrics.histogram("pear_gcs_upload_seconds", "Duration of a raw/quarantine upload to GCS", ("prefix",))
+GCS_UPLOADS = metrics.counter("pear_gcs_uploads_total", "GCS uploads by outcome", ("prefix", "result"))
+STAGE_TIMEOUTS = metrics.counter("pear_stage_timeouts_total", "Stages that did not finish within their timeout", ("stage",))
+STAGE_SKIPS = metrics.counter("pear_stage_skips_total", "Cycles skipped because the stage was still running", ("stage", "state"))
+
 @app.get("/healthz")
 def healthz():
+    stuck = stuck_stages()
+    if stuck:
+        # Lets the platform restart the instance - the only way to get rid of a hung stage thread
+        return {"status": "stuck", "stages": stuck, "project": PROJECT_ID, "bucket": GCS_BUCKET}, 503
     return {"status": "ok", "project": PROJECT_ID, "bucket": GCS_BUCKET}, 200
 
 
-def _write_to_gcs(obj: dict, suffix: str = "json") -> Optional[str]:
+def _get_gcs_bucket():
+    global _gcs_bucket
+    with _gcs_lock:
+        if _gcs_bucket is None:
+            client = storage.Client()  # nutzt ADC (gcloud auth application-default login)
+            _gcs_bucket = client.bucket(GCS_BUCKET)
+        return _gcs_bucket
+
+
+def _raw_object_id(obj: dict) -> str:
+    """Deterministic key: SHA-256 of the Message-ID, or of the message content if there is none"""
+    message_id = (obj.get("message_id") or "").strip().strip("<>")
+    if message_id:
+        basis = "mid:" + message_id
+    else:
+        basis = "content:" + "\x00".join(str(obj.get(k) or "") for k in
+                                           ("from_email", "to_email", "subject", "body", "body_html"))
+    return hashlib.sha256(basis.encode("utf-8")).hexdigest()
+
+
+def _write_to_gcs(obj: dict, suffix: str = "json", prefix: str = "raw/") -> Tuple[Optional[str], bool]:
+    """Upload once per message: returns (uri, created); created is False if the message was already stored"""
     if not (_HAS_GCS and GCS_BUCKET):
-        return None
-    client = storage.Client()  # nutzt ADC (gcloud auth application-default login)
-    bucket = client.bucket(GCS_BUCKET)
-    blob_id = f"raw/{uuid.uuid4()}.{suffix}"
-    blob = bucket.blob(blob_id)
-    blob.upload_from_string(
-        json.dumps(obj, ensure_ascii=False, indent=2),
-        content_type="application/json",
-    )
+        return None, False
+    bucket = _get_gcs_bucket()
+    object_id = _raw_object_id(obj)
+    if prefix == "raw/":
+        return _write_raw(bucket, object_id, obj, suffix)
+    return _upload_once(bucket, f"{prefix}{object_id}.{suffix}", obj, prefix)
+
+
+def _upload_once(bucket, blob_id: str, obj: dict, prefix: str) -> Tuple[str, bool]:
+    try:
+        with GCS_UPLOAD_SECONDS.time(prefix=prefix):
+            bucket.blob(blob_id).upload_from_string(
+                json.dumps(obj, ensure_ascii=False, indent=2),
+                content_type="application/json",
+                if_generation_match=0,  # nur anlegen, nie überschreiben
+            )
+    except gcs_exceptions.PreconditionFailed:
+        GCS_UPLOADS.inc(prefix=prefix, result="duplicate")
+        app.logger.info(f"UPLOAD SKIPPED (duplicate) -> gs://{GCS_BUCKET}/{blob_id}")
+        return f"gs://{GCS_BUCKET}/{blob_id}", False
+    except Exception:
+        GCS_UPLOADS.inc(prefix=prefix, result="error")
+        raise
+    GCS_UPLOADS.inc(prefix=prefix, result="created")
     app.logger.info(f"UPLOAD OK -> gs://{GCS_BUCKET}/{blob_id}")
-    return f"gs://{GCS_BUCKET}/{blob_id}"
+    return f"gs://{GCS_BUCKET}/{blob_id}", True
+
+
+def _write_raw(bucket, object_id: str, obj: dict, suffix: str) -> Tuple[str, bool]:
+    """Raw objects live in hourly partitions (raw/YYYY/MM/DD/HH/<hash>.json) so the sweep only lists new ones.
+
+    The partition depends on the upload time, so dedupe goes through a marker per message
+    (MESSAGE_ID_PREFIX/<hash>, created with if_generation_match=0) that names the raw object.
+    """
+    blob_id = f"raw/{raw_partition(time.time())}{object_id}.{suffix}"
+    marker = bucket.blob(f"{MESSAGE_ID_PREFIX}{object_id}")
+    try:
+        marker.upload_from_string(blob_id, content_type="text/plain", if_generation_match=0)
+    except gcs_exceptions.PreconditionFailed:
+        marker.reload()
+        existing = marker.download_as_text().strip()
+        if existing and bucket.blob(existing).exists():
+            GCS_UPLOADS.inc(prefix="raw/", result="duplicate")
+            app.logger.info(f"UPLOAD SKIPPED (duplicate) -> gs://{GCS_BUCKET}/{existing}")
+            return f"gs://{GCS_BUCKET}/{existing}", False
+        # An earlier attempt claimed the marker but never wrote the raw object: take it over
+        try:
+            marker.upload_from_string(blob_id, content_type="text/plain", if_generation_match=marker.generation)
+        except gcs_exceptions.PreconditionFailed:
+            # A concurrent upload of the same message took it over first
+            GCS_UPLOADS.inc(prefix="raw/", result="duplicate")
+            return f"gs://{GCS_BUCKET}/{existing}", False
+    try:
+        return _upload_once(bucket, blob_id, obj, "raw/")
+    except Exception:
+        try:
+            marker.delete()  # let a retry of this message store it again
+        except Exception:
+            pass
+        raise
 
 
 @app.post("/ingest")
@@ -77,27 +193,131 @@ def ingest():
       "subject": "...",
       "from_email": "...",
       "to_email": "...",
-      "body": "..."
+      "message_id": "...",
+      "body": "...",
+      "body_html": "..."   (optional, nur wenn die Mail keinen text/plain-Teil hat)
+      "delivered_at": "..." (optional, IMAP INTERNALDATE als UTC-ISO; ältere Mails zählen als Backlog)
     }
     """
     payload = request.get_json(silent=True) or {}
+    return jsonify(_ingest_message(payload)), 200
+
+
+@app.post("/ingest/batch")
+def ingest_batch():
+    """
+    Mehrere Nachrichten in einem Request: {"messages": [<wie /ingest>, ...]} (oder direkt eine Liste).
+    Uploads laufen parallel; Antwort pro Nachricht in Eingangsreihenfolge.
+    """
+    payload = request.get_json(silent=True)
+    messages = payload.get("messages") if isinstance(payload, dict) else payload
+    if not isinstance(messages, list):
+        return jsonify({"error": "expected a list of messages"}), 400
+    if len(messages) > INGEST_BATCH_MAX:
+        return jsonify({"error": f"batch too large (max {INGEST_BATCH_MAX})"}), 413
+
+    results = list(_upload_executor.map(_ingest_batch_item, messages))
+    return jsonify({
+        "count": len(results),
+        "errors": sum(1 for r in results if r["status"] == "error"),
+        "results": results,
+    }), 200
+
+
+def _ingest_batch_item(payload) -> dict:
+    if not isinstance(payload, dict):
+        return {"status": "error", "error": "message must be an object"}
+    try:
+        record = _ingest_message(payload)
+    except Exception as e:
+        logger.error(f"❌ Batch ingest upload failed: {e}")
+        return {"status": "error", "error": str(e)}
+    return {key: record.get(key) for key in ("status", "gcs_uri", "duplicate", "push_scheduled", "received_at")}
+
 
+def _ingest_message(payload: dict) -> dict:
+    """Build the raw record, upload it and schedule push processing"""
     record = {
         "project_id": PROJECT_ID,
         "received_at": datetime.utcnow().isoformat(timespec="seconds") + "Z",
         "subject": payload.get("subject"),
         "from_email": payload.get("from_email"),
         "to_email": payload.get("to_email"),
+        "message_id": payload.get("message_id"),
         "body": payload.get("body"),
         "raw_length": len(payload.get("body") or ""),
         "status": "ok"
     }
+    if payload.get("body_html"):
+        record["body_html"] = payload["body_html"]
 
-    uri = _write_to_gcs(record)  # kann lokal None sein
+    # Single admission point for fetcher and direct clients: one token per message
+    if not _admission.admit(record["from_email"]):
+        return _quarantine_message(record)
+
+    uri, created = _write_to_gcs(record)  # kann lokal None sein
+    if uri and not created:
+        _admission.refund(record["from_email"])  # re-posted duplicate, not a new message
     if uri:
         record["gcs_uri"] = uri
+        record["duplicate"] = not created
+        # Duplikate wurden bereits verarbeitet (oder sind in Arbeit) -> kein zweiter Push
+        record["push_scheduled"] = created and schedule_push_processing(uri.split(f"gs://{GCS_BUCKET}/", 1)[-1])
+    if not record.get("duplicate"):
+        record_email(record["from_email"], payload.get("delivered_at"))  # Guardian-Zähler (Minute/Stunde/Tag, pro Absender)
+    return record
+
+
+def _quarantine_message(record: dict) -> dict:
+    """Over-limit sender: keep the message under QUARANTINE_PREFIX, no push, no Guardian volume"""
+    record["status"] = "quarantined"
+    uri, created = _write_to_gcs(record, prefix=QUARANTINE_PREFIX)
+    if uri:
+        record["gcs_uri"] = uri
+        record["duplicate"] = not created
+    record["push_scheduled"] = False
+    get_usage().record("quarantined", record["from_email"])
+    logger.warning(f"🚧 Sender over limit, quarantined: {record['from_email']} ({uri or 'no GCS'})")
+    return record
+
+
+def _parse_gcs_notification(payload: dict) -> tuple:
+    """Extract (bucket, object) from a CloudEvent/GCS object payload or a Pub/Sub push message"""
+    message = payload.get("message")
+    if isinstance(message, dict):
+        attrs = message.get("attributes") or {}
+        if attrs.get("eventType") not in (None, "OBJECT_FINALIZE"):
+            return None, None
+        return attrs.get("bucketId"), attrs.get("objectId")
+    data = payload.get("data") if isinstance(payload.get("data"), dict) else payload
+    return data.get("bucket"), data.get("name")
+
 
-    return jsonify(record), 200
+@app.post("/gcs-event")
+def gcs_event():
+    """GCS object notification (same payload as pear-email-processor-function) -> push processing"""
+    bucket_name, object_name = _parse_gcs_notification(request.get_json(silent=True) or {})
+    if (not object_name or not object_name.startswith("raw/") or not object_name.endswith(".json")
+            or (GCS_BUCKET and bucket_name and bucket_name != GCS_BUCKET)):
+        return jsonify({"status": "ignored"}), 200
+
+    scheduled = schedule_push_processing(object_name)
+    return jsonify({"status": "scheduled" if scheduled else "disabled", "object": object_name}), 202
+
+
+@app.get("/latency")
+def latency():
+    """Ingest-to-reply latency of this instance (rolling window)"""
+    processor = get_processor()
+    if processor is None:
+        return jsonify({"error": "processor unavailable"}), 503
+    return jsonify(processor.INGEST_TO_REPLY.summary())
+
+
+@app.get("/metrics")
+def metrics_endpoint():
+    """Prometheus scrape endpoint (counters and latency histograms of this instance)"""
+    return Response(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
 
 
 @app.post("/process-emails")
@@ -112,8 +332,8 @@ def process_emails_manual():
 
 @app.get("/guardian-status")
 def guardian_status():
-    """Get Guardian system status"""
-    guardian = EmailGuardian()
+    """Get Guardian system status (cached evaluation, no DB round trip while fresh)"""
+    guardian = get_guardian()
     result = guardian.guardian_check()
     
     return jsonify({
@@ -124,16 +344,23 @@ def guardian_status():
         "action": result.action,
         "stats": {
             "pending_cases": result.stats.pending_cases,
+            "emails_last_minute": result.stats.emails_last_minute,
+            "emails_last_hour": result.stats.emails_last_hour,
+            "emails_today": result.stats.emails_today,
+            "gemini_calls_today": result.stats.gemini_calls_today,
+            "smtp_sends_today": result.stats.smtp_sends_today,
+            "backlog_emails_today": result.stats.backlog_emails_today,
             "suspicious_patterns": result.stats.suspicious_patterns
         },
-        "emergency_lockdown": guardian.check_emergency_lockdown()
+        "emergency_lockdown": guardian.check_emergency_lockdown(),
+        "sender_admission": _admission.stats()
     })
 
 
 @app.post("/guardian-unlock")
 def guardian_unlock():
     """Manual emergency lockdown unlock"""
-    guardian = EmailGuardian()
+    guardian = get_guardian()
     
     if guardian.check_emergency_lockdown():
         guardian.deactivate_emergency_lockdown()
@@ -142,21 +369,96 @@ def guardian_unlock():
         return jsonify({"message": "No active lockdown", "status": "normal"})
 
 
+def get_processor():
+    """Lazy import of bucket_to_gemini (needs GEMINI_API_KEY at import time)"""
+    global _processor
+    with _processor_lock:
+        if _processor is None:
+            try:
+                import bucket_to_gemini
+                _processor = bucket_to_gemini
+            except Exception as e:
+                logger.error(f"💥 Bucket processor unavailable: {e}")
+        return _processor
+
+
+def _run_push_processing(blob_name: str):
+    """Process a single raw object in-process; anything left over is picked up by the sweep"""
+    try:
+        guardian_result = get_guardian().guardian_check()
+        if not guardian_result.allow_processing:
+            logger.warning(f"🛡️ Push processing blocked ({guardian_result.reason}) - {blob_name} left for sweep")
+            return
+        processor = get_processor()
+        if processor and processor.process_raw_object(blob_name):
+            logger.info(f"⚡ Push processed {blob_name}")
+    except Exception as e:
+        logger.error(f"💥 Push processing error for {blob_name}: {e}")
+
+
+def schedule_push_processing(blob_name: str) -> bool:
+    """Queue a raw object for immediate processing"""
+    if not PUSH_PROCESSING:
+        return False
+    _push_executor.submit(_run_push_processing, blob_name)
+    return True
+
+
+def _stage_running_seconds(name: str) -> Optional[float]:
+    entry = _stage_futures.get(name)
+    if entry is None or entry[0].done():
+        return None
+    return time.monotonic() - entry[1]
+
+
+def stuck_stages() -> dict:
+    """{stage: running seconds} for stages running longer than STAGE_STUCK_FACTOR x their timeout"""
+    stuck = {}
+    for name, (future, started, timeout) in list(_stage_futures.items()):
+        running = time.monotonic() - started
+        if not future.done() and running > timeout * STAGE_STUCK_FACTOR:
+            stuck[name] = round(running)
+    return stuck
+
+
+def _run_stage(name: str, fn, timeout: int):
+    """Run a pipeline stage in-process; fn gets the time budget and is expected to stop on its own.
+
+    A stage still running is not started twice. Waiting ends after `timeout` - the thread itself cannot be
+    killed, so a stage that keeps running is reported as stuck (log, metric, /healthz) instead of silently
+    blocking every later cycle.
+    """
+    running = _stage_running_seconds(name)
+    if running is not None:
+        if running > timeout * STAGE_STUCK_FACTOR:
+            STAGE_SKIPS.inc(stage=name, state="stuck")
+            logger.critical(f"🚨 {name} stuck for {running:.0f}s (timeout {timeout}s) - restart the instance")
+        else:
+            STAGE_SKIPS.inc(stage=name, state="running")
+            logger.warning(f"⏳ {name} still running from previous cycle ({running:.0f}s) - skipping")
+        return None
+    # Stages stop starting new chunks after 80% of the timeout, leaving room for the chunk in flight
+    future = _stage_executor.submit(fn, timeout * 0.8)
+    _stage_futures[name] = (future, time.monotonic(), timeout)
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeout:
+        STAGE_TIMEOUTS.inc(stage=name)
+        raise
+
+
 def run_imap_fetcher():
     """Run IMAP fetcher"""
     try:
         logger.info("🔍 Starting IMAP fetcher...")
-        result = subprocess.run(['python', 'imap_fetcher.py'], 
-                              capture_output=True, text=True, timeout=120)
-        
-        if result.returncode == 0:
-            logger.info("✅ IMAP fetcher successful")
-            return True
-        else:
-            logger.error(f"❌ IMAP fetcher error: {result.stderr}")
+        result = _run_stage("imap_fetcher", lambda budget: _imap_fetcher.fetch_once(max_seconds=budget),
+                            IMAP_FETCH_TIMEOUT)
+        if result is None:
             return False
-    except subprocess.TimeoutExpired:
-        logger.error("⏰ IMAP fetcher timeout")
+        logger.info(f"✅ IMAP fetcher successful: {result.as_dict()}")
+        return True
+    except FutureTimeout:
+        logger.error(f"⏰ IMAP fetcher still running after {IMAP_FETCH_TIMEOUT}s - next cycle waits for it")
         return False
     except Exception as e:
         logger.error(f"💥 IMAP fetcher exception: {e}")
@@ -165,24 +467,25 @@ def run_imap_fetcher():
 
 def run_bucket_processor():
     """Run bucket-to-gemini processor"""
+    processor = get_processor()
+    if processor is None:
+        return False
     try:
         logger.info("🧠 Starting bucket processor...")
-        result = subprocess.run(['python', 'bucket_to_gemini.py'], 
-                              capture_output=True, text=True, timeout=300)
-        
-        if result.returncode == 0:
-            logger.info("✅ Bucket processor successful")
-            # Log important outputs
-            if "DB: tbl_kunden.id=" in result.stdout:
-                logger.info("🎉 New customers created!")
-            if "Case" in result.stdout and "abgeschlossen" in result.stdout:
-                logger.info("📋 Cases completed!")
-            return True
-        else:
-            logger.error(f"❌ Bucket processor error: {result.stderr}")
+        result = _run_stage("bucket_processor", lambda budget: processor.run_batch(max_seconds=budget),
+                            BUCKET_PROCESS_TIMEOUT)
+        if result is None:
             return False
-    except subprocess.TimeoutExpired:
-        logger.error("⏰ Bucket processor timeout")
+        logger.info(f"✅ Bucket processor successful: {result.as_dict()}")
+        if result.customers_created:
+            logger.info(f"🎉 {result.customers_created} new customers created!")
+        if result.actions.get("case_completed"):
+            logger.info(f"📋 {result.actions['case_completed']} cases completed!")
+        if result.gemini_calls_avoided:
+            logger.info(f"⚡ {result.gemini_calls_avoided} emails extracted locally (no Gemini call)")
+        return True
+    except FutureTimeout:
+        logger.error(f"⏰ Bucket processor still running after {BUCKET_PROCESS_TIMEOUT}s - next cycle waits for it")
         return False
     except Exception as e:
         logger.error(f"💥 Bucket processor exception: {e}")
@@ -194,8 +497,7 @@ def run_email_processing():
     logger.info("🚀 Starting email processing...")
     
     # 0. Guardian check - the "Spion"
-    guardian = EmailGuardian()
-    guardian_result = guardian.guardian_check()
+    guardian_result = get_guardian().guardian_check()
     
     if not guardian_result.allow_processing:
         logger.error(f"🛡️ GUARDIAN BLOCKED: {guardian_result.reason}")
@@ -208,8 +510,8 @@ def run_email_processing():
     
     logger.info(f"🛡️ Guardian approved: {guardian_result.reason}")
     
-    # 1. Fetch emails
-    fetch_success = run_imap_fetcher()
+    # 1. Fetch emails (in IDLE mode the listener thread already does this)
+    fetch_success = True if IMAP_IDLE_MODE else run_imap_fetcher()
     
     if fetch_success:
         # 2. Short wait between operations
@@ -242,6 +544,22 @@ def email_processing_worker():
             time.sleep(60)  # Wait 1 minute before retry
 
 
+def start_imap_idle_listener():
+    """Start the long-running IMAP IDLE listener if enabled"""
+    if IMAP_IDLE_MODE:
+        listener = threading.Thread(target=_imap_fetcher.run_forever, daemon=True, name="imap-idle")
+        listener.start()
+        logger.info("📬 IMAP IDLE listener started")
+
+
+def start_outbox_worker():
+    """Send queued replies in the background, including rows left over from a previous run"""
+    if smtp_outbox.outbox_enabled():
+        get_processor()  # registers the responded/ marker callback before the first send
+        smtp_outbox.start_worker()
+        logger.info("📤 SMTP outbox worker started")
+
+
 def start_background_email_processing():
     """Start background email processing if enabled"""
     if AUTO_EMAIL_PROCESSING:
@@ -254,9 +572,12 @@ def start_background_email_processing():
 
 if __name__ == "__main__":
     # Start background email processing
+    start_imap_idle_listener()
+    start_outbox_worker()
     start_background_email_processing()
     
     port = int(os.getenv("PORT", "8080"))
     logger.info(f"🌐 Starting Flask server on port {port}")
     logger.info(f"📧 Auto email processing: {'ON' if AUTO_EMAIL_PROCESSING else 'OFF'} (interval: {EMAIL_CHECK_INTERVAL}s)")
+    logger.info(f"⚡ Push processing: {'ON' if PUSH_PROCESSING else 'OFF'} (workers: {PUSH_WORKERS})")
     app.run(host="0.0.0.0", port=port)
\ No newline at end of file
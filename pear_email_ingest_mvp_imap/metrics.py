@@ -0,0 +1,242 @@
+"""
+metrics.py — PEARv2.2
+Leichtgewichtige Prozess-Metriken: Zähler und Histogramme (Zeiten) ohne externe Abhängigkeit.
+
+- counter()/histogram() legen eine Metrik einmal an (Modulebene); inc()/observe() kosten nur ein Lock,
+  ein Dict-Update und eine binäre Suche über die Buckets – bleibt im Produktivbetrieb an.
+- Histogramme haben feste Buckets (Sekunden); time() misst einen Block, timed() eine Funktion.
+  Gemessen wird auch, wenn der Block mit einer Exception endet.
+- render(): Prometheus-Textformat für GET /metrics (main.py).
+- snapshot()/summary(): Differenz seit einem Zeitpunkt als JSON (count, Summe, Mittel, p95 aus den
+  Buckets) – bucket_to_gemini gibt das am Ende jedes Batches aus. Die Werte sind prozessweit, Push-
+  Verarbeitung während des Batches zählt mit.
+- METRICS_ENABLED=false schaltet das Erfassen ab (render() liefert dann nur die leeren Metriken).
+
+ENV:
+  METRICS_ENABLED=true
+"""
+
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+
+# Sekunden: von DB-Einzelstatements (ms) bis zu Gemini-Requests und IMAP-Läufen (Minuten)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+LabelKey = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: LabelKey, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> LabelKey:
+        return tuple(str(labels.get(n, "")) for n in self.labels)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        if not METRICS_ENABLED or not amount:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def values(self) -> Dict[LabelKey, float]:
+        with self._lock:
+            return dict(self._values)
+
+    def render(self) -> list:
+        return [f"{self.name}{_format_labels(self.labels, k)} {_format_value(v)}"
+                for k, v in sorted(self.values().items())]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[LabelKey, list] = {}  # Label → [Anzahl je Bucket (+Inf am Ende), Summe]
+
+    def observe(self, value: float, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        slot = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][slot] += 1
+            entry[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def values(self) -> Dict[LabelKey, Tuple[Tuple[int, ...], float]]:
+        with self._lock:
+            return {k: (tuple(counts), total) for k, (counts, total) in self._values.items()}
+
+    def render(self) -> list:
+        lines = []
+        for key, (counts, total) in sorted(self.values().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _format_value(bound)
+                labels = _format_labels(self.labels, key, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+    def quantile(self, q: float, counts: Sequence[int]) -> Optional[float]:
+        """Quantil aus Bucket-Zählern (lineare Interpolation im Bucket, wie histogram_quantile)."""
+        total = sum(counts)
+        if not total:
+            return None
+        rank = q * total
+        cumulative = 0
+        for i, count in enumerate(counts):
+            if count and cumulative + count >= rank:
+                if i >= len(self.buckets):
+                    return self.buckets[-1]  # +Inf-Bucket: nur die Untergrenze ist bekannt
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name: str, help: str, labels: Sequence[str], **kwargs) -> Any:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, labels, **kwargs)
+            elif not isinstance(metric, cls) or metric.labels != tuple(labels):
+                raise ValueError(f"Metrik {name} bereits mit anderem Typ/anderen Labels registriert")
+            return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self._get(Counter, name, help, labels)
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help, labels, buckets=buckets)
+
+    def render(self) -> str:
+        """Alle Metriken im Prometheus-Textformat (Version 0.0.4)."""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict[str, Dict[LabelKey, Any]]:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {m.name: m.values() for m in metrics}
+
+    def summary(self, since: Optional[Dict[str, Dict[LabelKey, Any]]] = None) -> Dict[str, Any]:
+        """Änderung seit snapshot() als JSON-fähiges Dict; Metriken ohne Änderung fehlen."""
+        since = since or {}
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        out: Dict[str, Any] = {}
+        for metric in metrics:
+            before = since.get(metric.name, {})
+            for key, value in sorted(metric.values().items()):
+                label = metric.name + _format_labels(metric.labels, key)
+                if isinstance(metric, Counter):
+                    delta = value - before.get(key, 0)
+                    if delta:
+                        out[label] = delta
+                    continue
+                old_counts, old_total = before.get(key, ((0,) * len(value[0]), 0.0))
+                counts = [c - o for c, o in zip(value[0], old_counts)]
+                count, total = sum(counts), value[1] - old_total
+                if count:
+                    # Kein Einzelwert ist größer als die Summe – begrenzt die Bucket-Schätzung bei wenigen Werten
+                    p95 = min(metric.quantile(0.95, counts), total)
+                    out[label] = {"count": count, "sum_s": round(total, 3),
+                                  "avg_ms": round(total / count * 1000, 1), "p95_ms": round(p95 * 1000, 1)}
+        return out
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+    return REGISTRY.counter(name, help, labels)
+
+
+def histogram(name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.histogram(name, help, labels, buckets)
+
+
+def timed(hist: Histogram, **labels):
+    """Decorator: Laufzeit jeder Ausführung in hist."""
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with hist.time(**labels):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def render() -> str:
+    return REGISTRY.render()
+
+
+def snapshot() -> Dict[str, Dict[LabelKey, Any]]:
+    return REGISTRY.snapshot()
+
+
+def summary(since: Optional[Dict[str, Dict[LabelKey, Any]]] = None) -> Dict[str, Any]:
+    return REGISTRY.summary(since)
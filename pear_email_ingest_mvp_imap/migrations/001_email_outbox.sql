@@ -0,0 +1,20 @@
+-- Ausgangs-Warteschlange für Antworten/Erinnerungen (smtp_outbox.py)
+CREATE TABLE IF NOT EXISTS tbl_email_outbox (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    dedupe_key VARCHAR(255) NULL,           -- z.B. reply:<RAW-Objekt>, verhindert Doppel-Einträge
+    to_addr VARCHAR(255) NOT NULL,
+    subject TEXT,
+    body MEDIUMTEXT,
+    kind VARCHAR(50) NOT NULL DEFAULT 'reply',  -- reply / reminder / expired
+    ref VARCHAR(512) NULL,                  -- Bezug für on_sent (RAW-Objektname)
+    status VARCHAR(20) NOT NULL DEFAULT 'QUEUED',  -- QUEUED / SENDING / SENT / FAILED
+    attempts INT NOT NULL DEFAULT 0,
+    next_attempt_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    locked_at DATETIME NULL,
+    last_error TEXT,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    sent_at DATETIME NULL,
+    
+    UNIQUE KEY uq_dedupe_key (dedupe_key),
+    INDEX idx_status_next (status, next_attempt_at)
+);
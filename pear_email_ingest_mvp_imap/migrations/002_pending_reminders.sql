@@ -0,0 +1,9 @@
+-- Erinnerungs-Status als Spalten + Indizes für die fälligen-Fälle-Abfragen in pending_watcher.py
+-- Danach die Erinnerungs-Historie der alten Pending-JSONs übernehmen: python pending_watcher.py --backfill
+-- (sonst gelten bereits erinnerte Fälle als nie erinnert und bekommen sofort eine weitere Erinnerung)
+ALTER TABLE tbl_onboarding_pending
+    ADD COLUMN reminder_count INT NOT NULL DEFAULT 0,
+    ADD COLUMN last_reminder_at DATETIME NULL,
+    ADD INDEX idx_status_created (status, created_at),
+    ADD INDEX idx_status_updated (status, reminder_count, updated_at),
+    ADD INDEX idx_status_last_reminder (status, last_reminder_at);
@@ -0,0 +1,14 @@
+-- Normalisierte Namensschlüssel (name_match.py) als indizierte Spalten für das Namens-Matching.
+-- Danach bestehende Zeilen befüllen: python name_match.py --backfill
+ALTER TABLE tbl_onboarding_pending
+    ADD COLUMN name_key VARCHAR(255) NULL,
+    ADD COLUMN name_phonetic VARCHAR(255) NULL,
+    ADD INDEX idx_status_name_key (status, name_key),
+    ADD INDEX idx_status_name_phonetic (status, name_phonetic);
+
+ALTER TABLE tbl_kunden
+    ADD COLUMN name_key VARCHAR(255) NULL,
+    ADD COLUMN name_phonetic VARCHAR(255) NULL,
+    ADD INDEX idx_name_key (name_key),
+    ADD INDEX idx_name_phonetic (name_phonetic),
+    ADD INDEX idx_kontakt_email (kontakt_email);
@@ -0,0 +1,11 @@
+-- Guardian-Zähler (email_guardian.py) prozessübergreifend: ein Zähler pro Ereignis, Absender und Minute.
+-- Server, Skripte und alle Instanzen schreiben ihre Deltas hierher; alte Minuten werden vom Guardian gelöscht.
+CREATE TABLE IF NOT EXISTS tbl_guardian_usage (
+    event VARCHAR(50) NOT NULL,             -- emails / quarantined / gemini_calls / smtp_sends
+    sender VARCHAR(255) NOT NULL DEFAULT '',  -- '' = Summe über alle Absender
+    minute INT NOT NULL,                    -- Unix-Zeit // 60
+    count INT NOT NULL DEFAULT 0,
+
+    PRIMARY KEY (event, sender, minute),
+    INDEX idx_event_minute (event, minute)
+);
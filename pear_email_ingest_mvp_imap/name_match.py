@@ -0,0 +1,186 @@
+"""
+name_match.py — PEARv2.2
+Normalisierte Namensschlüssel für das Namens-Matching (tbl_onboarding_pending, tbl_kunden).
+
+- name_key: kleingeschrieben, Umlaute gefaltet (ä→ae, ß→ss, Akzente entfernt), Anreden/Titel
+  entfernt, Tokens sortiert → "Müller, Hans" und "Hans Mueller" ergeben beide "hans mueller".
+- name_phonetic: Kölner Phonetik je Token, sortiert → "Meyer"/"Maier"/"Mayer" ergeben denselben Code.
+- Beide Schlüssel liegen als indizierte Spalten in der DB (migrations/003_name_match.sql) und werden bei
+  Insert/Update mitgeschrieben; die Suche ist ein Gleichheits-Lookup statt LIKE '%name%'
+  ("Anna" passt damit nicht mehr auf "Johanna Müller").
+- Automatisch zugeordnet wird nur bei exakt gleichem name_key (best_match). Phonetik und difflib sind zu
+  unscharf ("Maria Weber"/"Mario Weber", "Anna"/"Hanna Schmidt" liegen über 0.9) und dienen nur dazu,
+  Kandidaten zu ordnen und zur Prüfung zu melden (review_candidates, ab NAME_MATCH_MIN_SCORE).
+- Bestehende Zeilen ohne Schlüssel: python name_match.py --backfill
+
+ENV:
+  NAME_MATCH_MIN_SCORE=0.8, NAME_BACKFILL_BATCH=500
+  DB_HOST, DB_PORT=3306, DB_USER, DB_PASSWORD, DB_NAME (nur für --backfill)
+"""
+
+import os
+import re
+import sys
+import unicodedata
+from difflib import SequenceMatcher
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+import db_pool
+
+load_dotenv()
+
+NAME_MATCH_MIN_SCORE = float(os.getenv("NAME_MATCH_MIN_SCORE", "0.8"))
+NAME_BACKFILL_BATCH = int(os.getenv("NAME_BACKFILL_BATCH", "500"))
+
+_FOLD = str.maketrans({"ä": "ae", "ö": "oe", "ü": "ue", "ß": "ss"})
+_NON_ALPHA = re.compile(r"[^a-z]+")
+# Anreden/Titel tragen nichts zur Identität bei ("Frau Dr. Anna Müller" == "Anna Müller")
+_STOPWORDS = {"herr", "herrn", "frau", "dr", "prof", "med", "dipl", "ing"}
+# Kölner Phonetik: C wird vor diesen Buchstaben hart (4) gesprochen
+_C_HARD_INITIAL = set("ahkloqrux")
+_C_HARD = set("ahkoqux")
+
+def _tokens(name: Optional[str]) -> list:
+    text = (name or "").lower().translate(_FOLD)
+    text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii")
+    return [t for t in _NON_ALPHA.split(text) if t and t not in _STOPWORDS]
+
+def name_key(name: Optional[str]) -> str:
+    """Vergleichsschlüssel: gefaltete, sortierte Tokens ("" wenn kein verwertbarer Name)."""
+    return " ".join(sorted(_tokens(name)))
+
+def koelner_phonetik(word: str) -> str:
+    """Kölner Phonetik für ein bereits gefaltetes Token (nur a-z)."""
+    codes = []
+    n = len(word)
+    for i, ch in enumerate(word):
+        prev = word[i - 1] if i > 0 else ""
+        nxt = word[i + 1] if i + 1 < n else ""
+        if ch in "aeijouy":
+            code = "0"
+        elif ch == "h":
+            code = ""
+        elif ch == "b":
+            code = "1"
+        elif ch == "p":
+            code = "3" if nxt == "h" else "1"
+        elif ch in "dt":
+            code = "8" if nxt in ("c", "s", "z") else "2"
+        elif ch in "fvw":
+            code = "3"
+        elif ch in "gkq":
+            code = "4"
+        elif ch == "c":
+            if i == 0:
+                code = "4" if nxt in _C_HARD_INITIAL else "8"
+            else:
+                code = "4" if nxt in _C_HARD and prev not in ("s", "z") else "8"
+        elif ch == "x":
+            code = "8" if prev in ("c", "k", "q") else "48"
+        elif ch == "l":
+            code = "5"
+        elif ch in "mn":
+            code = "6"
+        elif ch == "r":
+            code = "7"
+        elif ch in "sz":
+            code = "8"
+        else:
+            code = ""
+        codes.append(code)
+
+    collapsed = []
+    for digit in "".join(codes):
+        if not collapsed or collapsed[-1] != digit:
+            collapsed.append(digit)
+    if not collapsed:
+        return ""
+    # "0" nur am Anfang behalten
+    return collapsed[0] + "".join(d for d in collapsed[1:] if d != "0")
+
+def phonetic_key(name: Optional[str]) -> str:
+    """Sortierte Kölner-Phonetik-Codes aller Tokens."""
+    return " ".join(sorted(filter(None, (koelner_phonetik(t) for t in _tokens(name)))))
+
+def match_keys(name: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    """(name_key, name_phonetic) für die DB-Spalten; None statt "" damit leere Namen nie matchen."""
+    return (name_key(name) or None), (phonetic_key(name) or None)
+
+def similarity(a: Optional[str], b: Optional[str]) -> float:
+    """Ähnlichkeit zweier Namen (0..1) auf Basis der normalisierten Schlüssel."""
+    ka, kb = name_key(a), name_key(b)
+    if not ka or not kb:
+        return 0.0
+    if ka == kb:
+        return 1.0
+    return SequenceMatcher(None, ka, kb).ratio()
+
+def best_match(name: str, rows: Iterable[Dict[str, Any]],
+               row_name: Callable[[Dict[str, Any]], Optional[str]]) -> Optional[Dict[str, Any]]:
+    """Erste Zeile mit exakt gleichem name_key (Abfragereihenfolge), sonst None."""
+    key = name_key(name)
+    if not key:
+        return None
+    for row in rows:
+        if name_key(row_name(row)) == key:
+            return row
+    return None
+
+def review_candidates(name: str, rows: Iterable[Dict[str, Any]], row_name: Callable[[Dict[str, Any]], Optional[str]],
+                      min_score: float = NAME_MATCH_MIN_SCORE) -> List[Tuple[float, Dict[str, Any]]]:
+    """Ähnliche, aber nicht gleiche Namen als (Score, Zeile), absteigend – nur zur Prüfung, nie zum Zuordnen."""
+    key = name_key(name)
+    ranked = []
+    for row in rows:
+        if name_key(row_name(row)) == key:
+            continue
+        score = similarity(name, row_name(row))
+        if score >= min_score:
+            ranked.append((score, row))
+    ranked.sort(key=lambda item: item[0], reverse=True)
+    return ranked
+
+# ---------------- Backfill ----------------
+_BACKFILL_TABLES = {
+    # Tabelle: (Primärschlüssel, SQL-Ausdruck für den Namen)
+    "tbl_onboarding_pending": ("id", "COALESCE(NULLIF(name_vollstaendig, ''), CONCAT_WS(' ', first_name, last_name))"),
+    "tbl_kunden": ("kunden_id", "name_vollstaendig"),
+}
+
+def backfill(batch_size: int = NAME_BACKFILL_BATCH) -> Dict[str, int]:
+    """Schlüssel für Zeilen ohne name_key nachtragen (batchweise, ein UPDATE-executemany pro Batch)."""
+    stats = {table: 0 for table in _BACKFILL_TABLES}
+    if not db_pool.db_configured():
+        print("INFO: DB nicht konfiguriert – kein Backfill möglich.")
+        return stats
+    with db_pool.connection("name_backfill") as conn:
+        cur = conn.cursor()
+        for table, (pk, name_expr) in _BACKFILL_TABLES.items():
+            last_id = 0
+            while True:
+                cur.execute(f"""
+                    SELECT {pk}, {name_expr} FROM {table}
+                    WHERE name_key IS NULL AND {pk} > %s
+                    ORDER BY {pk} LIMIT %s
+                """, (last_id, batch_size))
+                rows = cur.fetchall()
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+                updates = [match_keys(name) + (row_id,) for row_id, name in rows if name_key(name)]
+                if updates:
+                    cur.executemany(f"UPDATE {table} SET name_key = %s, name_phonetic = %s WHERE {pk} = %s", updates)
+                    conn.commit()
+                stats[table] += len(updates)
+                print(f"INFO: {table}: {stats[table]} Schlüssel nachgetragen (bis {pk}={last_id}).")
+        cur.close()
+    return stats
+
+if __name__ == "__main__":
+    if "--backfill" in sys.argv[1:]:
+        print(f"Ergebnis: {backfill()}")
+    else:
+        for arg in sys.argv[1:]:
+            print(f"{arg!r}: key={name_key(arg)!r} phonetic={phonetic_key(arg)!r}")
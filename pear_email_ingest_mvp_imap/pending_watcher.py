@@ -1,114 +1,62 @@
 """
-Dieses Skript `bucket_to_gemini.py` automatisiert die Verarbeitung von E-Mails im GCS-Bucket, um Kundendaten zu extrahieren, zu validieren und ggf. fehlende Informationen direkt beim Absender nachzufordern.
-
-Ablaufübersicht:
-
-1. **E-Mail aus GCS laden** – Rohdaten der E-Mail werden aus dem `raw/`-Bucket-Pfad gelesen.
-2. **Datenextraktion mit Gemini** – Name, Vor-/Nachname, Adresse, E-Mail, Telefonnummer, PLZ, Ort werden aus dem Nachrichtentext erkannt.
-3. **Validierung & Confidence** – Liste `missing` enthält alle fehlenden Pflichtfelder. Falls leer → `confidence = 1.0`; sonst wird `confidence` auf max. 0.95 begrenzt.
-4. **Status setzen** – Vollständige Datensätze werden als `parsed` markiert, unvollständige als `pending`.
-5. **Speichern** – Ergebnisse werden im `parsed/`-Pfad des Buckets gespeichert.
-6. **Automatische Rückfrage** – Bei fehlenden Pflichtfeldern wird automatisch eine E-Mail an den Absender (`From`-Adresse) mit einer Liste der fehlenden Angaben versendet.
-
-Vorteile:
-
-* Direkte Nachforderung fehlender Kundendaten ohne manuelle Prüfung.
-* Original-E-Mails bleiben unverändert gespeichert.
-* Vollständige Datensätze können sofort weiterverarbeitet werden.
-  """
-
+pending_watcher.py — PEARv2.2
+Erinnerungen und Ablauf für offene Fälle in tbl_onboarding_pending (läuft z.B. per Cron).
+
+- Nur fällige Fälle werden gelesen – drei indizierte Abfragen auf status + Zeitstempel statt
+  Listing und Download aller Pending-JSONs:
+  * erste Erinnerung: reminder_count = 0 und letzte Aktivität (updated_at) älter als REMIND_AFTER_HOURS
+  * weitere Erinnerung: last_reminder_at älter als REMIND_EVERY_HOURS
+  * Ablauf: created_at älter als EXPIRE_AFTER_DAYS → status EXPIRED + Abschluss-Mail
+- reminder_count / last_reminder_at sind Spalten (migrations/002_pending_reminders.sql);
+  Reminder-Updates lassen updated_at unverändert, damit es die letzte Kunden-Aktivität bleibt.
+- Fälligkeit wird in SQL gegen NOW() der DB geprüft – dieselbe Uhr, die last_reminder_at schreibt.
+- Mails werden gesammelt in die Outbox eingereiht (smtp_outbox.enqueue_many), der Status
+  pro Aktion mit einem UPDATE ... WHERE case_id IN (...) fortgeschrieben – nur wenn das Einreihen klappt.
+- Erinnerungs-Historie aus den alten Pending-JSONs (GCS pending/, "history" mit REMINDER_SENT)
+  einmalig übernehmen: python pending_watcher.py --backfill
+
+ENV:
+  DB_HOST, DB_PORT=3306, DB_USER, DB_PASSWORD, DB_NAME
+  REMIND_AFTER_HOURS=48, REMIND_EVERY_HOURS=48, EXPIRE_AFTER_DAYS=14, PENDING_WATCH_BATCH=200
+  PROJECT_ID, GCS_BUCKET, PENDING_PREFIX=pending/ (nur für --backfill)
+"""
 
-import os, json, smtplib
-from datetime import datetime, timedelta
-from typing import Optional, List
-from email.mime.text import MIMEText
-from email.utils import formataddr
+import os, sys, json
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
 
 from dotenv import load_dotenv
-from google.cloud import storage
-
-load_dotenv()
+from mysql.connector import Error
 
-PROJECT_ID      = os.getenv("PROJECT_ID", "pearv2")
-GCS_BUCKET      = os.getenv("GCS_BUCKET", "pear-email-inbox-raw-pearv2")
+import db_pool
+import smtp_outbox
 
-PENDING_PREFIX  = os.getenv("PENDING_PREFIX", "pending/")
-COMPLETE_PREFIX = os.getenv("COMPLETE_PREFIX", "complete/")
-EXPIRED_PREFIX  = os.getenv("EXPIRED_PREFIX", "expired/")
+load_dotenv()
 
 # Reminder-/Ablauf-Politik
 REMIND_AFTER_HOURS = int(os.getenv("REMIND_AFTER_HOURS", "48"))   # erste Erinnerung nach 48h
 REMIND_EVERY_HOURS = int(os.getenv("REMIND_EVERY_HOURS", "48"))   # weitere Erinnerungen alle 48h
-# Falls expires_at im Pending vorhanden ist, nutzen wir das. Sonst Fallback:
 EXPIRE_AFTER_DAYS  = int(os.getenv("EXPIRE_AFTER_DAYS", "14"))
+PENDING_WATCH_BATCH = int(os.getenv("PENDING_WATCH_BATCH", "200"))  # max. Fälle pro Abfrage und Lauf
 
-# SMTP
-SMTP_HOST     = os.getenv("SMTP_HOST")
-SMTP_PORT     = int(os.getenv("SMTP_PORT", "587"))
-SMTP_USER     = os.getenv("SMTP_USER")
-SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
-SMTP_FROM     = os.getenv("SMTP_FROM", "PEAR Ingest <noreply@pear-app.de>")
-SMTP_USE_SSL  = os.getenv("SMTP_USE_SSL", "false").lower() == "true"
-
-def _now() -> datetime:
-    return datetime.utcnow()
-
-def _now_iso() -> str:
-    return _now().isoformat(timespec="seconds") + "Z"
-
-def send_email(to_addr: Optional[str], subject: str, body: str) -> bool:
-    if not (SMTP_HOST and SMTP_USER and SMTP_PASSWORD and SMTP_FROM and to_addr):
-        print("SMTP nicht konfiguriert oder Empfänger fehlt – Versand übersprungen.")
-        return False
-    msg = MIMEText(body, _charset="utf-8")
-    msg["From"] = SMTP_FROM if "<" in SMTP_FROM else formataddr(("PEAR Ingest", SMTP_FROM))
-    msg["To"] = to_addr
-    msg["Subject"] = subject
-    if SMTP_USE_SSL:
-        with smtplib.SMTP_SSL(SMTP_HOST, SMTP_PORT) as s:
-            s.login(SMTP_USER, SMTP_PASSWORD); s.send_message(msg)
-    else:
-        with smtplib.SMTP(SMTP_HOST, SMTP_PORT) as s:
-            s.ehlo(); s.starttls(); s.login(SMTP_USER, SMTP_PASSWORD); s.send_message(msg)
-    return True
-
-def _parse_iso(ts: str) -> Optional[datetime]:
-    if not ts: return None
+# nur für --backfill (alte Pending-JSONs)
+PROJECT_ID     = os.getenv("PROJECT_ID", "pearv2")
+GCS_BUCKET     = os.getenv("GCS_BUCKET", "pear-email-inbox-raw-pearv2")
+PENDING_PREFIX = os.getenv("PENDING_PREFIX", "pending/")
+
+_COLUMNS = "case_id, case_tag, source_sender, source_subject, raw_data, reminder_count"
+
+def _missing_fields(row: Dict[str, Any]) -> List[str]:
+    raw = row.get("raw_data")
     try:
-        # ISO mit 'Z' am Ende
-        if ts.endswith("Z"):
-            ts = ts[:-1]
-        return datetime.fromisoformat(ts)
-    except Exception:
-        return None
+        data = json.loads(raw) if isinstance(raw, (str, bytes, bytearray)) else (raw or {})
+    except ValueError:
+        data = {}
+    return list(data.get("missing") or []) if isinstance(data, dict) else []
 
-def _history_add(doc: dict, event: str, extra: Optional[dict] = None):
-    doc.setdefault("history", [])
-    entry = {"ts": _now_iso(), "event": event}
-    if extra: entry.update(extra)
-    doc["history"].append(entry)
-
-def _move_json(bucket: storage.Bucket, src_path: str, dst_path: str, doc: dict):
-    # in GCS: "kopieren" = neu schreiben, dann alte löschen
-    bucket.blob(dst_path).upload_from_string(
-        json.dumps(doc, ensure_ascii=False, indent=2), content_type="application/json"
-    )
-    bucket.blob(src_path).delete()
-
-def _needs_first_reminder(created_at: datetime, history: List[dict]) -> bool:
-    # keine Erinnerung bisher?
-    any_reminder = any(h.get("event") == "REMINDER_SENT" for h in history or [])
-    if any_reminder:
-        return False
-    return _now() >= created_at + timedelta(hours=REMIND_AFTER_HOURS)
-
-def _needs_next_reminder(last_reminder_at: datetime) -> bool:
-    return _now() >= last_reminder_at + timedelta(hours=REMIND_EVERY_HOURS)
-
-def _last_event_time(history: List[dict], event: str) -> Optional[datetime]:
-    times = [_parse_iso(h.get("ts")) for h in history or [] if h.get("event") == event]
-    times = [t for t in times if t]
-    return max(times) if times else None
+def _tagged_subject(row: Dict[str, Any]) -> str:
+    """Betreff mit Case-Tag, damit die Antwort wieder dem Fall zugeordnet wird."""
+    return f"[PEAR-{row['case_tag']}] – {row.get('source_subject') or ''}".strip()
 
 def _compose_reminder(subject: str, missing: List[str]) -> tuple[str, str]:
     sub = f"Erinnerung: Bitte ergänzen Sie fehlende Angaben – {subject or ''}".strip()
@@ -128,13 +76,168 @@ def _compose_expired(subject: str) -> tuple[str, str]:
             "Freundliche Grüße\nIhr PEAR-Team")
     return sub, body
 
-def main():
-    client = storage.Client(project=PROJECT_ID)
-    bucket = client.bucket(GCS_BUCKET)
+def find_due_cases(cur) -> Dict[str, List[Dict[str, Any]]]:
+    """Fällige Fälle je Aktion; jede Abfrage läuft über einen (status, Zeitstempel)-Index.
+    Verglichen wird mit NOW() der DB – wie beim Schreiben von last_reminder_at, unabhängig von Uhr/Zeitzone des Hosts."""
+    cur.execute(f"""
+        SELECT {_COLUMNS} FROM tbl_onboarding_pending
+        WHERE status = 'PENDING' AND created_at <= NOW() - INTERVAL %s DAY
+        ORDER BY created_at LIMIT %s
+    """, (EXPIRE_AFTER_DAYS, PENDING_WATCH_BATCH))
+    expired = cur.fetchall()
+
+    cur.execute(f"""
+        SELECT {_COLUMNS} FROM tbl_onboarding_pending
+        WHERE status = 'PENDING' AND reminder_count = 0 AND updated_at <= NOW() - INTERVAL %s HOUR
+          AND created_at > NOW() - INTERVAL %s DAY
+        ORDER BY updated_at LIMIT %s
+    """, (REMIND_AFTER_HOURS, EXPIRE_AFTER_DAYS, PENDING_WATCH_BATCH))
+    first = cur.fetchall()
+
+    cur.execute(f"""
+        SELECT {_COLUMNS} FROM tbl_onboarding_pending
+        WHERE status = 'PENDING' AND last_reminder_at <= NOW() - INTERVAL %s HOUR
+          AND created_at > NOW() - INTERVAL %s DAY
+        ORDER BY last_reminder_at LIMIT %s
+    """, (REMIND_EVERY_HOURS, EXPIRE_AFTER_DAYS, PENDING_WATCH_BATCH))
+    again = cur.fetchall()
+    return {"expired": expired, "reminder": first + again}
+
+def _in_clause(ids: List[str]) -> str:
+    return ", ".join(["%s"] * len(ids))
+
+def send_reminders(cur, rows: List[Dict[str, Any]]) -> int:
+    """Erinnerungen gesammelt einreihen, dann reminder_count/last_reminder_at in einem UPDATE setzen."""
+    mails = []
+    for row in rows:
+        sub, body = _compose_reminder(_tagged_subject(row), _missing_fields(row))
+        mails.append({"to_addr": row.get("source_sender"), "subject": sub, "body": body, "kind": "reminder",
+                      "dedupe_key": f"reminder:{row['case_id']}:{int(row.get('reminder_count') or 0) + 1}"})
+    if any(m["to_addr"] for m in mails) and not smtp_outbox.enqueue_many(mails):
+        print("ERROR: Erinnerungen konnten nicht eingereiht werden – nächster Lauf versucht es erneut.")
+        return 0
+    # Fälle ohne Absender zählen mit, sonst würden sie bei jedem Lauf erneut gewählt
+    ids = [row["case_id"] for row in rows]
+    if ids:
+        cur.execute(f"""
+            UPDATE tbl_onboarding_pending
+            SET reminder_count = reminder_count + 1, last_reminder_at = NOW(), updated_at = updated_at
+            WHERE case_id IN ({_in_clause(ids)})
+        """, ids)
+    return len(ids)
+
+def expire_cases(cur, rows: List[Dict[str, Any]]) -> int:
+    """Abschluss-Mails gesammelt einreihen, dann status EXPIRED in einem UPDATE setzen."""
+    mails = []
+    for row in rows:
+        sub, body = _compose_expired(_tagged_subject(row))
+        mails.append({"to_addr": row.get("source_sender"), "subject": sub, "body": body, "kind": "expired",
+                      "dedupe_key": f"expired:{row['case_id']}"})
+    if any(m["to_addr"] for m in mails) and not smtp_outbox.enqueue_many(mails):
+        print("ERROR: Ablauf-Mails konnten nicht eingereiht werden – nächster Lauf versucht es erneut.")
+        return 0
+    ids = [row["case_id"] for row in rows]
+    if ids:
+        # Auch ohne zustellbare Mail schließen – sonst würde der Fall bei jedem Lauf erneut gewählt
+        cur.execute(f"""
+            UPDATE tbl_onboarding_pending SET status = 'EXPIRED', updated_at = updated_at
+            WHERE case_id IN ({_in_clause(ids)}) AND status = 'PENDING'
+        """, ids)
+    return len(ids)
+
+def run_once() -> Dict[str, int]:
+    """Ein Durchlauf: fällige Fälle erinnern bzw. ablaufen lassen."""
+    stats = {"due": 0, "reminded": 0, "expired": 0}
+    if not db_pool.db_configured():
+        print("INFO: DB nicht konfiguriert – keine Pending-Fälle prüfbar.")
+        return stats
+    try:
+        with db_pool.connection("pending_watch") as conn:
+            cur = conn.cursor(dictionary=True)
+            due = find_due_cases(cur)
+            stats["due"] = len(due["expired"]) + len(due["reminder"])
+            if stats["due"]:
+                print(f"Fällig: {len(due['reminder'])} Erinnerungen, {len(due['expired'])} Abläufe.")
+                stats["expired"] = expire_cases(cur, due["expired"])
+                stats["reminded"] = send_reminders(cur, due["reminder"])
+                conn.commit()
+            else:
+                print("Keine fälligen pending-Fälle.")
+            cur.close()
+    except Error as e:
+        print(f"ERROR: DB-Fehler im Pending-Watcher: {e}")
+    return stats
+
+def _parse_ts(ts: Any) -> Optional[datetime]:
+    if not isinstance(ts, str) or not ts:
+        return None
+    try:
+        return datetime.fromisoformat(ts[:-1] if ts.endswith("Z") else ts)
+    except ValueError:
+        return None
 
-    pendings = list(bucket.list_blobs(prefix=PENDING_PREFIX))
-    if not pendings:
-        print("Keine pending-Fälle gefunden."); return
+def reminder_history(doc: Dict[str, Any]) -> Tuple[int, Optional[datetime]]:
+    """Anzahl REMINDER_SENT-Einträge und Zeitpunkt des letzten aus der "history" eines alten Pending-JSONs."""
+    history = doc.get("history") if isinstance(doc, dict) else None
+    sent = [h for h in history or [] if isinstance(h, dict) and h.get("event") == "REMINDER_SENT"]
+    times = [t for t in (_parse_ts(h.get("ts")) for h in sent) if t]
+    return len(sent), (max(times) if times else None)
+
+def backfill(batch_size: int = PENDING_WATCH_BATCH) -> Dict[str, int]:
+    """Erinnerungs-Historie der alten Pending-JSONs (GCS) nach reminder_count/last_reminder_at übernehmen.
+
+    Fall-ID: "case_id" im JSON, sonst der Dateiname ohne .json. Werte werden nur erhöht (GREATEST),
+    ein erneuter Lauf oder inzwischen verschickte Erinnerungen gehen nicht verloren. Die alten Zeitstempel
+    sind UTC; bei abweichender DB-Zeitzone verschiebt sich die nächste Erinnerung um diesen Versatz. Fehlt der
+    Zeitstempel, gilt der Backfill-Zeitpunkt als letzte Erinnerung.
+    """
+    stats = {"files": 0, "with_history": 0, "updated": 0}
+    if not db_pool.db_configured():
+        print("INFO: DB nicht konfiguriert – kein Backfill möglich.")
+        return stats
+    from google.cloud import storage  # nur für den einmaligen Backfill nötig
+
+    bucket = storage.Client(project=PROJECT_ID).bucket(GCS_BUCKET)
+    rows: List[tuple] = []
+    for blob in bucket.list_blobs(prefix=PENDING_PREFIX):
+        if not blob.name.endswith(".json"):
+            continue
+        stats["files"] += 1
+        try:
+            doc = json.loads(blob.download_as_bytes())
+        except ValueError:
+            print(f"WARN: {blob.name} ist kein gültiges JSON – übersprungen.")
+            continue
+        count, last_at = reminder_history(doc)
+        if not count:
+            continue
+        stats["with_history"] += 1
+        case_id = (doc.get("case_id") if isinstance(doc, dict) else None) or os.path.basename(blob.name)[:-len(".json")]
+        rows.append((count, last_at, last_at, case_id))
+
+    with db_pool.connection("pending_backfill") as conn:
+        cur = conn.cursor()
+        for i in range(0, len(rows), batch_size):
+            cur.executemany("""
+                UPDATE tbl_onboarding_pending
+                SET reminder_count = GREATEST(reminder_count, %s),
+                    last_reminder_at = GREATEST(COALESCE(last_reminder_at, COALESCE(%s, NOW())), COALESCE(%s, NOW())),
+                    updated_at = updated_at
+                WHERE case_id = %s
+            """, rows[i:i + batch_size])
+            stats["updated"] += max(cur.rowcount, 0)
+            conn.commit()
+        cur.close()
+    return stats
 
-    print(f"Prüfe {len(pendings)} pending-Fälle...")
-   
+def main():
+    if "--backfill" in sys.argv[1:]:
+        print(f"Ergebnis: {json.dumps(backfill())}")
+        return
+    stats = run_once()
+    print(f"Ergebnis: {json.dumps(stats)}")
+    # Kurzläufer: eingereihte Mails noch selbst versenden
+    smtp_outbox.drain()
+
+if __name__ == "__main__":
+    main()
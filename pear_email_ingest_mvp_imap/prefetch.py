@@ -0,0 +1,61 @@
+"""
+prefetch.py — PEARv2.2
+Vorausladen von Objekten (z.B. RAW-JSONs aus GCS) als begrenzte Producer/Consumer-Pipeline.
+
+- PREFETCH_WORKERS Threads laden parallel, während der Verbraucher die vorherigen Objekte verarbeitet.
+- Höchstens PREFETCH_DEPTH Objekte sind gleichzeitig in Arbeit oder geladen; der nächste Download
+  startet erst, wenn der Verbraucher eines abgeholt hat – der Speicher bleibt flach, egal wie groß
+  der Batch ist.
+- Ergebnisse kommen in Eingangsreihenfolge (wichtig für das chronologische Mergen der Fälle),
+  jeweils mit Ladezeit und Wartezeit des Verbrauchers.
+
+ENV:
+  PREFETCH_WORKERS=8, PREFETCH_DEPTH=64
+"""
+
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable, Iterator, Tuple
+
+PREFETCH_WORKERS = int(os.getenv("PREFETCH_WORKERS", "8"))
+PREFETCH_DEPTH = int(os.getenv("PREFETCH_DEPTH", "64"))
+
+_END = object()
+
+
+class PrefetchReader:
+    def __init__(self, load: Callable[[Any], Any], workers: int = PREFETCH_WORKERS, depth: int = PREFETCH_DEPTH):
+        self.load = load
+        self.workers = max(1, workers)
+        self.depth = max(1, depth)
+
+    def _timed_load(self, item) -> Tuple[Any, float]:
+        started = time.perf_counter()
+        return self.load(item), time.perf_counter() - started
+
+    def iter(self, items: Iterable[Any]) -> Iterator[Tuple[Any, Any, float, float]]:
+        """(item, Ergebnis, Ladezeit s, Wartezeit s) in Eingangsreihenfolge."""
+        source = iter(items)
+        window = deque()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="prefetch") as pool:
+            try:
+                for item in source:
+                    window.append((item, pool.submit(self._timed_load, item)))
+                    if len(window) >= self.depth:
+                        break
+                while window:
+                    item, future = window.popleft()
+                    started = time.perf_counter()
+                    loaded, seconds = future.result()
+                    waited = time.perf_counter() - started
+                    nxt = next(source, _END)
+                    if nxt is not _END:
+                        window.append((nxt, pool.submit(self._timed_load, nxt)))
+                    yield item, loaded, seconds, waited
+            finally:
+                # Verbraucher bricht ab: noch nicht gestartete Downloads verwerfen
+                for _, future in window:
+                    future.cancel()
+
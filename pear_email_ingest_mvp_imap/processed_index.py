@@ -0,0 +1,206 @@
+"""
+processed_index.py — PEARv2.2
+Dauerhafter Index der verarbeiteten RAW-Objekte (ersetzt den exists()-Check pro Blob).
+
+Manifest-Objekt im Bucket (PROCESSED_INDEX_OBJECT, JSON):
+  high_water  – time_created (Epoch) bis zu dem ALLE RAW-Objekte erledigt sind
+  done        – erledigte Objekte oberhalb der High-Water-Mark (name → time_created)
+  attempts    – fehlgeschlagene Antwortversuche pro Objekt; ab PROCESSED_MAX_ATTEMPTS wird aufgegeben
+
+RAW-Objekte liegen zeitlich partitioniert unter raw/YYYY/MM/DD/HH/<sha>.json (UTC-Stunde des Uploads,
+raw_partition()); ältere Objekte direkt unter raw/<sha>.json.
+
+- Fehlt das Manifest, wird es einmalig aus responded/ und einem vollen RAW-Listing aufgebaut.
+- Jeder Lauf betrachtet nur Objekte, die nach der High-Water-Mark angelegt wurden; list_offset() liefert
+  dafür den Startpunkt des Listings (Partition der High-Water-Mark minus Vorlauf), ältere Partitionen
+  werden gar nicht erst aufgezählt.
+- Schreiben mit if_generation_match; bei parallelem Update wird neu geladen und gemerged.
+
+ENV:
+  PROCESSED_INDEX_OBJECT=state/processed_index.json, PROCESSED_MAX_ATTEMPTS=3
+  PROCESSED_INDEX_SAFETY_SECONDS=60 (so frische Objekte heben die High-Water-Mark noch nicht an)
+"""
+
+import json
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from google.api_core import exceptions as gcs_exceptions
+from google.cloud import storage
+
+
+RAW_PARTITION_FORMAT = "%Y/%m/%d/%H/"
+
+
+def raw_partition(ts: float) -> str:
+    """Partition (UTC-Stunde) für ein zum Zeitpunkt ts angelegtes RAW-Objekt, z.B. "2026/10/16/09/"."""
+    return time.strftime(RAW_PARTITION_FORMAT, time.gmtime(max(0.0, ts)))
+
+
+def blob_created_ts(blob) -> float:
+    """time_created eines Blobs als Epoch-Sekunden (0.0 wenn unbekannt)."""
+    return blob.time_created.timestamp() if blob.time_created else 0.0
+
+
+class ProcessedIndex:
+    def __init__(self, bucket: storage.Bucket, object_name: str, raw_prefix: str, resp_prefix: str,
+                 max_attempts: int = 3, safety_seconds: int = 60):
+        self.bucket = bucket
+        self.object_name = object_name
+        self.raw_prefix = raw_prefix
+        self.resp_prefix = resp_prefix
+        self.max_attempts = max(1, max_attempts)
+        self.safety_seconds = safety_seconds
+        self.high_water: Optional[float] = None
+        self.done: Dict[str, float] = {}
+        self.attempts: Dict[str, int] = {}
+        self._generation: Optional[int] = None
+        self._dirty = False
+        self._lock = threading.RLock()
+
+    # ---------------- Laden / Speichern ----------------
+    def _read_remote(self) -> Tuple[Optional[dict], Optional[int]]:
+        blob = self.bucket.blob(self.object_name)
+        try:
+            text = blob.download_as_text()
+        except gcs_exceptions.NotFound:
+            return None, 0
+        return json.loads(text or "{}"), blob.generation
+
+    def load(self):
+        state, generation = self._read_remote()
+        with self._lock:
+            self._generation = generation
+            if state is None:
+                self._bootstrap()
+                return
+            self.high_water = state.get("high_water")
+            self.done = {k: float(v) for k, v in (state.get("done") or {}).items()}
+            self.attempts = {k: int(v) for k, v in (state.get("attempts") or {}).items()}
+
+    def refresh(self):
+        """Eigene Änderungen sichern und parallel geschriebene Stände (andere Instanzen) übernehmen."""
+        with self._lock:
+            self.save()
+            state, generation = self._read_remote()
+            if state is not None:
+                self._merge(state)
+                self._generation = generation
+
+    def _bootstrap(self):
+        """Einmaliger Aufbau aus responded/*.sent (Marker tragen nur den Hash, die Partition kommt aus dem RAW-Listing)."""
+        client = self.bucket.client
+        responded = {b.name.split("/")[-1][:-len(".sent")]
+                     for b in client.list_blobs(self.bucket.name, prefix=self.resp_prefix) if b.name.endswith(".sent")}
+        count = 0
+        for b in client.list_blobs(self.bucket.name, prefix=self.raw_prefix):
+            if b.name.endswith(".json") and b.name.split("/")[-1][:-len(".json")] in responded:
+                self.done[b.name] = blob_created_ts(b)
+                count += 1
+        self._dirty = True
+        print(f"INFO: Verarbeitungs-Index neu aufgebaut aus {self.resp_prefix}: {count} erledigte Dateien.")
+
+    def _to_json(self) -> str:
+        return json.dumps({
+            "version": 1,
+            "high_water": self.high_water,
+            "done": self.done,
+            "attempts": self.attempts,
+            "saved_at": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        }, ensure_ascii=False)
+
+    def _merge(self, state: dict):
+        remote_hw = state.get("high_water")
+        if remote_hw is not None and (self.high_water is None or remote_hw > self.high_water):
+            self.high_water = remote_hw
+        for k, v in (state.get("done") or {}).items():
+            self.done[k] = max(float(v), self.done.get(k, 0.0))
+        for k, v in (state.get("attempts") or {}).items():
+            self.attempts[k] = max(int(v), self.attempts.get(k, 0))
+        self._prune()
+
+    def save(self, retries: int = 3):
+        with self._lock:
+            if not self._dirty:
+                return
+            for _ in range(retries):
+                blob = self.bucket.blob(self.object_name)
+                try:
+                    blob.upload_from_string(self._to_json(), content_type="application/json",
+                                            if_generation_match=self._generation or 0)
+                    self._generation = blob.generation
+                    self._dirty = False
+                    return
+                except gcs_exceptions.PreconditionFailed:
+                    state, generation = self._read_remote()
+                    if state is not None:
+                        self._merge(state)
+                    self._generation = generation
+            print("ERROR: Verarbeitungs-Index konnte nicht gespeichert werden (parallele Updates).")
+
+    # ---------------- Abfragen / Updates ----------------
+    def is_done(self, name: str, created_ts: float) -> bool:
+        with self._lock:
+            if self.high_water is not None and created_ts <= self.high_water:
+                return True
+            return name in self.done
+
+    def mark_done(self, name: str, created_ts: float):
+        with self._lock:
+            self.done[name] = created_ts
+            self.attempts.pop(name, None)
+            self._dirty = True
+
+    def mark_failed(self, name: str, created_ts: float) -> bool:
+        """Zählt einen Fehlversuch; True wenn aufgegeben wurde (Datei gilt dann als erledigt)."""
+        with self._lock:
+            n = self.attempts.get(name, 0) + 1
+            self._dirty = True
+            if n >= self.max_attempts:
+                print(f"ERROR: {name}: {n} Fehlversuche – wird nicht erneut verarbeitet.")
+                self.mark_done(name, created_ts)
+                return True
+            self.attempts[name] = n
+            return False
+
+    def advance(self, listing: Iterable[Tuple[str, float]], now_ts: Optional[float] = None):
+        """Hebt die High-Water-Mark an: bis zum ältesten offenen (oder zu frischen) Objekt."""
+        listing = list(listing)
+        cutoff = (now_ts if now_ts is not None else time.time()) - self.safety_seconds
+        with self._lock:
+            for name, ts in listing:
+                if name in self.done and self.done[name] != ts:
+                    self.done[name] = ts
+            blocking = [ts for name, ts in listing if ts > cutoff or not self.is_done(name, ts)]
+            limit = min(blocking) if blocking else float("inf")
+            below = [ts for _, ts in listing if ts < limit]
+            if below and (self.high_water is None or max(below) > self.high_water):
+                self.high_water = max(below)
+                self._dirty = True
+            self._prune()
+
+    def _prune(self):
+        if self.high_water is None:
+            return
+        before = len(self.done)
+        self.done = {k: v for k, v in self.done.items() if v > self.high_water}
+        self.attempts = {k: v for k, v in self.attempts.items() if k not in self.done}
+        if len(self.done) != before:
+            self._dirty = True
+
+    def list_offset(self, lookback: float) -> Optional[str]:
+        """start_offset für das RAW-Listing: Partition von high_water - lookback (None = ohne Mark alles listen).
+
+        lookback deckt Uhrenabweichung zwischen Ingest-Host und GCS sowie Uploads ab, die beim Setzen
+        der Mark noch liefen.
+        """
+        with self._lock:
+            if self.high_water is None:
+                return None
+            return self.raw_prefix + raw_partition(self.high_water - lookback)
+
+    def pending(self, listing: Iterable[Tuple[str, float]]) -> List[Tuple[str, float]]:
+        """Offene Objekte aus einem Listing, chronologisch sortiert."""
+        return sorted(((n, ts) for n, ts in listing if not self.is_done(n, ts)), key=lambda x: (x[1], x[0]))
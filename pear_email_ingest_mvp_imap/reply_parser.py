@@ -0,0 +1,87 @@
+"""
+reply_parser.py — PEARv2.2
+Trennt bei Antworten auf unsere [PEAR-xxxxxxxx]-Rückfragen den neuen Teil vom zitierten Verlauf.
+
+Erkannt werden:
+- Zitat-Kopfzeilen: "Am <Datum> schrieb <Name> <mail>:" (auch über zwei Zeilen umbrochen), "On ... wrote:"
+- Outlook-Trenner: "-----Ursprüngliche Nachricht-----", "-----Original Message-----", "____" + Kopfblock
+- Kopfblöcke "Von: / Gesendet: / An: / Betreff:" (bzw. From/Sent/To/Subject)
+- "> "-zitierte Zeilen (auch bei Antworten unterhalb des Zitats)
+
+Ergibt sich kein neuer Text, bleibt der Body unverändert.
+"""
+
+import re
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from text_extract import estimate_tokens
+
+_QUOTED_RE = re.compile(r"^\s*>")
+_WROTE_RE = re.compile(r"^\s*(Am|On)\s.{4,200}?\s(schrieb|hat\s.{1,120}?\sgeschrieben|wrote)\b[^:]{0,200}:\s*$",
+                       re.IGNORECASE)
+_SEPARATOR_RE = re.compile(r"^\s*-{3,}\s*(Ursprüngliche Nachricht|Original Message|Weitergeleitete Nachricht|"
+                           r"Forwarded message)\s*-{3,}\s*$", re.IGNORECASE)
+_UNDERSCORE_RE = re.compile(r"^\s*_{10,}\s*$")
+_FROM_RE = re.compile(r"^\s*\*?(Von|From)\s*:\*?\s", re.IGNORECASE)
+_HEADER_FIELD_RE = re.compile(r"^\s*\*?(Gesendet|Sent|Datum|Date|An|To|Betreff|Subject|Cc)\s*:", re.IGNORECASE)
+
+
+@dataclass
+class ReplySplit:
+    new_text: str
+    quoted_text: str
+    marker: Optional[str] = None   # wrote / separator / header / quote
+
+    @property
+    def tokens_saved(self) -> int:
+        return max(0, estimate_tokens(self.new_text + self.quoted_text) - estimate_tokens(self.new_text))
+
+
+def _is_header_block(lines: List[str], i: int) -> bool:
+    """ "Von: ..." gefolgt von mind. zwei Kopfzeilen (Gesendet/An/Betreff ...) in den nächsten Zeilen."""
+    if not _FROM_RE.match(lines[i]):
+        return False
+    return sum(1 for l in lines[i + 1:i + 6] if _HEADER_FIELD_RE.match(l)) >= 2
+
+
+def _find_marker(lines: List[str]) -> Tuple[Optional[int], int, Optional[str]]:
+    """(Start, Ende exklusiv, Art) des ersten Zitat-Markers."""
+    for i, line in enumerate(lines):
+        if _WROTE_RE.match(line):
+            return i, i + 1, "wrote"
+        # Gmail/Apple umbrechen lange "Am ... schrieb"-Zeilen
+        if i + 1 < len(lines) and re.match(r"^\s*(Am|On)\s", line, re.IGNORECASE) \
+                and _WROTE_RE.match(line.rstrip() + " " + lines[i + 1].strip()):
+            return i, i + 2, "wrote"
+        if _SEPARATOR_RE.match(line):
+            return i, i + 1, "separator"
+        if _UNDERSCORE_RE.match(line) and i + 1 < len(lines) and _is_header_block(lines, i + 1):
+            return i, i + 1, "separator"
+        if _is_header_block(lines, i):
+            return i, i + 1, "header"
+    return None, 0, None
+
+
+def split_reply(text: str) -> ReplySplit:
+    lines = (text or "").replace("\r\n", "\n").split("\n")
+    start, end, marker = _find_marker(lines)
+
+    if start is None:
+        keep = [i for i, l in enumerate(lines) if not _QUOTED_RE.match(l)]
+        marker = "quote" if len(keep) != len(lines) else None
+    else:
+        after = range(end, len(lines))
+        if marker == "wrote" and any(_QUOTED_RE.match(lines[i]) for i in after):
+            # "> "-Zitat: ungequotete Zeilen danach sind Antworten unterhalb/zwischen dem Zitat
+            candidates = list(range(start)) + list(after)
+        else:
+            candidates = range(start)
+        keep = [i for i in candidates if not _QUOTED_RE.match(lines[i])]
+
+    new_text = "\n".join(lines[i] for i in keep).strip()
+    if not new_text or marker is None:
+        return ReplySplit(new_text=(text or "").strip(), quoted_text="", marker=None)
+    kept = set(keep)
+    quoted = "\n".join(l for i, l in enumerate(lines) if i not in kept).strip()
+    return ReplySplit(new_text=new_text, quoted_text=quoted, marker=marker)
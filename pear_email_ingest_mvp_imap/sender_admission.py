@@ -0,0 +1,101 @@
+"""
+sender_admission.py — PEARv2.2
+Zulassung pro Absender (Token Bucket), bevor eine Mail GCS-raw/ oder Gemini erreicht.
+
+- Jeder Absender startet mit SENDER_BURST Tokens, die mit SENDER_RATE_PER_HOUR pro Stunde nachlaufen.
+- Absender über dem Limit werden unter QUARANTINE_PREFIX abgelegt statt verarbeitet; alle anderen
+  laufen normal weiter (ein einzelner Flooder blockiert nicht mehr den ganzen Guardian).
+- Zustand: (Tokens, Zeitpunkt) pro Absender in einem LRU-begrenzten Dict
+  (SENDER_ADMISSION_MAX_SENDERS), eine Prüfung kostet O(1).
+- SENDER_ALLOWLIST: Adressen oder "@domain", die nie gedrosselt werden (z.B. Partner-Agenturen).
+
+Einziger Prüfpunkt ist /ingest (main.py): der Fetcher liefert alle Mails ab, jede Mail kostet genau
+ein Token in genau einem Bucket. Wird der Upload als Duplikat erkannt (gleiche Message-ID schon in raw/),
+erstattet refund() das Token – erneutes Einliefern derselben Mail drängt einen Absender nicht in die Quarantäne.
+
+ENV:
+  SENDER_RATE_PER_HOUR=20 (0 = aus), SENDER_BURST=10, SENDER_ADMISSION_MAX_SENDERS=10000,
+  SENDER_ALLOWLIST=, QUARANTINE_PREFIX=quarantine/
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from email.utils import parseaddr
+from typing import Dict, Iterable, Optional, Tuple
+
+QUARANTINE_PREFIX = os.getenv("QUARANTINE_PREFIX", "quarantine/")
+
+_UNKNOWN_SENDER = "<unknown>"  # Mails ohne From teilen sich einen Bucket
+
+
+def sender_key(sender: Optional[str]) -> str:
+    """Normalisierte Absenderadresse ("Name <A@B.de>" → "a@b.de")."""
+    addr = parseaddr(sender or "")[1] or (sender or "")
+    return addr.strip().lower() or _UNKNOWN_SENDER
+
+
+class SenderAdmission:
+    def __init__(self, rate_per_hour: float = 20, burst: int = 10, max_senders: int = 10000,
+                 allowlist: Optional[Iterable[str]] = None):
+        self.rate = max(0.0, rate_per_hour) / 3600.0
+        self.burst = float(max(1, burst))
+        self.max_senders = max(1, max_senders)
+        self.allowlist = {a.strip().lower() for a in (allowlist or []) if a.strip()}
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"admitted": 0, "quarantined": 0, "refunded": 0}
+
+    @classmethod
+    def from_env(cls) -> "SenderAdmission":
+        return cls(
+            rate_per_hour=float(os.getenv("SENDER_RATE_PER_HOUR", "20")),
+            burst=int(os.getenv("SENDER_BURST", "10")),
+            max_senders=int(os.getenv("SENDER_ADMISSION_MAX_SENDERS", "10000")),
+            allowlist=os.getenv("SENDER_ALLOWLIST", "").split(","),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def _allowlisted(self, key: str) -> bool:
+        return key in self.allowlist or ("@" + key.rpartition("@")[2]) in self.allowlist
+
+    def admit(self, sender: Optional[str]) -> bool:
+        """True = normal verarbeiten, False = Quarantäne. Verbraucht bei Zulassung einen Token."""
+        key = sender_key(sender)
+        if not self.enabled or self._allowlisted(key):
+            return True
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            ok = tokens >= 1
+            if ok:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_senders:
+                self._buckets.popitem(last=False)  # am längsten inaktiver Absender
+            self._stats["admitted" if ok else "quarantined"] += 1
+        return ok
+
+    def refund(self, sender: Optional[str]):
+        """Token einer Zulassung zurückgeben, die keine neue Mail war (z.B. Duplikat)."""
+        key = sender_key(sender)
+        if not self.enabled or self._allowlisted(key):
+            return
+        with self._lock:
+            entry = self._buckets.get(key)
+            if entry is None:
+                return
+            self._buckets[key] = (min(self.burst, entry[0] + 1), entry[1])
+            self._stats["admitted"] -= 1
+            self._stats["refunded"] += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            out = dict(self._stats)
+            out["tracked_senders"] = len(self._buckets)
+        return out
@@ -0,0 +1,418 @@
+"""
+smtp_outbox.py — PEARv2.2
+Dauerhafte Ausgangs-Warteschlange (tbl_email_outbox) + Versand-Worker mit persistenter SMTP-Session.
+
+- enqueue(): legt die Mail in tbl_email_outbox ab und kehrt sofort zurück – die Verarbeitung
+  wartet nicht mehr auf den Mailserver. dedupe_key (UNIQUE) verhindert doppelte Einträge,
+  z.B. eine Antwort pro RAW-Datei.
+- INSERT_SQL/insert_params(): dieselbe Zeile innerhalb einer fremden Transaktion einreihen
+  (bucket_to_gemini schreibt Antworten zusammen mit den DB-Änderungen der E-Mail).
+- OutboxWorker: Hintergrund-Thread, der fällige Zeilen per SELECT ... FOR UPDATE SKIP LOCKED holt
+  (mehrere Prozesse möglich) und über eine offen gehaltene, authentifizierte SMTP-Session versendet.
+  Trennt der Server die Session (Idle-Timeout), wird einmal neu verbunden; nach SMTP_IDLE_CLOSE
+  Sekunden ohne Versand wird sie geschlossen.
+- Retries mit exponentiellem Backoff (OUTBOX_RETRY_BASE .. OUTBOX_RETRY_MAX Sekunden), nach
+  OUTBOX_MAX_ATTEMPTS Versuchen bzw. bei abgewiesenem Empfänger/5xx: FAILED.
+- Erst nach bestätigtem Versand: status=SENT, Guardian-Zähler und on_sent-Callbacks
+  (bucket_to_gemini schreibt dort den responded/-Marker).
+- Absturz während SENDING: nach OUTBOX_LOCK_TIMEOUT wird die Zeile erneut versucht (at-least-once).
+- Der Worker läuft nur in langlebigen Prozessen (main.py startet ihn); enqueue()/enqueue_many() wecken
+  ihn nur, wenn er schon läuft (autostart=True startet ihn). Kurzläufer (bucket_to_gemini, pending_watcher
+  als Skript) versenden ausschließlich über drain() – ein Daemon-Thread, der beim Prozessende mitten im
+  Versand stirbt, ließe die Zeile auf SENDING stehen und sie würde nach OUTBOX_LOCK_TIMEOUT doppelt versendet.
+- Ohne DB-Konfiguration (oder OUTBOX_ENABLED=false) wird wie bisher synchron versendet.
+- Metriken (metrics.py): SMTP-Versanddauer inkl. Verbindungsaufbau, Reconnects, eingereihte Mails je
+  Art und Versandergebnisse je Weg (outbox/direct).
+
+ENV:
+  SMTP_HOST, SMTP_PORT=587, SMTP_USER, SMTP_PASSWORD, SMTP_FROM, SMTP_USE_SSL=false, SMTP_TIMEOUT=30,
+  SMTP_IDLE_CLOSE=120
+  OUTBOX_ENABLED=true, OUTBOX_POLL_INTERVAL=5, OUTBOX_BATCH=20, OUTBOX_MAX_ATTEMPTS=6,
+  OUTBOX_RETRY_BASE=30, OUTBOX_RETRY_MAX=3600, OUTBOX_LOCK_TIMEOUT=300
+"""
+
+import os
+import smtplib
+import threading
+import time
+from email.mime.text import MIMEText
+from email.utils import formataddr
+from typing import Any, Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+from mysql.connector import Error
+
+import db_pool
+import metrics
+from email_guardian import record_smtp_send
+
+load_dotenv()
+
+SMTP_HOST = os.getenv("SMTP_HOST")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_USER = os.getenv("SMTP_USER")
+SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
+SMTP_FROM = os.getenv("SMTP_FROM", "PEAR Ingest <noreply@pear-app.de>")
+SMTP_USE_SSL = os.getenv("SMTP_USE_SSL", "false").lower() == "true"
+SMTP_TIMEOUT = int(os.getenv("SMTP_TIMEOUT", "30"))
+SMTP_IDLE_CLOSE = float(os.getenv("SMTP_IDLE_CLOSE", "120"))
+
+OUTBOX_ENABLED = os.getenv("OUTBOX_ENABLED", "true").lower() == "true"
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "5"))
+OUTBOX_BATCH = int(os.getenv("OUTBOX_BATCH", "20"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "6"))
+OUTBOX_RETRY_BASE = int(os.getenv("OUTBOX_RETRY_BASE", "30"))
+OUTBOX_RETRY_MAX = int(os.getenv("OUTBOX_RETRY_MAX", "3600"))
+OUTBOX_LOCK_TIMEOUT = int(os.getenv("OUTBOX_LOCK_TIMEOUT", "300"))
+
+SMTP_SECONDS = metrics.histogram("pear_smtp_send_seconds", "Dauer eines SMTP-Versands (inkl. Verbindungsaufbau)")
+SMTP_RECONNECTS = metrics.counter("pear_smtp_reconnects_total", "Vom Server getrennte SMTP-Sessions")
+MAILS_ENQUEUED = metrics.counter("pear_outbox_enqueued_total", "In die Outbox eingereihte Mails", ("kind", "result"))
+MAILS_SENT = metrics.counter("pear_mail_sent_total", "Versandversuche je Weg und Ergebnis", ("path", "result"))
+
+
+def smtp_configured() -> bool:
+    return bool(SMTP_HOST and SMTP_USER and SMTP_PASSWORD and SMTP_FROM)
+
+
+def outbox_enabled() -> bool:
+    return OUTBOX_ENABLED and db_pool.db_configured()
+
+
+def build_message(to_addr: str, subject: str, body: str) -> MIMEText:
+    msg = MIMEText(body, _charset="utf-8")
+    msg["From"] = SMTP_FROM if "<" in SMTP_FROM else formataddr(("PEAR Ingest", SMTP_FROM))
+    msg["To"] = to_addr
+    msg["Subject"] = subject
+    return msg
+
+
+def is_permanent(exc: BaseException) -> bool:
+    """Empfänger abgewiesen / 5xx (außer Login-Fehler) – erneutes Senden hilft nicht."""
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        return True
+    if isinstance(exc, smtplib.SMTPAuthenticationError):
+        return False  # Konfigurationsproblem, nach Korrektur erneut versuchen
+    return isinstance(exc, smtplib.SMTPResponseException) and exc.smtp_code >= 500
+
+
+class SmtpSession:
+    """Eine authentifizierte SMTP-Verbindung, die zwischen den Mails offen bleibt."""
+
+    def __init__(self):
+        self._conn: Optional[smtplib.SMTP] = None
+        self._last_used = 0.0
+        self._lock = threading.Lock()
+
+    def _connect(self) -> smtplib.SMTP:
+        if SMTP_USE_SSL:
+            conn = smtplib.SMTP_SSL(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT)
+        else:
+            conn = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT)
+            conn.ehlo()
+            conn.starttls()
+            conn.ehlo()
+        conn.login(SMTP_USER, SMTP_PASSWORD)
+        return conn
+
+    def _close(self):
+        if self._conn is None:
+            return
+        try:
+            self._conn.quit()
+        except Exception:
+            pass
+        self._conn = None
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def close_if_idle(self):
+        with self._lock:
+            if self._conn is not None and time.monotonic() - self._last_used > SMTP_IDLE_CLOSE:
+                self._close()
+
+    def send(self, msg: MIMEText):
+        with self._lock, SMTP_SECONDS.time():
+            for attempt in (0, 1):
+                if self._conn is None:
+                    self._conn = self._connect()
+                try:
+                    self._conn.send_message(msg)
+                    self._last_used = time.monotonic()
+                    return
+                except (smtplib.SMTPRecipientsRefused, smtplib.SMTPResponseException):
+                    raise  # Antwort des Servers, die Verbindung selbst ist in Ordnung
+                except OSError:
+                    # Session vom Server geschlossen (Idle-Timeout) o.ä. – einmal neu verbinden
+                    self._close()
+                    SMTP_RECONNECTS.inc()
+                    if attempt:
+                        raise
+
+
+INSERT_SQL = """
+    INSERT IGNORE INTO tbl_email_outbox (dedupe_key, to_addr, subject, body, kind, ref)
+    VALUES (%s, %s, %s, %s, %s, %s)
+"""
+
+
+def insert_params(to_addr: str, subject: str, body: str, kind: str = "reply",
+                  ref: Optional[str] = None, dedupe_key: Optional[str] = None) -> tuple:
+    """Parameter für INSERT_SQL (auch für fremde Transaktionen, z.B. den Unit-of-Work-Writer)."""
+    return (dedupe_key, to_addr, subject, body, kind, ref)
+
+
+_SESSION = SmtpSession()
+_ON_SENT: Dict[str, List[Callable[[str], None]]] = {}
+
+
+def on_sent(kind: str, callback: Callable[[str], None]):
+    """Callback(ref) nach bestätigtem Versand einer Mail dieser Art (z.B. responded/-Marker)."""
+    _ON_SENT.setdefault(kind, []).append(callback)
+
+
+def _fire_on_sent(kind: Optional[str], ref: Optional[str]):
+    if not ref:
+        return
+    for callback in _ON_SENT.get(kind or "", []):
+        try:
+            callback(ref)
+        except Exception as e:
+            print(f"ERROR: on_sent-Callback für {kind}/{ref} fehlgeschlagen: {e}")
+
+
+def send_now(to_addr: Optional[str], subject: str, body: str) -> bool:
+    """Synchroner Versand über die gemeinsame Session (Fallback ohne Outbox)."""
+    if not (smtp_configured() and to_addr):
+        print("INFO: SMTP nicht konfiguriert oder Empfänger fehlt – Versand übersprungen.")
+        return False
+    try:
+        _SESSION.send(build_message(to_addr, subject, body))
+    except Exception as e:
+        print(f"ERROR: SMTP-Fehler: {e}")
+        MAILS_SENT.inc(path="direct", result="error")
+        return False
+    record_smtp_send()
+    MAILS_SENT.inc(path="direct", result="sent")
+    return True
+
+
+def enqueue(to_addr: Optional[str], subject: str, body: str, kind: str = "reply",
+            ref: Optional[str] = None, dedupe_key: Optional[str] = None, autostart: bool = False) -> bool:
+    """Mail dauerhaft einreihen. True = eingereiht (bzw. ohne Outbox: direkt versendet).
+
+    autostart=True startet den Worker, sonst wird nur ein laufender Worker geweckt.
+    """
+    if not (smtp_configured() and to_addr):
+        print("INFO: SMTP nicht konfiguriert oder Empfänger fehlt – Versand übersprungen.")
+        return False
+    if not outbox_enabled():
+        sent = send_now(to_addr, subject, body)
+        if sent:
+            _fire_on_sent(kind, ref)
+        return sent
+    try:
+        with db_pool.connection("outbox_enqueue") as conn:
+            cur = conn.cursor()
+            cur.execute(INSERT_SQL, insert_params(to_addr, subject, body, kind, ref, dedupe_key))
+            conn.commit()
+            queued = cur.rowcount
+            cur.close()
+    except Error as e:
+        print(f"ERROR: Outbox nicht erreichbar ({e}) – versende direkt.")
+        sent = send_now(to_addr, subject, body)
+        if sent:
+            _fire_on_sent(kind, ref)
+        return sent
+    if not queued:
+        print(f"INFO: Mail {dedupe_key} ist bereits in der Outbox – nicht erneut eingereiht.")
+    MAILS_ENQUEUED.inc(kind=kind, result="queued" if queued else "duplicate")
+    _notify_worker(autostart)
+    return True
+
+
+def enqueue_many(mails: List[Dict[str, Any]], autostart: bool = False) -> int:
+    """Mehrere Mails (Keys wie enqueue) mit einem INSERT einreihen; liefert die Anzahl eingereihter Mails."""
+    mails = [m for m in mails if m.get("to_addr")]
+    if not mails:
+        return 0
+    if not (outbox_enabled() and smtp_configured()):
+        return sum(1 for m in mails if enqueue(**m, autostart=autostart))
+    try:
+        with db_pool.connection("outbox_enqueue_many") as conn:
+            cur = conn.cursor()
+            cur.executemany(INSERT_SQL, [insert_params(**m) for m in mails])
+            conn.commit()
+            cur.close()
+    except Error as e:
+        print(f"ERROR: Outbox-Batch fehlgeschlagen ({e}) – reihe einzeln ein.")
+        return sum(1 for m in mails if enqueue(**m, autostart=autostart))
+    for m in mails:
+        MAILS_ENQUEUED.inc(kind=m.get("kind", "reply"), result="queued")
+    _notify_worker(autostart)
+    return len(mails)
+
+
+def claim_due(limit: int = OUTBOX_BATCH) -> List[Dict[str, Any]]:
+    """Fällige Zeilen sperren und auf SENDING setzen (auch hängengebliebene SENDING-Zeilen)."""
+    with db_pool.connection("outbox_claim") as conn:
+        cur = conn.cursor(dictionary=True)
+        cur.execute("""
+            SELECT id, to_addr, subject, body, kind, ref, attempts FROM tbl_email_outbox
+            WHERE (status = 'QUEUED' AND next_attempt_at <= NOW())
+               OR (status = 'SENDING' AND locked_at < NOW() - INTERVAL %s SECOND)
+            ORDER BY next_attempt_at
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        """, (OUTBOX_LOCK_TIMEOUT, limit))
+        rows = cur.fetchall()
+        if rows:
+            ids = [r["id"] for r in rows]
+            cur.execute(
+                f"UPDATE tbl_email_outbox SET status = 'SENDING', locked_at = NOW(), attempts = attempts + 1 "
+                f"WHERE id IN ({', '.join(['%s'] * len(ids))})", ids)
+        conn.commit()
+        cur.close()
+    for r in rows:
+        r["attempts"] += 1
+    return rows
+
+
+def _finish(row_id: int, status: str, error: Optional[str] = None, retry_in: int = 0):
+    with db_pool.connection("outbox_finish") as conn:
+        cur = conn.cursor()
+        if status == "SENT":
+            cur.execute("""
+                UPDATE tbl_email_outbox SET status = 'SENT', sent_at = NOW(), locked_at = NULL, last_error = NULL
+                WHERE id = %s
+            """, (row_id,))
+        else:
+            cur.execute("""
+                UPDATE tbl_email_outbox
+                SET status = %s, locked_at = NULL, last_error = %s,
+                    next_attempt_at = NOW() + INTERVAL %s SECOND
+                WHERE id = %s
+            """, (status, (error or "")[:2000], retry_in, row_id))
+        conn.commit()
+        cur.close()
+
+
+def send_row(row: Dict[str, Any], session: SmtpSession = _SESSION) -> bool:
+    try:
+        session.send(build_message(row["to_addr"], row["subject"] or "", row["body"] or ""))
+    except Exception as e:
+        if is_permanent(e) or row["attempts"] >= OUTBOX_MAX_ATTEMPTS:
+            print(f"ERROR: Outbox #{row['id']} an {row['to_addr']} endgültig fehlgeschlagen: {e}")
+            _finish(row["id"], "FAILED", str(e))
+            MAILS_SENT.inc(path="outbox", result="failed")
+        else:
+            delay = min(OUTBOX_RETRY_MAX, OUTBOX_RETRY_BASE * 2 ** (row["attempts"] - 1))
+            print(f"INFO: Outbox #{row['id']} an {row['to_addr']}: {e} – neuer Versuch in {delay}s")
+            _finish(row["id"], "QUEUED", str(e), retry_in=delay)
+            MAILS_SENT.inc(path="outbox", result="retry")
+        return False
+    _finish(row["id"], "SENT")
+    MAILS_SENT.inc(path="outbox", result="sent")
+    record_smtp_send()
+    _fire_on_sent(row.get("kind"), row.get("ref"))
+    return True
+
+
+def process_due(limit: int = OUTBOX_BATCH) -> int:
+    """Eine Runde: fällige Mails holen und versenden; liefert die Anzahl bearbeiteter Zeilen."""
+    rows = claim_due(limit)
+    for row in rows:
+        send_row(row)
+    return len(rows)
+
+
+class OutboxWorker(threading.Thread):
+    def __init__(self):
+        super().__init__(daemon=True, name="smtp-outbox")
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+
+    def wake(self):
+        self._wake.set()
+
+    def stop(self):
+        self._stopping.set()
+        self._wake.set()
+
+    def run(self):
+        while not self._stopping.is_set():
+            try:
+                handled = process_due()
+            except Exception as e:
+                print(f"ERROR: Outbox-Worker: {e}")
+                handled = 0
+            if not handled:
+                _SESSION.close_if_idle()
+                self._wake.wait(OUTBOX_POLL_INTERVAL)
+                self._wake.clear()
+        _SESSION.close()
+
+
+_WORKER: Optional[OutboxWorker] = None
+_WORKER_LOCK = threading.Lock()
+
+
+def start_worker() -> OutboxWorker:
+    """Startet den prozessweiten Versand-Worker (einmalig)."""
+    global _WORKER
+    with _WORKER_LOCK:
+        if _WORKER is None or not _WORKER.is_alive():
+            _WORKER = OutboxWorker()
+            if outbox_enabled():
+                _WORKER.start()
+        return _WORKER
+
+
+def wake_worker():
+    """Laufenden Worker wecken (startet keinen – Kurzläufer versenden über drain())."""
+    with _WORKER_LOCK:
+        worker = _WORKER
+    if worker is not None and worker.is_alive():
+        worker.wake()
+
+
+def _notify_worker(autostart: bool):
+    if autostart:
+        start_worker().wake()
+    else:
+        wake_worker()
+
+
+def stop_worker(timeout: float = SMTP_TIMEOUT + 5) -> bool:
+    """Worker anhalten und auf das Ende des laufenden Versands warten (True = beendet)."""
+    with _WORKER_LOCK:
+        worker = _WORKER
+    if worker is None or not worker.is_alive():
+        return True
+    worker.stop()
+    worker.join(timeout)
+    return not worker.is_alive()
+
+
+def drain(timeout: float = 60.0) -> int:
+    """Für Kurzläufer (Skripte): fällige Mails synchron abarbeiten, bevor der Prozess endet.
+
+    Ein laufender Worker wird vorher angehalten, damit beim Prozessende kein Versand abbricht.
+    """
+    if not outbox_enabled():
+        return 0
+    if not stop_worker():
+        print("WARN: Outbox-Worker versendet noch – drain() arbeitet parallel weiter.")
+    deadline = time.monotonic() + timeout
+    total = 0
+    try:
+        while time.monotonic() < deadline:
+            handled = process_due()
+            total += handled
+            if not handled:
+                break
+    except Error as e:
+        print(f"ERROR: Outbox konnte nicht geleert werden: {e}")
+    return total
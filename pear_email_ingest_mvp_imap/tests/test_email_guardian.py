@@ -0,0 +1,119 @@
+from contextlib import contextmanager
+from datetime import datetime
+
+import email_guardian
+from email_guardian import UsageCounters
+
+class FakeUsageTable:
+    """tbl_guardian_usage im Speicher – versteht genau die Statements von UsageCounters."""
+    def __init__(self):
+        self.rows = {}
+
+    @contextmanager
+    def connection(self, op="other"):
+        yield self
+
+    def cursor(self):
+        return self
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+    def executemany(self, sql, params):
+        for event, sender, minute, count in params:
+            self.rows[(event, sender, minute)] = self.rows.get((event, sender, minute), 0) + count
+
+    def execute(self, sql, params):
+        if sql.lstrip().startswith("DELETE"):
+            self._result = []
+        elif "GROUP BY sender" in sql:
+            since, threshold = params
+            sums = {}
+            for (event, sender, minute), count in self.rows.items():
+                if event == "emails" and sender and minute > since:
+                    sums[sender] = sums.get(sender, 0) + count
+            self._result = [(s, c) for s, c in sums.items() if c >= threshold]
+        else:
+            (since,) = params
+            self._result = [(e, m, c) for (e, s, m), c in self.rows.items() if s == "" and m >= since]
+
+    def fetchall(self):
+        return self._result
+
+def test_sum_windows_weights_oldest_minute():
+    now = 600 * 60 + 45  # 45 s into minute 600
+    totals = UsageCounters._sum_windows([(600, 4), (599, 8), (541, 2), (540, 10)], now)
+    assert totals["minute"] == 4 + 8 * 0.25
+    assert totals["hour"] == 4 + 8 + 2 + 10 * 0.25
+
+def test_in_memory_mode_counts_and_flags_hot_senders(monkeypatch):
+    monkeypatch.setattr(email_guardian, "SUSPICIOUS_SENDER_PER_HOUR", 3)
+    usage = UsageCounters(use_db=False)
+    for _ in range(3):
+        usage.record("emails", "Spam@Example.org")
+    usage.record("emails", "kunde@example.org")
+    assert usage.totals("emails") == {"minute": 4, "hour": 4, "day": 4}
+    assert usage.hot_senders() == [("spam@example.org", 3)]
+
+def test_processes_share_counts_through_the_table(monkeypatch):
+    table = FakeUsageTable()
+    monkeypatch.setattr(email_guardian.db_pool, "connection", table.connection)
+    monkeypatch.setattr(email_guardian, "SUSPICIOUS_SENDER_PER_HOUR", 3)
+    server = UsageCounters(persist_interval=3600, read_ttl=0, use_db=True)
+    script = UsageCounters(persist_interval=3600, read_ttl=0, use_db=True)
+
+    for _ in range(3):
+        server.record("emails", "spam@example.org")
+    script.record("emails", "kunde@example.org")
+    # noch nicht geschrieben: jeder Prozess sieht nur seine eigenen Deltas
+    assert server.totals("emails")["hour"] == 3
+    assert script.totals("emails")["hour"] == 1
+
+    server.flush()
+    script.flush()
+    assert server.totals("emails")["day"] == script.totals("emails")["day"] == 4
+    assert script.hot_senders() == [("spam@example.org", 3)]
+
+def _guardian_without_db(monkeypatch, usage):
+    monkeypatch.setattr(email_guardian, "get_usage", lambda: usage)
+    monkeypatch.setattr(email_guardian.db_pool, "db_configured", lambda: False)
+    monkeypatch.setattr(email_guardian, "EMERGENCY_LOCKDOWN_FILE", "/nonexistent/lockdown.flag")
+    monkeypatch.setattr(email_guardian, "GUARDIAN_LOG_FILE", "/nonexistent/guardian.log")
+    monkeypatch.setattr(email_guardian, "SUSPICIOUS_SENDER_PER_HOUR", 1000)
+    return email_guardian.EmailGuardian
+
+def test_volume_limits_block_by_default(monkeypatch):
+    usage = UsageCounters(use_db=False)
+    for _ in range(50):
+        usage.record("emails", "agentur@example.org")
+    guardian = _guardian_without_db(monkeypatch, usage)
+
+    result = guardian().guardian_check()
+    assert not result.allow_processing
+    assert result.action == "TEMPORARY_BLOCK"
+
+    monkeypatch.setattr(email_guardian, "GUARDIAN_ENFORCE_LIMITS", False)
+    assert guardian().guardian_check().allow_processing
+
+def test_backlog_does_not_count_against_volume_limits(monkeypatch):
+    usage = UsageCounters(use_db=False)
+    guardian = _guardian_without_db(monkeypatch, usage)
+    for _ in range(50):
+        email_guardian.record_email("agentur@example.org", "2020-01-01T08:00:00Z")
+    email_guardian.record_email("kunde@example.org", datetime.utcnow().isoformat(timespec="seconds") + "Z")
+    email_guardian.record_email("kunde@example.org")
+
+    result = guardian().guardian_check()
+    assert result.allow_processing
+    assert result.stats.emails_last_minute == 2
+    assert result.stats.backlog_emails_today == 50
+
+def test_is_backlog():
+    now = datetime(2026, 10, 16, 12, 0, 0)
+    assert email_guardian.is_backlog("2026-10-16T10:00:00Z", now)
+    assert not email_guardian.is_backlog("2026-10-16T11:30:00Z", now)
+    assert not email_guardian.is_backlog(None, now)
+    assert not email_guardian.is_backlog("kaputt", now)
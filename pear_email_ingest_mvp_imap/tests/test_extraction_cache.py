@@ -0,0 +1,16 @@
+from extraction_cache import ExtractionCache, normalize_body, prompt_version
+
+def test_prompt_version_covers_every_template_and_the_model():
+    base = prompt_version("gemini-1.5-pro", "EINZEL {email_body}", "BATCH {emails}")
+    assert base == prompt_version("gemini-1.5-pro", "EINZEL {email_body}", "BATCH {emails}")
+    assert base != prompt_version("gemini-1.5-pro", "EINZEL {email_body}", "BATCH v2 {emails}")
+    assert base != prompt_version("gemini-1.5-flash", "EINZEL {email_body}", "BATCH {emails}")
+    # Teile werden getrennt gehasht: Verschieben von Text zwischen Templates ändert die Version
+    assert prompt_version("m", "ab", "c") != prompt_version("m", "a", "bc")
+
+def test_key_depends_on_version_and_normalized_body():
+    v1 = ExtractionCache("m", prompt_version("m", "a", "b"), ttl_hours=0)
+    v2 = ExtractionCache("m", prompt_version("m", "a", "b2"), ttl_hours=0)
+    assert v1.key("Hallo  Welt\r\n") == v1.key("Hallo Welt")
+    assert v1.key("Hallo Welt") != v2.key("Hallo Welt")
+    assert normalize_body("a \t b\r\n\r\n\r\n\r\nc ") == "a b\n\nc"
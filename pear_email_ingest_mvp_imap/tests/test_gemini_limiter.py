@@ -0,0 +1,96 @@
+import pytest
+
+import gemini_limiter
+from gemini_limiter import CircuitBreaker, GeminiLimiter, GeminiUnavailable, TokenBucket
+
+class FakeClock:
+    """Ersetzt das time-Modul: sleep() springt die Uhr vor."""
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(gemini_limiter, "time", fake)
+    monkeypatch.setattr(gemini_limiter.random, "uniform", lambda lo, hi: hi)
+    return fake
+
+class Unavailable(Exception):
+    code = 503
+
+def test_bucket_bursts_then_waits_for_refill(clock):
+    bucket = TokenBucket(rate_per_sec=1.0, capacity=2)
+    assert bucket.acquire(0) and bucket.acquire(0)
+    assert not bucket.acquire(0.5)  # nächster Token erst in 1s
+    assert clock.slept == []
+    assert bucket.acquire(1.0)
+    assert clock.slept == [1.0]
+
+def test_breaker_opens_and_allows_one_probe(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    assert not breaker.record_failure()
+    assert breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+    clock.now += 60
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+    assert not breaker.allow()  # nur ein Probe-Request
+    assert breaker.record_failure()  # gescheiterte Probe öffnet sofort wieder
+    assert breaker.state == "open"
+    clock.now += 60
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+
+def test_call_retries_with_backoff(clock):
+    attempts = []
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise Unavailable("service unavailable")
+        return "ok"
+    limiter = GeminiLimiter(max_retries=4, backoff_base=1.0, backoff_max=30, breaker_failures=5)
+    assert limiter.call(flaky) == "ok"
+    assert clock.slept == [1.0, 2.0]
+    stats = limiter.stats()
+    assert (stats["calls"], stats["retries"], stats["failures"], stats["breaker"]) == (3, 2, 2, "closed")
+
+def test_call_gives_up_after_max_retries(clock):
+    def down():
+        raise Unavailable("503")
+    limiter = GeminiLimiter(max_retries=1, breaker_failures=10)
+    with pytest.raises(GeminiUnavailable, match="2 Versuchen"):
+        limiter.call(down)
+
+def test_call_rejects_while_breaker_open(clock):
+    def down():
+        raise Unavailable("503")
+    limiter = GeminiLimiter(max_retries=5, breaker_failures=2, breaker_reset=120)
+    with pytest.raises(GeminiUnavailable, match="geöffnet"):
+        limiter.call(down)
+    with pytest.raises(GeminiUnavailable, match="Breaker offen"):
+        limiter.call(lambda: "nie aufgerufen")
+    assert limiter.is_open() and limiter.stats()["breaker_rejects"] == 1
+
+def test_non_retryable_error_is_raised_unchanged(clock):
+    def bad_request():
+        raise ValueError("invalid argument")
+    limiter = GeminiLimiter()
+    with pytest.raises(ValueError):
+        limiter.call(bad_request)
+    assert limiter.stats()["retries"] == 0 and clock.slept == []
+
+def test_rate_limit_wait_exceeded(clock):
+    limiter = GeminiLimiter(rpm=60, burst=1, rate_wait=0.5)
+    assert limiter.call(lambda: 1) == 1
+    with pytest.raises(GeminiUnavailable, match="Rate-Limit"):
+        limiter.call(lambda: 2)
+    assert limiter.stats()["rate_limited"] == 1
@@ -0,0 +1,127 @@
+import socket
+import threading
+import time
+
+import pytest
+
+from imap_fetcher import find_text_parts, parse_fetch_response, uid_ranges, idle_wait
+
+HEADER = b"Subject: Neukunde\r\nFrom: agentur@example.org\r\n\r\n"
+
+def _fetch(bodystructure: bytes, uid: int = 7):
+    head = b"1 (UID %d BODY[HEADER.FIELDS (SUBJECT FROM TO MESSAGE-ID)] {%d}" % (uid, len(HEADER))
+    return [(head, HEADER), b" BODYSTRUCTURE " + bodystructure + b")"]
+
+PLAIN = b'("TEXT" "PLAIN" ("CHARSET" "iso-8859-1") NIL NIL "QUOTED-PRINTABLE" 120 4 NIL NIL NIL NIL)'
+HTML = b'("TEXT" "HTML" ("CHARSET" "utf-8") NIL NIL "BASE64" 300 6 NIL NIL NIL NIL)'
+PDF = b'("APPLICATION" "PDF" ("NAME" "a.pdf") NIL NIL "BASE64" 9000 NIL ("ATTACHMENT" ("FILENAME" "a.pdf")) NIL NIL)'
+
+def test_uid_ranges():
+    assert uid_ranges([9, 1, 2, 3, 7, 10]) == "1:3,7,9:10"
+
+def test_parse_fetch_response_joins_literals():
+    meta = parse_fetch_response(_fetch(PLAIN))
+    assert meta[7]["BODY[HEADER.FIELDS (SUBJECT FROM TO MESSAGE-ID)]"] == HEADER
+    assert meta[7]["BODYSTRUCTURE"][:2] == ["TEXT", "PLAIN"]
+
+def test_single_part():
+    bs = parse_fetch_response(_fetch(PLAIN))[7]["BODYSTRUCTURE"]
+    assert find_text_parts(bs) == [("1", "plain", "iso-8859-1", "quoted-printable")]
+
+def test_nested_multipart_skips_attachments():
+    alternative = b"(" + PLAIN + HTML + b' "ALTERNATIVE" ("BOUNDARY" "b2") NIL NIL)'
+    mixed = b"(" + alternative + PDF + b' "MIXED" ("BOUNDARY" "b1") NIL NIL)'
+    bs = parse_fetch_response(_fetch(mixed))[7]["BODYSTRUCTURE"]
+    assert [(p[0], p[1]) for p in find_text_parts(bs)] == [("1.1", "plain"), ("1.2", "html")]
+
+def test_message_rfc822_attachment_is_descended():
+    inner = b"(" + PLAIN + HTML + b' "ALTERNATIVE" ("BOUNDARY" "b3") NIL NIL)'
+    envelope = b'(NIL "Fwd" NIL NIL NIL NIL NIL NIL NIL NIL)'
+    forwarded = (b'("MESSAGE" "RFC822" NIL NIL NIL "7BIT" 2000 ' + envelope + b" " + inner
+                 + b' 40 NIL ("ATTACHMENT" ("FILENAME" "fwd.eml")) NIL NIL)')
+    outer = b"(" + PLAIN + forwarded + b' "MIXED" ("BOUNDARY" "b1") NIL NIL)'
+    bs = parse_fetch_response(_fetch(outer))[7]["BODYSTRUCTURE"]
+    assert [(p[0], p[1]) for p in find_text_parts(bs)] == [("1", "plain"), ("2.1", "plain"), ("2.2", "html")]
+
+def test_message_rfc822_single_part_body():
+    envelope = b'(NIL "Fwd" NIL NIL NIL NIL NIL NIL NIL NIL)'
+    forwarded = b'("MESSAGE" "RFC822" NIL NIL NIL "7BIT" 500 ' + envelope + b" " + PLAIN + b" 10 NIL NIL NIL NIL)"
+    outer = b"(" + PDF + forwarded + b' "MIXED" ("BOUNDARY" "b1") NIL NIL)'
+    bs = parse_fetch_response(_fetch(outer))[7]["BODYSTRUCTURE"]
+    assert [p[0] for p in find_text_parts(bs)] == ["2.1"]
+
+def test_missing_or_textless_structure_means_full_download():
+    assert find_text_parts(None) is None
+    assert find_text_parts([]) is None
+    assert find_text_parts(["APPLICATION", "PDF", None, None, None, "BASE64", 10]) is None
+    meta = parse_fetch_response([(b"1 (UID 8 BODY[HEADER.FIELDS (SUBJECT FROM TO MESSAGE-ID)] {%d}" % len(HEADER),
+                                  HEADER), b")"])
+    assert find_text_parts(meta[8].get("BODYSTRUCTURE")) is None
+
+def test_internaldate_as_utc_iso():
+    from imap_fetcher import internaldate_iso
+    assert internaldate_iso("17-Jul-2026 02:44:25 -0700") == "2026-07-17T09:44:25Z"
+    assert internaldate_iso(" 1-Jul-2026 02:44:25 +0000") == "2026-07-01T02:44:25Z"
+    assert internaldate_iso(None) is None and internaldate_iso("gestern") is None
+
+# ---- IDLE über ein Socket-Paar (Server-Seite als Thread) ----
+class Conn:
+    """Minimaler imaplib-Ersatz: dieselben öffentlichen Aufrufe (send, readline, socket, file)."""
+    def __init__(self, sock):
+        self.sock = sock
+        self.file = sock.makefile('rb')
+
+    def socket(self):
+        return self.sock
+
+    def send(self, data):
+        self.sock.sendall(data)
+
+    def readline(self):
+        return self.file.readline()
+
+def _server(sock, after_idle=b"", after_done=b"", delay=0.0):
+    rfile = sock.makefile('rb')
+    def run():
+        tag = rfile.readline().split(b" ")[0]
+        sock.sendall(b"+ idling\r\n" + after_idle)
+        if delay:
+            time.sleep(delay)
+            sock.sendall(b"* 7 EXISTS\r\n")
+        rfile.readline()  # DONE
+        sock.sendall(after_done + tag + b" OK IDLE terminated\r\n")
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+@pytest.fixture
+def pair():
+    client, server = socket.socketpair()
+    client.settimeout(10)
+    yield Conn(client), server
+    client.close()
+    server.close()
+
+def test_idle_sees_exists_already_buffered_with_continuation(pair):
+    conn, server = pair
+    _server(server, after_idle=b"* 5 EXISTS\r\n")
+    started = time.monotonic()
+    assert idle_wait(conn, timeout=30) is True
+    assert time.monotonic() - started < 5  # nicht bis zum IDLE-Timeout geschlafen
+
+def test_idle_wakes_on_later_exists_and_leaves_connection_usable(pair):
+    conn, server = pair
+    _server(server, delay=0.2)
+    assert idle_wait(conn, timeout=30) is True
+    server.sendall(b"* OK weiter\r\n")
+    assert conn.readline() == b"* OK weiter\r\n"
+
+def test_idle_times_out_without_mail(pair):
+    conn, server = pair
+    _server(server)
+    assert idle_wait(conn, timeout=0.3) is False
+
+def test_idle_exists_during_done_counts(pair):
+    conn, server = pair
+    _server(server, after_done=b"* 8 EXISTS\r\n")
+    assert idle_wait(conn, timeout=0.2) is True
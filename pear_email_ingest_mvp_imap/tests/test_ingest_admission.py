@@ -0,0 +1,28 @@
+import pytest
+
+import main
+from sender_admission import SenderAdmission
+
+@pytest.fixture
+def ingest(monkeypatch):
+    admission = SenderAdmission(rate_per_hour=1, burst=2)
+    uploads = {}
+    def write(record, suffix="json", prefix="raw/"):
+        uri = f"gs://bucket/{prefix}{record['message_id']}.json"
+        created = uri not in uploads
+        uploads[uri] = record
+        return uri, created
+    monkeypatch.setattr(main, "_admission", admission)
+    monkeypatch.setattr(main, "_write_to_gcs", write)
+    monkeypatch.setattr(main, "schedule_push_processing", lambda blob: False)
+    monkeypatch.setattr(main, "record_email", lambda *a: None)
+    monkeypatch.setattr(main, "get_usage", lambda: type("U", (), {"record": lambda *a: None})())
+    return lambda message_id: main._ingest_message({"from_email": "a@x.de", "message_id": message_id, "body": "x"})
+
+def test_duplicate_repost_does_not_use_up_tokens(ingest):
+    assert ingest("<1@x>")["status"] == "ok"
+    for _ in range(3):
+        record = ingest("<1@x>")
+        assert record["status"] == "ok" and record["duplicate"]
+    assert ingest("<2@x>")["status"] == "ok"  # zweites Token des Bursts ist noch da
+    assert ingest("<3@x>")["status"] == "quarantined"
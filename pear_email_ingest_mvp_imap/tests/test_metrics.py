@@ -0,0 +1,56 @@
+import pytest
+
+from metrics import Registry
+
+def test_quantile_interpolates_within_bucket():
+    hist = Registry().histogram("t_seconds", "t", buckets=(1.0, 2.0, 4.0))
+    assert hist.quantile(0.5, [0, 0, 0, 0]) is None
+    assert hist.quantile(0.5, [10, 0, 0, 0]) == pytest.approx(0.5)
+    assert hist.quantile(0.75, [0, 4, 0, 0]) == pytest.approx(1.75)
+    assert hist.quantile(0.95, [5, 0, 0, 5]) == 4.0  # +Inf-Bucket: obere Bucket-Grenze
+
+def test_render_prometheus_text():
+    registry = Registry()
+    requests = registry.counter("t_requests_total", "Requests", ("stage",))
+    requests.inc(stage="fetch")
+    requests.inc(2, stage='a"b')
+    hist = registry.histogram("t_seconds", "Dauer", buckets=(0.1, 1.0))
+    hist.observe(0.05)
+    hist.observe(0.5)
+    hist.observe(3)
+    assert registry.render().splitlines() == [
+        "# HELP t_requests_total Requests",
+        "# TYPE t_requests_total counter",
+        't_requests_total{stage="a\\"b"} 2',
+        't_requests_total{stage="fetch"} 1',
+        "# HELP t_seconds Dauer",
+        "# TYPE t_seconds histogram",
+        't_seconds_bucket{le="0.1"} 1',
+        't_seconds_bucket{le="1"} 2',
+        't_seconds_bucket{le="+Inf"} 3',
+        "t_seconds_sum 3.55",
+        "t_seconds_count 3",
+    ]
+
+def test_registry_rejects_conflicting_registration():
+    registry = Registry()
+    assert registry.counter("t_total", "x", ("a",)) is registry.counter("t_total", "x", ("a",))
+    with pytest.raises(ValueError):
+        registry.counter("t_total", "x", ("b",))
+    with pytest.raises(ValueError):
+        registry.histogram("t_total", "x", ("a",))
+
+def test_summary_reports_delta_since_snapshot():
+    registry = Registry()
+    calls = registry.counter("t_calls_total", "x")
+    hist = registry.histogram("t_seconds", "x", buckets=(0.1, 1.0))
+    calls.inc()
+    hist.observe(0.05)
+    before = registry.snapshot()
+    calls.inc(3)
+    hist.observe(0.5)
+    hist.observe(0.5)
+    out = registry.summary(before)
+    assert out["t_calls_total"] == 3
+    assert out["t_seconds"] == {"count": 2, "sum_s": 1.0, "avg_ms": 500.0, "p95_ms": 955.0}
+    assert registry.summary(registry.snapshot()) == {}
@@ -0,0 +1,41 @@
+import pytest
+
+from name_match import best_match, koelner_phonetik, match_keys, name_key, review_candidates
+
+def _rows(*names):
+    return [{"id": i, "name": n} for i, n in enumerate(names)]
+
+def _name(row):
+    return row["name"]
+
+def test_name_key_folds_and_sorts():
+    assert name_key("Müller, Hans") == name_key("Hans Mueller") == "hans mueller"
+    assert name_key("Frau Dr. Anna Müller") == name_key("Anna Müller")
+    assert match_keys("  ") == (None, None)
+
+def test_koelner_phonetik_groups_spellings():
+    assert koelner_phonetik("meyer") == koelner_phonetik("maier") == koelner_phonetik("mayer")
+
+@pytest.mark.parametrize("name, other", [
+    ("Anna Müller", "Johanna Müller"),
+    ("Maria Weber", "Mario Weber"),
+    ("Jan Müller", "Jana Müller"),
+    ("Anna Schmidt", "Hanna Schmidt"),
+    ("Paul Schmidt", "Pauline Schmidt"),
+])
+def test_near_miss_names_are_not_merged(name, other):
+    rows = _rows(other)
+    assert best_match(name, rows, _name) is None
+    assert best_match(other, _rows(name), _name) is None
+    # ähnliche Namen werden nur zur Prüfung gemeldet
+    assert [row for _, row in review_candidates(name, rows, _name)] == rows
+
+def test_exact_key_matches_first_row_in_query_order():
+    rows = _rows("Mario Weber", "Weber, Maria", "Maria Weber")
+    assert best_match("Frau Maria Weber", rows, _name) is rows[1]
+
+def test_review_candidates_skip_exact_and_rank_by_score():
+    rows = _rows("Anna Müller", "Johanna Müller", "Hanna Müller", "Peter Schulz")
+    ranked = review_candidates("Anna Mueller", rows, _name)
+    assert [row["name"] for _, row in ranked] == ["Hanna Müller", "Johanna Müller"]
+    assert ranked[0][0] >= ranked[1][0]
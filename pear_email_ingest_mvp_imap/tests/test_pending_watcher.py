@@ -0,0 +1,48 @@
+from datetime import datetime
+
+import pending_watcher
+
+class FakeCursor:
+    def __init__(self):
+        self.queries = []
+
+    def execute(self, sql, params):
+        self.queries.append((" ".join(sql.split()), params))
+
+    def fetchall(self):
+        return []
+
+ROWS = [{"case_id": "c1", "case_tag": "c1", "source_sender": "kunde@example.com",
+         "source_subject": "Anmeldung", "raw_data": "{}", "reminder_count": 0}]
+
+def test_due_cases_compare_against_db_clock():
+    cur = FakeCursor()
+    pending_watcher.find_due_cases(cur)
+    assert len(cur.queries) == 3
+    for sql, params in cur.queries:
+        assert "NOW() - INTERVAL %s" in sql
+        assert not any(isinstance(p, datetime) for p in params)
+
+def test_expire_skips_update_when_enqueue_fails(monkeypatch):
+    monkeypatch.setattr(pending_watcher.smtp_outbox, "enqueue_many", lambda mails: False)
+    cur = FakeCursor()
+    assert pending_watcher.expire_cases(cur, ROWS) == 0
+    assert cur.queries == []
+
+def test_expire_updates_after_enqueue(monkeypatch):
+    monkeypatch.setattr(pending_watcher.smtp_outbox, "enqueue_many", lambda mails: True)
+    cur = FakeCursor()
+    assert pending_watcher.expire_cases(cur, ROWS) == 1
+    assert "status = 'EXPIRED'" in cur.queries[0][0]
+    assert cur.queries[0][1] == ["c1"]
+
+def test_reminder_history_from_old_json():
+    doc = {"history": [
+        {"ts": "2026-01-01T10:00:00Z", "event": "CREATED"},
+        {"ts": "2026-01-03T10:00:00Z", "event": "REMINDER_SENT"},
+        {"ts": "2026-01-05T10:00:00Z", "event": "REMINDER_SENT"},
+        {"ts": "kaputt", "event": "REMINDER_SENT"},
+    ]}
+    assert pending_watcher.reminder_history(doc) == (3, datetime(2026, 1, 5, 10, 0))
+    assert pending_watcher.reminder_history({"history": []}) == (0, None)
+    assert pending_watcher.reminder_history({}) == (0, None)
@@ -0,0 +1,87 @@
+import types
+
+import pytest
+
+import main
+
+class PreconditionFailed(Exception):
+    pass
+
+class FakeBlob:
+    def __init__(self, bucket, name):
+        self.bucket, self.name = bucket, name
+        self.generation = None
+
+    def upload_from_string(self, data, content_type=None, if_generation_match=None):
+        if self.name in self.bucket.fail:
+            raise OSError("upload fehlgeschlagen")
+        current = self.bucket.objects.get(self.name)
+        if if_generation_match is not None and (current[1] if current else 0) != if_generation_match:
+            raise PreconditionFailed(self.name)
+        self.bucket.objects[self.name] = (data, (current[1] if current else 0) + 1)
+
+    def reload(self):
+        self.generation = self.bucket.objects[self.name][1]
+
+    def download_as_text(self):
+        return self.bucket.objects[self.name][0]
+
+    def exists(self):
+        return self.name in self.bucket.objects
+
+    def delete(self):
+        del self.bucket.objects[self.name]
+
+class FakeBucket:
+    def __init__(self):
+        self.objects = {}
+        self.fail = set()
+
+    def blob(self, name):
+        return FakeBlob(self, name)
+
+@pytest.fixture
+def bucket(monkeypatch):
+    fake = FakeBucket()
+    hour = {"now": "2026/10/16/09/"}
+    monkeypatch.setattr(main, "_HAS_GCS", True)
+    monkeypatch.setattr(main, "GCS_BUCKET", "b")
+    monkeypatch.setattr(main, "_get_gcs_bucket", lambda: fake)
+    monkeypatch.setattr(main, "gcs_exceptions", types.SimpleNamespace(PreconditionFailed=PreconditionFailed), raising=False)
+    monkeypatch.setattr(main, "raw_partition", lambda ts: hour["now"], raising=False)
+    fake.hour = hour
+    return fake
+
+MAIL = {"message_id": "<1@x>", "body": "Hallo"}
+
+def test_raw_object_is_partitioned_and_deduplicated_across_hours(bucket):
+    object_id = main._raw_object_id(MAIL)
+    uri, created = main._write_to_gcs(MAIL)
+    assert created and uri == f"gs://b/raw/2026/10/16/09/{object_id}.json"
+    assert bucket.objects[f"message-ids/{object_id}"][0] == f"raw/2026/10/16/09/{object_id}.json"
+
+    bucket.hour["now"] = "2026/10/17/13/"  # erneute Einlieferung am nächsten Tag
+    assert main._write_to_gcs(MAIL) == (uri, False)
+    assert [n for n in bucket.objects if n.startswith("raw/")] == [f"raw/2026/10/16/09/{object_id}.json"]
+
+def test_failed_raw_upload_releases_the_marker(bucket):
+    object_id = main._raw_object_id(MAIL)
+    bucket.fail.add(f"raw/2026/10/16/09/{object_id}.json")
+    with pytest.raises(OSError):
+        main._write_to_gcs(MAIL)
+    assert f"message-ids/{object_id}" not in bucket.objects
+
+    bucket.fail.clear()
+    assert main._write_to_gcs(MAIL)[1]
+
+def test_marker_without_raw_object_is_taken_over(bucket):
+    object_id = main._raw_object_id(MAIL)
+    bucket.objects[f"message-ids/{object_id}"] = (f"raw/2026/10/15/08/{object_id}.json", 1)  # Absturz nach dem Marker
+    uri, created = main._write_to_gcs(MAIL)
+    assert created and uri == f"gs://b/raw/2026/10/16/09/{object_id}.json"
+    assert bucket.objects[f"message-ids/{object_id}"] == (f"raw/2026/10/16/09/{object_id}.json", 2)
+
+def test_quarantine_stays_flat(bucket):
+    object_id = main._raw_object_id(MAIL)
+    assert main._write_to_gcs(MAIL, prefix="quarantine/") == (f"gs://b/quarantine/{object_id}.json", True)
+    assert main._write_to_gcs(MAIL, prefix="quarantine/") == (f"gs://b/quarantine/{object_id}.json", False)
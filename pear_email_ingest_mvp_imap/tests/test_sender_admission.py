@@ -0,0 +1,57 @@
+import pytest
+
+import sender_admission
+from sender_admission import SenderAdmission, sender_key
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(sender_admission, "time", fake)
+    return fake
+
+def test_sender_key_normalizes_address():
+    assert sender_key("Anna Müller <Anna.Mueller@Example.DE>") == "anna.mueller@example.de"
+    assert sender_key(None) == sender_key("") == "<unknown>"
+
+def test_burst_then_quarantine_then_refill(clock):
+    admission = SenderAdmission(rate_per_hour=3600, burst=2)  # 1 Token/s
+    assert admission.admit("a@example.com") and admission.admit("A@Example.com")
+    assert not admission.admit("a@example.com")
+    assert admission.admit("b@example.com")  # andere Absender laufen weiter
+    clock.now += 1
+    assert admission.admit("a@example.com")
+    assert admission.stats() == {"admitted": 4, "quarantined": 1, "refunded": 0, "tracked_senders": 2}
+
+def test_allowlist_and_disabled(clock):
+    admission = SenderAdmission(rate_per_hour=1, burst=1, allowlist=["vip@example.com", "@partner.de", " "])
+    for _ in range(5):
+        assert admission.admit("vip@example.com")
+        assert admission.admit("Agentur <jobs@partner.de>")
+    assert admission.admit("x@example.com") and not admission.admit("x@example.com")
+    off = SenderAdmission(rate_per_hour=0, burst=1)
+    assert not off.enabled
+    assert all(off.admit("x@example.com") for _ in range(5))
+
+def test_lru_bound_drops_least_recent_sender(clock):
+    admission = SenderAdmission(rate_per_hour=1, burst=1, max_senders=2)
+    assert admission.admit("a@x.de") and admission.admit("b@x.de")
+    assert not admission.admit("a@x.de")  # a wird zuletzt genutzt, b ist am längsten inaktiv
+    assert admission.admit("c@x.de")
+    assert admission.stats()["tracked_senders"] == 2
+    assert admission.admit("b@x.de")  # verdrängt → startet wieder mit vollem Burst
+
+def test_refund_returns_token_of_duplicate(clock):
+    admission = SenderAdmission(rate_per_hour=1, burst=2)
+    assert admission.admit("a@x.de")
+    admission.refund("a@x.de")  # Duplikat: erneut eingeliefert, nichts Neues
+    assert admission.admit("a@x.de") and admission.admit("a@x.de")
+    assert not admission.admit("a@x.de")
+    admission.refund("unbekannt@x.de")
+    assert admission.stats() == {"admitted": 2, "quarantined": 1, "refunded": 1, "tracked_senders": 1}
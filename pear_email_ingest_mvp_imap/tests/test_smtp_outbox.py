@@ -0,0 +1,18 @@
+import smtp_outbox
+
+def test_wake_does_not_start_worker(monkeypatch):
+    monkeypatch.setattr(smtp_outbox, "_WORKER", None)
+    smtp_outbox._notify_worker(autostart=False)
+    assert smtp_outbox._WORKER is None
+
+def test_stop_worker_joins_running_worker(monkeypatch):
+    rounds = []
+    monkeypatch.setattr(smtp_outbox, "process_due", lambda: rounds.append(1) or 0)
+    monkeypatch.setattr(smtp_outbox, "OUTBOX_POLL_INTERVAL", 0.01)
+    worker = smtp_outbox.OutboxWorker()
+    monkeypatch.setattr(smtp_outbox, "_WORKER", worker)
+    worker.start()
+    smtp_outbox.wake_worker()
+    assert smtp_outbox.stop_worker(timeout=2)
+    assert not worker.is_alive()
+    assert rounds
@@ -0,0 +1,61 @@
+from reply_parser import split_reply
+from text_extract import clean_body, html_to_text, strip_signature, truncate_to_tokens
+
+FORWARDED_HTML = (
+    "<html><body><div>Hallo, anbei eine neue Kundin.</div>"
+    '<div class="gmail_quote"><div class="gmail_attr">---------- Forwarded message ---------<br>'
+    "Von: Maria Weber &lt;maria@example.org&gt;</div>"
+    "<blockquote>Name: Maria Weber<br>Telefon: 089 123456</blockquote></div>"
+    "</body></html>"
+)
+
+def test_html_to_text_blocks_and_tables():
+    text = html_to_text("<html><head><style>p{}</style></head><body><p>Hallo</p>"
+                        "<table><tr><td>Name</td><td>Anna</td></tr></table><script>x()</script></body></html>")
+    assert "p{}" not in text and "x()" not in text
+    assert "Hallo" in text
+    assert "| Name | Anna |" in text
+
+def test_forwarded_html_keeps_quoted_customer_data():
+    text = clean_body(FORWARDED_HTML)
+    assert "Name: Maria Weber" in text
+    assert "Telefon: 089 123456" in text
+
+def test_reply_path_drops_quote_blocks():
+    html = "<div>Telefon: 0171 555</div><blockquote>Name: Alte Daten</blockquote>"
+    assert "Alte Daten" in html_to_text(html)
+    assert "Alte Daten" not in clean_body(html, strip_quoted=True)
+
+def test_forward_below_signature_is_kept_by_default():
+    body = "Hier die Daten\n-- \nAgentur XY\n\n> Name: Maria Weber\n> Telefon: 089 123456"
+    assert "Maria Weber" in clean_body(body)
+    assert clean_body(body, strip_quoted=True) == "Hier die Daten"
+    assert strip_signature("-- \nnur Signatur") == "-- \nnur Signatur"
+
+def test_truncate_to_tokens_cuts_at_line():
+    text = "a" * 30 + "\n" + "b" * 30
+    assert truncate_to_tokens(text, 10) == "a" * 30
+    assert truncate_to_tokens(text, 0) == text
+
+def test_split_reply_german_wrote_header():
+    split = split_reply("Meine Telefonnummer ist 0171 555.\n\nAm 01.10.2026 um 10:00 schrieb PEAR <info@pear-app.de>:\n"
+                        "> Bitte senden Sie uns Ihre Telefonnummer.")
+    assert split.marker == "wrote"
+    assert split.new_text == "Meine Telefonnummer ist 0171 555."
+    assert "Bitte senden" in split.quoted_text
+
+def test_split_reply_outlook_header_block():
+    split = split_reply("Adresse: Hauptstr. 1\n\nVon: PEAR\nGesendet: Montag\nAn: Kunde\nBetreff: [PEAR-1a2b3c4d]\nalt")
+    assert split.marker == "header"
+    assert split.new_text == "Adresse: Hauptstr. 1"
+
+def test_split_reply_answer_below_quote():
+    split = split_reply("On Mon, Oct 1, 2026 PEAR <info@pear-app.de> wrote:\n> Ihre PLZ?\n80331")
+    assert split.marker == "wrote"
+    assert split.new_text == "80331"
+
+def test_split_reply_without_marker_keeps_body():
+    split = split_reply("Name: Maria Weber\nTelefon: 089 123456")
+    assert split.marker is None
+    assert split.new_text == "Name: Maria Weber\nTelefon: 089 123456"
+    assert split.tokens_saved == 0
@@ -0,0 +1,129 @@
+from contextlib import contextmanager
+
+import pytest
+from mysql.connector import Error
+
+import unit_of_work
+from unit_of_work import UnitOfWork
+
+STATEMENTS = {"insert": "INSERT", "update": "UPDATE", "delete": "DELETE", "outbox": "OUTBOX"}
+
+class FakeDb:
+    """Verbindung/Cursor: Statements mit Parametern aus `bad` schlagen fehl, solche aus `gone` treffen keine
+    Zeile; committed sammelt geschriebene Zeilen."""
+    def __init__(self, bad=(), gone=()):
+        self.bad = set(bad)
+        self.gone = set(gone)
+        self.rowcount = -1
+        self.open = []
+        self.committed = []
+
+    @contextmanager
+    def connection(self, op="other"):
+        yield self
+
+    def cursor(self):
+        return self
+
+    def close(self):
+        pass
+
+    def execute(self, sql, params):
+        if params in self.bad:
+            raise Error(msg=f"fehlerhafte Zeile {params}")
+        if not isinstance(params, tuple):
+            raise TypeError("params must be a tuple")
+        self.rowcount = 0 if params in self.gone else 1
+        if self.rowcount:
+            self.open.append((sql, params))
+
+    def executemany(self, sql, params):
+        total = 0
+        for p in params:
+            self.execute(sql, p)
+            total += self.rowcount
+        self.rowcount = total
+
+    def commit(self):
+        self.committed += self.open
+        self.open = []
+
+    def rollback(self):
+        self.open = []
+
+@pytest.fixture
+def db(monkeypatch):
+    fake = FakeDb()
+    monkeypatch.setattr(unit_of_work.db_pool, "connection", fake.connection)
+    monkeypatch.setattr(unit_of_work.db_pool, "db_configured", lambda: True)
+    return fake
+
+def _unit(uow, key, events, *ops):
+    uow.begin(key)
+    for statement, params, kw in ops:
+        uow.add(statement, params, **kw)
+    uow.after_commit(lambda: events.append(("committed", key)))
+    uow.on_done(lambda ok: events.append(("done", key, ok)))
+
+def test_batch_commits_all_units_once(db):
+    events = []
+    uow = UnitOfWork(STATEMENTS)
+    _unit(uow, "a", events, ("insert", ("c1",), {"provides": "c1"}), ("outbox", ("mail-a",), {}))
+    _unit(uow, "b", events, ("update", ("c1",), {"requires": "c1"}), ("outbox", ("mail-b",), {}))
+    assert uow.flush() == 2
+    assert [p for _, p in db.committed] == [("c1",), ("c1",), ("mail-a",), ("mail-b",)]
+    assert events == [("committed", "a"), ("done", "a", True), ("committed", "b"), ("done", "b", True)]
+
+def test_fallback_fails_units_depending_on_a_failed_unit(db):
+    db.bad = {("c1",)}
+    events = []
+    uow = UnitOfWork(STATEMENTS)
+    _unit(uow, "a", events, ("insert", ("c1",), {"provides": "c1"}), ("outbox", ("mail-a",), {}))
+    _unit(uow, "b", events, ("update", ("c1-upd",), {"requires": "c1"}), ("outbox", ("mail-b",), {}))
+    _unit(uow, "c", events, ("insert", ("c2",), {"provides": "c2"}), ("outbox", ("mail-c",), {}))
+    assert uow.flush() == 1
+    # keine Antwort zu dem nie geschriebenen Fall c1
+    assert [p for _, p in db.committed] == [("c2",), ("mail-c",)]
+    assert events == [("done", "a", False), ("done", "b", False), ("committed", "c"), ("done", "c", True)]
+    assert uow.stats()["fallbacks"] == 1
+
+def test_callbacks_run_after_commit(db):
+    seen = []
+    uow = UnitOfWork(STATEMENTS)
+    uow.begin("a")
+    uow.add("insert", ("c1",))
+    uow.after_commit(lambda: seen.append(list(db.committed)))
+    uow.flush()
+    assert seen == [[("INSERT", ("c1",))]]
+
+def test_unknown_statement():
+    with pytest.raises(KeyError):
+        UnitOfWork(STATEMENTS).add("drop", ())
+
+def test_completion_of_an_already_deleted_case_is_rolled_back(db):
+    db.gone = {("c1",)}  # ein anderer Worker hat den Fall schon abgeschlossen
+    events = []
+    uow = UnitOfWork(STATEMENTS, require_rows=("delete",))
+    _unit(uow, "a", events, ("insert", ("kunde-a",), {}), ("delete", ("c1",), {}), ("outbox", ("mail-a",), {}))
+    _unit(uow, "b", events, ("insert", ("kunde-b",), {}), ("delete", ("c2",), {}), ("outbox", ("mail-b",), {}))
+    assert uow.flush() == 1
+    assert [p for _, p in db.committed] == [("kunde-b",), ("c2",), ("mail-b",)]
+    assert events == [("done", "a", False), ("committed", "b"), ("done", "b", True)]
+
+def test_unexpected_errors_fail_units_and_still_report(db, monkeypatch):
+    events = []
+    uow = UnitOfWork(STATEMENTS)
+    _unit(uow, "a", events, ("insert", ("ok",), {}))
+    uow.begin("b")
+    uow.add("insert", ("x",))
+    uow._units[-1].ops[-1] = ("insert", ["kein tuple"])  # falsche Parameter → TypeError beim execute
+    uow.on_done(lambda ok: events.append(("done", "b", ok)))
+    assert uow.flush() == 1
+    assert events == [("committed", "a"), ("done", "a", True), ("done", "b", False)]
+
+    def no_connection(op="other"):
+        raise RuntimeError("Pool erschöpft")
+    monkeypatch.setattr(unit_of_work.db_pool, "connection", no_connection)
+    _unit(uow, "c", events, ("insert", ("c",), {}))
+    assert uow.flush() == 0
+    assert events[-1] == ("done", "c", False)
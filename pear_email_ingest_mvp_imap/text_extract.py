@@ -0,0 +1,197 @@
+"""
+text_extract.py — PEARv2.2
+Body-Aufbereitung vor der Extraktion (lokal + Gemini).
+
+- html_to_text: Streaming-Konverter auf Basis von html.parser (kein Backtracking-Regex),
+  script/style/head fallen komplett weg, Block-Tags werden zu Zeilenumbrüchen,
+  Tabellenzeilen zu "| a | b |" (bleibt für local_extractor lesbar). Zitat-Blöcke (blockquote, gmail_quote,
+  moz-cite-prefix, OutlookMessageHeader) bleiben standardmäßig erhalten – weitergeleitete Kundendaten der
+  Agenturen stehen genau dort; skip_quotes=True nur für Antworten auf unsere Rückfragen.
+- maybe_b64_decode: erkennt Base64-kodierte MIME-Rohdaten (auch mit Zeilenumbrüchen).
+- strip_quotes / strip_signature: "> "-Zitate und Signatur ab "-- " entfernen (clean_body nur mit strip_quoted=True,
+  sonst fiele eine unter der Signatur weitergeleitete Mail mit weg).
+- truncate_to_tokens: Body auf GEMINI_MAX_BODY_TOKENS (≈ 4 Zeichen pro Token) kürzen.
+
+ENV:
+  GEMINI_MAX_BODY_TOKENS=4000 (0 = nicht kürzen)
+"""
+
+import base64
+import binascii
+import re
+from html.parser import HTMLParser
+from typing import List
+
+CHARS_PER_TOKEN = 4
+
+_B64_RE = re.compile(r"[A-Za-z0-9+/=\s]+")
+_WS_RE = re.compile(r"[ \t\r\f\v\u00a0]+")
+_SPACE_NL_RE = re.compile(r" *\n *")
+_MANY_NL_RE = re.compile(r"\n{3,}")
+_QUOTE_LINE_RE = re.compile(r"^\s*>")
+_SIGNATURE_RE = re.compile(r"^-- ?$")
+_MOBILE_SIG_RE = re.compile(r"^(Gesendet (von|mit) (meinem|der)|Sent from my|Von meinem iPhone gesendet)", re.IGNORECASE)
+
+_SKIP_TAGS = {"script", "style", "head", "title", "noscript", "template", "svg"}
+_BLOCK_TAGS = {"p", "div", "br", "tr", "li", "ul", "ol", "table", "h1", "h2", "h3", "h4", "h5", "h6",
+               "section", "article", "header", "footer", "hr", "pre", "address", "center"}
+_CELL_TAGS = {"td", "th"}
+_VOID_TAGS = {"br", "hr", "img", "meta", "link", "input", "wbr", "col", "area", "base", "source"}
+
+
+class _TextCollector(HTMLParser):
+    def __init__(self, skip_quotes: bool = False):
+        super().__init__(convert_charrefs=True)
+        self.skip_quotes = skip_quotes
+        self.parts: List[str] = []
+        self._skip_depth = 0      # innerhalb script/style/...
+        self._quote_depth = 0     # innerhalb blockquote / gmail_quote
+        self._stack: List[str] = []
+
+    def _is_quote(self, tag: str, attrs) -> bool:
+        if not self.skip_quotes:
+            return False
+        if tag == "blockquote":
+            return True
+        cls = dict(attrs).get("class") or ""
+        return tag == "div" and ("gmail_quote" in cls or "moz-cite-prefix" in cls or "OutlookMessageHeader" in cls)
+
+    def handle_starttag(self, tag, attrs):
+        if self._skip_depth or self._quote_depth:
+            if tag not in _VOID_TAGS:
+                self._stack.append(tag)
+                if tag in _SKIP_TAGS:
+                    self._skip_depth += 1
+            return
+        if tag in _SKIP_TAGS:
+            self._skip_depth += 1
+            self._stack.append(tag)
+            return
+        if self._is_quote(tag, attrs):
+            self._quote_depth += 1
+            self._stack.append("#quote")
+            return
+        if tag == "tr":
+            self.parts.append("\n|")
+        elif tag in _CELL_TAGS:
+            self.parts.append(" ")
+        elif tag in _BLOCK_TAGS:
+            self.parts.append("\n")
+        if tag not in _VOID_TAGS:
+            self._stack.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        if not (self._skip_depth or self._quote_depth) and tag in _BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in _VOID_TAGS:
+            return
+        # bis zum passenden Start-Tag zurück (verzeiht nicht geschlossene Tags)
+        if tag not in self._stack and not (tag in ("blockquote", "div") and "#quote" in self._stack):
+            return
+        while self._stack:
+            top = self._stack.pop()
+            if top == "#quote":
+                self._quote_depth -= 1
+            elif top in _SKIP_TAGS:
+                self._skip_depth -= 1
+            if top == tag or (top == "#quote" and tag in ("blockquote", "div")):
+                break
+        if self._skip_depth or self._quote_depth:
+            return
+        if tag in _CELL_TAGS:
+            self.parts.append(" |")
+        elif tag in _BLOCK_TAGS and tag != "tr":
+            self.parts.append("\n\n" if tag == "p" else "\n")
+
+    def handle_data(self, data):
+        if not (self._skip_depth or self._quote_depth):
+            self.parts.append(data)
+
+
+def _collapse(text: str) -> str:
+    text = _WS_RE.sub(" ", text)
+    text = _SPACE_NL_RE.sub("\n", text)
+    return _MANY_NL_RE.sub("\n\n", text).strip()
+
+
+def html_to_text(html: str, skip_quotes: bool = False, chunk_size: int = 65536) -> str:
+    """HTML → Text in einem Durchlauf (Eingabe wird blockweise an den Parser gestreamt)."""
+    if not html:
+        return ""
+    parser = _TextCollector(skip_quotes=skip_quotes)
+    for start in range(0, len(html), chunk_size):
+        parser.feed(html[start:start + chunk_size])
+    parser.close()
+    return _collapse("".join(parser.parts))
+
+
+def looks_like_html(text: str) -> bool:
+    head = (text or "")[:2000].lower()
+    return "<html" in head or "<body" in head or "<div" in head or "<p>" in head or "<br" in head or "<table" in head
+
+
+def maybe_b64_decode(s: str) -> bytes:
+    """Dekodiert Base64 (Zeilenumbrüche erlaubt); sonst die UTF-8-Bytes des Strings."""
+    if not s:
+        return b""
+    stripped = s.strip()
+    if _B64_RE.fullmatch(stripped):
+        compact = "".join(stripped.split())
+        if compact and len(compact) % 4 == 0:
+            try:
+                return base64.b64decode(compact, validate=True)
+            except (binascii.Error, ValueError):
+                pass
+    return s.encode("utf-8", errors="ignore")
+
+
+def strip_quotes(text: str) -> str:
+    """Entfernt "> "-zitierte Zeilen – außer die Mail besteht (fast) nur aus Zitat."""
+    lines = text.split("\n")
+    kept = [l for l in lines if not _QUOTE_LINE_RE.match(l)]
+    if len(kept) == len(lines) or not "".join(kept).strip():
+        return text
+    return "\n".join(kept)
+
+
+def strip_signature(text: str) -> str:
+    """Schneidet ab dem Signatur-Trenner "-- " bzw. "Gesendet von meinem ..." ab."""
+    lines = text.split("\n")
+    for i, line in enumerate(lines):
+        if i and (_SIGNATURE_RE.match(line.rstrip("\r")) or _MOBILE_SIG_RE.match(line.strip())):
+            head = "\n".join(lines[:i]).rstrip()
+            return head if head else text
+    return text
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Kürzt auf ≈ max_tokens (Schnitt an einer Zeilengrenze, wenn möglich)."""
+    if max_tokens <= 0:
+        return text
+    limit = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    cut = text.rfind("\n", 0, limit)
+    return text[:cut if cut > limit // 2 else limit].rstrip()
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text or "") + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def body_to_text(body: str, skip_quotes: bool = False) -> str:
+    """HTML-Bodies in Text umwandeln, Text-Bodies nur Whitespace-normalisieren."""
+    return html_to_text(body, skip_quotes=skip_quotes) if looks_like_html(body) else _collapse(body or "")
+
+
+def clean_body(body: str, max_tokens: int = 0, strip_quoted: bool = False) -> str:
+    """Komplette Aufbereitung für die Extraktion: HTML → Text, Token-Budget.
+
+    strip_quoted=True (nur Antworten auf eine Rückfrage): zusätzlich Zitate und Signatur entfernen.
+    """
+    text = body_to_text(body, skip_quotes=strip_quoted)
+    if strip_quoted:
+        text = strip_signature(strip_quotes(text))
+    return truncate_to_tokens(text, max_tokens)
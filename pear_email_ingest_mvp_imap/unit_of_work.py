@@ -0,0 +1,191 @@
+"""
+unit_of_work.py — PEARv2.2
+Sammelt die Schreibvorgänge eines Batches und schreibt sie in einer Transaktion.
+
+- Statements werden beim Anlegen benannt; ihre Reihenfolge ist die Flush-Reihenfolge
+  (z.B. Fall anlegen → ergänzen → Kunde anlegen → Fall löschen → Outbox).
+- Pro E-Mail eine Einheit (begin): alle Zeilen einer Einheit landen in derselben Transaktion,
+  ein Fall-Abschluss (Kunde anlegen + Pending löschen) ist damit atomar.
+- flush(): ein executemany pro Statement über alle Einheiten, ein COMMIT für den ganzen Batch.
+  Schlägt die Sammel-Transaktion fehl, wird zurückgerollt und jede Einheit einzeln in einer eigenen
+  Transaktion geschrieben – eine fehlerhafte Zeile kostet nicht den ganzen Batch.
+- Abhängigkeiten: add(..., provides=x) / add(..., requires=x) – z.B. legt eine E-Mail einen Fall an und eine
+  spätere im selben Batch ergänzt ihn. Scheitert im Einzel-Rückfall die anlegende Einheit, gilt jede davon
+  abhängige Einheit ebenfalls als gescheitert (sonst ginge eine Antwort zu einem nie geschriebenen Fall raus).
+- Pflicht-Treffer: für Statements in require_rows (z.B. Fall löschen beim Abschluss) muss jede Zeile eine
+  DB-Zeile treffen. Trifft sie keine – der Fall wurde schon von einem anderen Worker abgeschlossen –, wird
+  die Einheit zurückgerollt und gilt als gescheitert (kein zweiter Kunde, keine zweite Antwort).
+- Jeder Fehler beim Schreiben (auch kein DB-Fehler, z.B. falsche Parameter oder Pool-Timeout) lässt die
+  betroffenen Einheiten scheitern; on_done(ok) läuft für jede Einheit.
+- Erst nach dem COMMIT: after_commit-Callbacks der committeten Einheiten, dann on_done(ok) jeder Einheit.
+- Metriken: committete Zeilen je Statement, Einheiten je Ergebnis, Rückfälle auf Einzel-Transaktionen;
+  die Flush-Dauer läuft unter pear_db_seconds{op="case_flush"} (db_pool.py).
+
+ENV:
+  DB_HOST, DB_PORT=3306, DB_USER, DB_PASSWORD, DB_NAME
+"""
+
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from mysql.connector import Error
+
+import db_pool
+import metrics
+
+ROWS_WRITTEN = metrics.counter("pear_db_rows_written_total", "Committete Zeilen je Statement", ("statement",))
+UNITS_WRITTEN = metrics.counter("pear_db_units_total", "Geschriebene Einheiten (E-Mails) je Ergebnis", ("result",))
+BATCH_FALLBACKS = metrics.counter("pear_db_batch_fallbacks_total", "Sammel-Transaktionen mit Rückfall auf Einzel-Transaktionen")
+
+
+class RowNotFound(Error):
+    """Ein Statement aus require_rows hat keine Zeile getroffen (z.B. Fall bereits abgeschlossen)."""
+
+
+@dataclass(eq=False)  # Einheiten werden über ihre Identität verglichen
+class WorkUnit:
+    key: Any = None
+    ops: List[Tuple[str, tuple]] = field(default_factory=list)  # (Statement-Name, Parameter)
+    on_done: Optional[Callable[[bool], None]] = None
+    depends: List["WorkUnit"] = field(default_factory=list)     # Einheiten desselben Batches, deren Zeilen sie braucht
+    after_commit: List[Callable[[], None]] = field(default_factory=list)
+
+
+class UnitOfWork:
+    def __init__(self, statements: Dict[str, str], require_rows: Iterable[str] = ()):
+        self.statements = dict(statements)  # Name → SQL, Reihenfolge = Flush-Reihenfolge
+        self.require_rows = set(require_rows)  # Statements, die je Zeile eine DB-Zeile treffen müssen
+        self._units: List[WorkUnit] = []
+        self._providers: Dict[Any, WorkUnit] = {}  # provides-Schlüssel → Einheit, die die Zeile anlegt
+        self._stats = {"flushes": 0, "units": 0, "rows": 0, "fallbacks": 0, "failed_units": 0}
+
+    def __len__(self) -> int:
+        return len(self._units)
+
+    def begin(self, key: Any = None) -> WorkUnit:
+        """Neue Einheit (z.B. eine E-Mail); folgende add()-Aufrufe gehören zu ihr."""
+        unit = WorkUnit(key)
+        self._units.append(unit)
+        return unit
+
+    def add(self, statement: str, params: tuple, provides: Any = None, requires: Any = None):
+        """Zeile der aktuellen Einheit; provides/requires verknüpfen Einheiten, die dieselbe Zeile betreffen."""
+        if statement not in self.statements:
+            raise KeyError(f"Unbekanntes Statement: {statement}")
+        if not self._units:
+            self.begin()
+        unit = self._units[-1]
+        unit.ops.append((statement, tuple(params)))
+        provider = self._providers.get(requires) if requires is not None else None
+        if provider is not None and provider is not unit and provider not in unit.depends:
+            unit.depends.append(provider)
+        if provides is not None:
+            self._providers[provides] = unit
+
+    def on_done(self, callback: Callable[[bool], None]):
+        """Callback(ok) der aktuellen Einheit nach dem Flush."""
+        if not self._units:
+            self.begin()
+        self._units[-1].on_done = callback
+
+    def after_commit(self, callback: Callable[[], None]):
+        """Callback() der aktuellen Einheit, nur wenn ihre Zeilen committed wurden."""
+        if not self._units:
+            self.begin()
+        self._units[-1].after_commit.append(callback)
+
+    def _execute(self, cur, units: List[WorkUnit]) -> Dict[str, int]:
+        """Zeilen je Statement (noch nicht committed)."""
+        rows = {}
+        for name, sql in self.statements.items():
+            params = [p for unit in units for op, p in unit.ops if op == name]
+            if len(params) == 1:
+                cur.execute(sql, params[0])
+            elif params:
+                cur.executemany(sql, params)
+            if params:
+                if name in self.require_rows and cur.rowcount < len(params):
+                    raise RowNotFound(msg=f"{name}: {len(params) - max(cur.rowcount, 0)} von {len(params)} Zeilen nicht gefunden")
+                rows[name] = len(params)
+        return rows
+
+    def _committed(self, units: int, rows: Dict[str, int]):
+        self._stats["units"] += units
+        self._stats["rows"] += sum(rows.values())
+        UNITS_WRITTEN.inc(units, result="committed")
+        for name, count in rows.items():
+            ROWS_WRITTEN.inc(count, statement=name)
+
+    def flush(self) -> int:
+        """Alle gesammelten Einheiten schreiben; liefert die Anzahl committeter Einheiten."""
+        units, self._units = self._units, []
+        self._providers = {}
+        if not units:
+            return 0
+        done = [not unit.ops for unit in units]  # Einheiten ohne Zeilen sind trivial erfolgreich
+        if not all(done):
+            if not db_pool.db_configured():
+                print("INFO: DB nicht konfiguriert – gesammelte Schreibvorgänge verworfen.")
+            else:
+                self._write(units, done)
+        for unit, ok in zip(units, done):
+            for callback in unit.after_commit if ok else ():
+                try:
+                    callback()
+                except Exception as e:
+                    print(f"ERROR: after_commit für {unit.key} fehlgeschlagen: {e}")
+            if unit.on_done:
+                try:
+                    unit.on_done(ok)
+                except Exception as e:
+                    print(f"ERROR: on_done für {unit.key} fehlgeschlagen: {e}")
+        return sum(done)
+
+    def _write(self, units: List[WorkUnit], done: List[bool]):
+        self._stats["flushes"] += 1
+        try:
+            with db_pool.connection("case_flush") as conn:
+                cur = conn.cursor()
+                try:
+                    rows = self._execute(cur, units)
+                    conn.commit()
+                    done[:] = [True] * len(units)
+                    self._committed(len(units), rows)
+                    print(f"INFO: DB: {len(units)} Einheiten mit {sum(rows.values())} Zeilen in einer Transaktion geschrieben.")
+                except Exception as e:
+                    conn.rollback()
+                    self._stats["fallbacks"] += 1
+                    BATCH_FALLBACKS.inc()
+                    print(f"ERROR: Sammel-Transaktion fehlgeschlagen ({e}) – schreibe Einheiten einzeln.")
+                    self._write_each(conn, cur, units, done)
+                finally:
+                    cur.close()
+        except Exception as e:
+            # Verbindung/Rollback selbst gescheitert: alles nicht Committete gilt als fehlgeschlagen
+            print(f"ERROR: DB-Fehler beim Schreiben des Batches: {e}")
+        UNITS_WRITTEN.inc(done.count(False), result="failed")
+
+    def _write_each(self, conn, cur, units: List[WorkUnit], done: List[bool]):
+        position = {id(unit): i for i, unit in enumerate(units)}
+        for i, unit in enumerate(units):
+            if done[i]:
+                continue
+            missing = [dep for dep in unit.depends if not done[position[id(dep)]]]
+            if missing:
+                # Die Zeile, auf die sich die Einheit bezieht, wurde nie geschrieben
+                self._stats["failed_units"] += 1
+                print(f"ERROR: {unit.key} nicht geschrieben – hängt von {missing[0].key} ab, die fehlgeschlagen ist.")
+                continue
+            try:
+                rows = self._execute(cur, [unit])
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                self._stats["failed_units"] += 1
+                print(f"ERROR: DB-Fehler für {unit.key}: {e}")
+                continue
+            done[i] = True
+            self._committed(1, rows)
+
+    def stats(self) -> Dict[str, int]:
+        return dict(self._stats)